@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Benchmark of the crawler against an offline stand-in of RateBeer. It runs    ##
+##      all the steps of run_rb.py and gives the pages per second of each crawl step. ##
+##                                                                                    ##
+########################################################################################
+
+from classes.crawler import *
+from classes.parser import *
+from classes.standin import SyntheticCorpus, DirectoryCorpus, StandinServer
+from classes.ratings import read_chunks
+import argparse
+import tempfile
+import shutil
+
+
+def run():
+
+    argparser = argparse.ArgumentParser(description='Benchmark the crawler with an offline stand-in of RateBeer')
+    argparser.add_argument('--corpus', default=None, help='Folder with recorded pages (default: synthetic pages)')
+    argparser.add_argument('--countries', type=int, default=3, help='Number of countries')
+    argparser.add_argument('--breweries', type=int, default=5, help='Number of breweries per place')
+    argparser.add_argument('--beers', type=int, default=10, help='Number of beers per brewery')
+    argparser.add_argument('--max-ratings', type=int, default=200, help='Maximum number of ratings per beer')
+    argparser.add_argument('--users', type=int, default=500, help='Number of users')
+    argparser.add_argument('--text-length', type=int, default=0, help='Minimum number of characters of the reviews')
+    argparser.add_argument('--latency', type=float, default=0.05, help='Average latency of the server in seconds')
+    argparser.add_argument('--errors', type=float, default=0.0, help='Fraction of 500/502 errors')
+    argparser.add_argument('--max-rate', type=float, default=None, help='Requests per second above which the server '
+                                                                        'answers 429 (default: no limit)')
+    argparser.add_argument('--empty', type=float, default=0.0, help='Fraction of empty pages')
+    argparser.add_argument('--concurrency', type=int, default=8, help='Number of requests in flight')
+    argparser.add_argument('--rate', type=float, default=100.0, help='Starting requests per second of the crawler')
+    argparser.add_argument('--policy', default=Scheduler.FILE, choices=Scheduler.policies,
+                           help='Order of the beers in step 5')
+    argparser.add_argument('--packed', action='store_true', help='Save the pages in a PageStore')
+    argparser.add_argument('--capture', action='store_true', help='Only save the regions used by the Parser')
+    argparser.add_argument('--refresh', type=float, default=None,
+                           help='At the end, add this fraction of new ratings to the synthetic beers and run an '
+                                'incremental crawl of step 5')
+    argparser.add_argument('--data', default=None, help='Data folder (default: temporary folder, deleted at the end)')
+    args = argparser.parse_args()
+
+    if args.corpus is None:
+        corpus = SyntheticCorpus(args.countries, args.breweries, args.beers, args.max_ratings, args.users,
+                                 text_length=args.text_length)
+    else:
+        corpus = DirectoryCorpus(args.corpus)
+
+    server = StandinServer(corpus, latency=args.latency, error_rate=args.errors, max_rate=args.max_rate,
+                           empty_rate=args.empty)
+    base_url = server.start()
+
+    if args.data is None:
+        data_folder = tempfile.mkdtemp(prefix='ratebeer_bench_') + '/'
+    else:
+        data_folder = args.data
+
+    try:
+        crawler = Crawler(1.0/args.rate, data_folder, concurrency=args.concurrency, rate=args.rate,
+                          base_url=base_url, packed=args.packed, capture=args.capture)
+        parser = Parser(data_folder, base_url=base_url, packed=args.packed)
+
+        crawler.crawl_all_places()
+        parser.parse_breweries_from_places()
+        crawler.crawl_all_breweries()
+        parser.parse_brewery_files()
+        crawler.crawl_all_beers_and_reviews(policy=args.policy)
+        parser.parse_beer_files_for_information()
+        parser.parse_beer_files_for_reviews()
+        parser.get_users_from_ratings()
+        crawler.crawl_all_users()
+        parser.parse_all_users()
+
+        if args.refresh is not None and args.corpus is None:
+            requests_before = server.requests
+            corpus.growth = args.refresh
+
+            crawler.crawl_all_beers_and_reviews(policy=args.policy, incremental=True)
+            parser.parse_beer_files_for_information()
+            expected = pd.read_csv(data_folder + 'parsed/beers.csv')['nbr_ratings'].sum()
+            parser.parse_beer_files_for_reviews()
+            found = sum(len(chunk['user_id']) for chunk in read_chunks(data_folder + 'parsed/ratings.txt.gz',
+                                                                        ['user_id']))
+
+            print('')
+            print('Incremental crawl: {:d} requests, {:d} ratings found ({:d} on the website)'.format(
+                server.requests - requests_before, found, int(expected)))
+
+        print('')
+        print('{:<25} {:>8} {:>10} {:>10} {:>10} {:>8}'.format('Step', 'Pages', 'Pages/s', 'p50 (s)', 'p99 (s)',
+                                                                'Errors'))
+        for metrics in [crawler.metrics, parser.metrics]:
+            for name, step in metrics.steps.items():
+                snap = step.snapshot()
+                print('{:<25} {:>8d} {:>10.2f} {:>10.3f} {:>10.3f} {:>8d}'.format(name, snap['pages'],
+                                                                                  snap['pages_sec'],
+                                                                                  snap['p50'] or 0.0,
+                                                                                  snap['p99'] or 0.0,
+                                                                                  snap['errors']))
+
+        stats = crawler.transport.stats()
+        print('')
+        print('Requests served: {:d} (throttled: {:d})'.format(server.requests, server.throttled))
+        print('Connections opened: {:d}, reused: {:d}'.format(stats['connections_opened'],
+                                                             stats['connections_reused']))
+        print('Bytes on the wire: {:d} (uncompressed: {:d})'.format(stats['bytes_wire'], stats['bytes_content']))
+        print('Dead letters: {:d}'.format(len(crawler.dead_letters())))
+        if crawler.capture is not None:
+            stats = crawler.capture.stats()
+            print('Captured pages: {:d}, bytes: {:d} -> {:d}, kept entirely: {:d}'.format(
+                stats['pages'], stats['bytes_in'], stats['bytes_out'], stats['fallbacks']))
+    finally:
+        server.stop()
+        if args.data is None:
+            shutil.rmtree(data_folder)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Benchmark of the steps 6 and 7 of the parser on a data folder already        ##
+##      crawled. Each step is run with the different ways of reading the pages, then  ##
+##      both steps in one pass, and the results are compared.                         ##
+##                                                                                    ##
+########################################################################################
+
+from classes.parser import *
+from classes.extract import tokenize_reviews_bytes
+import argparse
+import shutil
+
+# Ways of reading the pages: name, raw, tokenizer
+MODES = [('decoded', False, False), ('raw', True, False), ('tokenizer', True, True)]
+
+
+def extraction(data_folder, nbr_pages):
+    """
+    Compare the pattern of the reviews with the tokenizer on the same pages
+
+    :param data_folder: Folder with the data
+    :param nbr_pages: Maximum number of pages
+    """
+
+    store = open_store(data_folder)
+
+    contents = []
+    for root, dirs, files in os.walk(data_folder + 'beers/'):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.html') and len(contents) < nbr_pages:
+                contents.append(store.read(os.path.join(root, name)))
+
+    results = {}
+    for name, function in [('pattern', reviews_bytes), ('tokenizer', tokenize_reviews_bytes)]:
+        # Best of 3 runs
+        elapsed = []
+        for _ in range(3):
+            start = time.time()
+            found = [function(content) for content in contents]
+            elapsed.append(time.time() - start)
+        results[name] = (min(elapsed), found)
+
+    same = 0
+    failures = {}
+    for pattern, tokens in zip(results['pattern'][1], results['tokenizer'][1]):
+        complete = [tuple(fields) for fields in tokens if None not in fields]
+        same += complete == pattern
+
+        for fields in tokens:
+            for k, value in enumerate(fields):
+                if value is None:
+                    failures[REVIEW_FIELDS[k]] = failures.get(REVIEW_FIELDS[k], 0) + 1
+
+    print('')
+    print('{:<25} {:>10} {:>12} {:>10}'.format('Extraction', 'Reviews', 'ms/page', 'Speedup'))
+    for name in ['pattern', 'tokenizer']:
+        elapsed, found = results[name]
+        print('{:<25} {:>10d} {:>12.3f} {:>9.2f}x'.format(name, sum(len(f) for f in found),
+                                                        1000*elapsed/max(len(contents), 1),
+                                                        results['pattern'][0]/elapsed))
+
+    print('')
+    print('Pages with the same complete reviews: {:d} out of {:d}'.format(same, len(contents)))
+    print('Fields not found by the tokenizer: {}'.format(', '.join('{} ({:d})'.format(f, failures[f])
+                                                                   for f in REVIEW_FIELDS if f in failures) or 'none'))
+
+
+def run():
+
+    argparser = argparse.ArgumentParser(description='Benchmark the steps 6 and 7 of the parser')
+    argparser.add_argument('data', help='Data folder with parsed/beers.csv and the pages of the beers')
+    argparser.add_argument('--processes', type=int, default=1, help='Number of processes for step 7')
+    argparser.add_argument('--pages', type=int, default=3000, help='Number of pages to compare the pattern of the '
+                                                                  'reviews with the tokenizer')
+    args = argparser.parse_args()
+
+    data_folder = args.data
+    if not data_folder.endswith('/'):
+        data_folder += '/'
+
+    beers = data_folder + 'parsed/beers.csv'
+    ratings = data_folder + 'parsed/ratings.txt.gz'
+
+    # The steps 6 and 7 change beers.csv, each run starts from the same file
+    shutil.copyfile(beers, beers + '.bench')
+
+    results = {}
+    try:
+        for name, raw, tokenizer in MODES:
+            # Columns added by step 6
+            df = pd.read_csv(beers + '.bench')
+            df = df.drop(['nbr_ratings', 'overall_score', 'style_score', 'avg', 'abv'], axis=1, errors='ignore')
+            df.to_csv(beers, index=False)
+
+            parser = Parser(data_folder)
+
+            start = time.time()
+            parser.parse_beer_files_for_information(use_crawl_info=False, raw=raw)
+            step6 = time.time() - start
+
+            start = time.time()
+            parser.parse_beer_files_for_reviews(processes=args.processes, raw=raw, tokenizer=tokenizer)
+            step7 = time.time() - start
+
+            with gzip.open(ratings, 'rb') as f:
+                content = f.read()
+
+            results[name] = {'step6': step6, 'step7': step7, 'beers': open(beers, 'rb').read(), 'ratings': content}
+
+        # Steps 6 and 7 in one pass
+        df = pd.read_csv(beers + '.bench')
+        df = df.drop(['nbr_ratings', 'overall_score', 'style_score', 'avg', 'abv'], axis=1, errors='ignore')
+        df.to_csv(beers, index=False)
+
+        start = time.time()
+        Parser(data_folder).parse_beer_files(use_crawl_info=False, processes=args.processes)
+        fused = time.time() - start
+
+        with gzip.open(ratings, 'rb') as f:
+            content = f.read()
+
+        results['fused'] = {'beers': open(beers, 'rb').read(), 'ratings': content}
+    finally:
+        shutil.move(beers + '.bench', beers)
+
+    print('')
+    print('{:<25}'.format('Step') + ''.join('{:>15}'.format(name + ' (s)') for name, _, _ in MODES))
+    for step, key in [('6. beers information', 'step6'), ('7. reviews', 'step7')]:
+        print('{:<25}'.format(step) + ''.join('{:>15.2f}'.format(results[name][key]) for name, _, _ in MODES))
+
+    print('')
+    for name, _, _ in MODES[1:]:
+        print('Same beers.csv and ratings.txt.gz (decompressed) with {}: {}'.format(
+            name, results[name]['beers'] == results['decoded']['beers'] and
+            results[name]['ratings'] == results['decoded']['ratings']))
+
+    print('')
+    print('Steps 6 and 7 in one pass: {:.2f} s ({:.2f} s separately), same files: {}'.format(
+        fused, results['tokenizer']['step6'] + results['tokenizer']['step7'],
+        results['fused']['beers'] == results['decoded']['beers'] and
+        results['fused']['ratings'] == results['decoded']['ratings']))
+
+    extraction(data_folder, args.pages)
+
+
+if __name__ == "__main__":
+    run()
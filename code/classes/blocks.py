@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       ratings.txt.gz written as independent blocks (GZIP members) with an index    ##
+##      of the blocks at the end of the file, such that the blocks are decompressed   ##
+##      and parsed by several processes. It is still a normal GZIP file.              ##
+##                                                                                    ##
+########################################################################################
+
+from classes.ratings import read_chunks, parse_columns, FIELDS, TYPES
+import multiprocessing
+import struct
+import zlib
+import os
+
+# The index is written in the extra field of empty GZIP members (at most 65535 bytes each)
+INDEX_ID = b'RI'
+TRAILER_ID = b'RT'
+# Size and number of ratings of a block
+ENTRY = struct.Struct('<II')
+# Position of the index and number of blocks
+TRAILER = struct.Struct('<QQ')
+
+# Blocks in the extra field of one member
+ENTRIES = (2**16 - 1 - 4)//ENTRY.size
+
+# Header of a GZIP member with an extra field (no time, unknown OS) and an empty deflate stream with its CRC and size
+HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff'
+EMPTY = b'\x03\x00' + b'\x00'*8
+
+TRAILER_SIZE = len(HEADER) + 2 + 4 + TRAILER.size + len(EMPTY)
+
+
+def _member(id_, data):
+    """
+    Empty GZIP member with data in its extra field.
+
+    :param id_: ID of the subfield (2 bytes)
+    :param data: content of the subfield
+    :return: bytes
+    """
+
+    return HEADER + struct.pack('<H', len(data) + 4) + id_ + struct.pack('<H', len(data)) + data + EMPTY
+
+
+def footer(blocks):
+    """
+    Index of the blocks of a file, written at its end.
+
+    It is made of empty GZIP members (ignored by gzip and zcat) whose extra field holds the compressed size and the
+    number of ratings of the blocks, and of a last member of fixed size with the position of the first of them.
+
+    :param blocks: list of [size, number of ratings] of the blocks, in the order of the file
+    :return: bytes
+    """
+
+    position = sum(size for size, _ in blocks)
+
+    members = []
+    for k in range(0, len(blocks), ENTRIES):
+        members.append(_member(INDEX_ID, b''.join(ENTRY.pack(size, nbr) for size, nbr in blocks[k:k + ENTRIES])))
+
+    members.append(_member(TRAILER_ID, TRAILER.pack(position, len(blocks))))
+
+    return b''.join(members)
+
+
+def read_footer(filename):
+    """
+    Read the index of the blocks of a file.
+
+    :param filename: name of the GZIP file
+    :return: list of (position, size, number of ratings) of the blocks, or None if the file has no index
+    """
+
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end < TRAILER_SIZE:
+            return None
+
+        f.seek(end - TRAILER_SIZE)
+        trailer = f.read(TRAILER_SIZE)
+
+        data = _extra(trailer, TRAILER_ID)
+        if data is None or len(data) != TRAILER.size:
+            return None
+
+        position, nbr = TRAILER.unpack(data)
+        if position > end - TRAILER_SIZE:
+            return None
+
+        f.seek(position)
+        content = f.read(end - TRAILER_SIZE - position)
+
+    entries = []
+    while len(content) > 0:
+        data = _extra(content, INDEX_ID)
+        if data is None:
+            return None
+
+        entries += ENTRY.iter_unpack(data)
+        content = content[len(HEADER) + 2 + 4 + len(data) + len(EMPTY):]
+
+    if len(entries) != nbr or sum(size for size, _ in entries) != position:
+        return None
+
+    blocks = []
+    position = 0
+    for size, count in entries:
+        blocks.append((position, size, count))
+        position += size
+
+    return blocks
+
+
+def _extra(member, id_):
+    """
+    Get the content of the extra field of a member written by _member.
+
+    :param member: bytes starting with the member
+    :param id_: ID of the subfield
+    :return: bytes, or None if it is not such a member
+    """
+
+    if member[:len(HEADER)] != HEADER or len(member) < len(HEADER) + 6:
+        return None
+
+    xlen, = struct.unpack('<H', member[len(HEADER):len(HEADER) + 2])
+    start = len(HEADER) + 2
+    if member[start:start + 2] != id_:
+        return None
+
+    length, = struct.unpack('<H', member[start + 2:start + 4])
+    if length + 4 != xlen or member[start + 4 + length:start + 4 + length + len(EMPTY)] != EMPTY:
+        return None
+
+    return member[start + 4:start + 4 + length]
+
+
+def read_blocks(filename, fields=None, processes=None, size=2**22):
+    """
+    Read ratings.txt.gz by chunks of ratings, decompressed and parsed by several processes. The chunks are the same
+    as with read_chunks (given in the order of the file). A file without the index of its blocks is read with
+    read_chunks.
+
+    :param filename: name of the file
+    :param fields: list of the fields to read (default: all of them)
+    :param processes: Number of processes (None for the number of cores)
+    :param size: number of compressed bytes read at once by a process (consecutive blocks are read together)
+    :return: generator of dict with a list of values for each field
+    """
+
+    if fields is None:
+        fields = FIELDS
+
+    for field in fields:
+        if field not in TYPES:
+            raise ValueError('Unknown field {} in ratings.txt.gz'.format(field))
+
+    blocks = read_footer(filename)
+    if blocks is None:
+        yield from read_chunks(filename, fields)
+        return
+
+    # Consecutive blocks read by the same process
+    tasks = []
+    task_size = 0
+    for position, length, _ in blocks:
+        if len(tasks) > 0 and task_size < size:
+            tasks[-1][2].append(length)
+            task_size += length
+        else:
+            tasks.append([filename, position, [length], fields])
+            task_size = length
+
+    if processes is None:
+        processes = os.cpu_count()
+
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap(_read_block, tasks)
+    else:
+        yield from map(_read_block, tasks)
+
+
+def _read_block(task):
+    """
+    Decompress and parse blocks of a file.
+
+    :param task: name of the file, position of the first block, sizes of the blocks, fields to read
+    :return: dict with a list of values for each field
+    """
+
+    filename, position, sizes, fields = task
+
+    with open(filename, 'rb') as f:
+        f.seek(position)
+        data = memoryview(f.read(sum(sizes)))
+
+    # Each block is decompressed on its own (gzip.decompress copies the rest of the data after each member)
+    records = []
+    start = 0
+    for size in sizes:
+        records.append(zlib.decompress(data[start:start + size], zlib.MAX_WBITS | 16))
+        start += size
+
+    return parse_columns(b''.join(records), fields)
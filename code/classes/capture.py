@@ -0,0 +1,196 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Keep only the regions of the pages used by the Parser. The scripts and       ##
+##      the navigation of the website are dropped before the page is saved.          ##
+##                                                                                    ##
+########################################################################################
+
+from classes.extract import decode, beer_info, reviews, user_info
+import hashlib
+import re
+
+# Beginning of a review
+REVIEW_START = re.compile('<div style="display:inline; padding: 0px 0px; font-size: 24px;')
+
+# End of a review: its text is followed by </div><br> (the characters \r, \n and \t are removed by the Parser)
+REVIEW_END = re.compile('line-height: 1.5;">.*?</div>[\r\n\t]*<br>', re.DOTALL)
+
+# Information on the first page of a beer
+INFO = [re.compile('RATINGS: </abbr>.*?</span>', re.DOTALL),
+        re.compile('<abbr title="Alcohol By Volume">ABV</abbr>.*?</big>', re.DOTALL),
+        re.compile('WEIGHTED AVG: .*?</span>', re.DOTALL),
+        re.compile('overall</div><div class="ratingValue" itemprop="ratingValue">\d+</div>'),
+        re.compile('<div style="font-size: 25px; font-weight: bold; color: #fff; padding: 20px 0px; ">\d+<br>'
+                   '<div class="style-text">style</div>')]
+
+# Information on the page of a user, up to the next tag
+USER = [re.compile('Member since [^<]*<'),
+        re.compile('<span class="glyphicon glyphicon-map-marker" aria-hidden="true"></span> [^<]*<')]
+
+# Marker at the beginning of a captured page
+MARKER = '<!-- capture size={:d} dropped={:d} sha1={} -->\n'
+MARKER_RE = re.compile(b'^<!-- capture size=(\d+) dropped=(\d+) sha1=([0-9a-f]+) -->\n')
+
+
+class Capture:
+    """
+    Keep only the regions of the pages used by the Parser: the information block and the reviews on the pages of
+    the beers and the joining date and location on the pages of the users. A marker at the beginning of the page
+    gives the size of the full page, the number of bytes dropped and their SHA-1.
+
+    The Parser gives the same results on the captured page as on the full page. This is checked for each page and
+    the full page is kept if it is not the case (e.g. if the website changed).
+    """
+
+    # Type of content of each kind of pages in the frontier
+    kinds = {'beer': 'beer', 'beer_refresh': 'beer', 'review': 'review', 'review_refresh': 'review', 'user': 'user'}
+
+    def __init__(self):
+        """
+        Initialize the counters.
+        """
+
+        self.pages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Pages kept entirely because the Parser would not give the same results
+        self.fallbacks = 0
+
+    def __call__(self, kind, content):
+        """
+        Capture a page.
+
+        :param kind: kind of page in the frontier
+        :param content: bytes of the page
+        :return: bytes to save
+        """
+
+        if kind not in self.kinds or len(content) == 0:
+            return content
+
+        kind = self.kinds[kind]
+
+        # ISO-8859-1 maps each byte to one character, therefore the positions are the same in the text
+        txt = content.decode('ISO-8859-1')
+
+        kept = []
+        dropped = []
+        last = 0
+        for start, end in self.regions(kind, txt):
+            dropped.append(txt[last:start])
+            kept.append(txt[start:end])
+            last = end
+        dropped.append(txt[last:])
+
+        dropped = ''.join(dropped).encode('ISO-8859-1')
+        body = '\n'.join(kept)
+        marker = MARKER.format(len(content), len(dropped), hashlib.sha1(dropped).hexdigest())
+        captured = (marker + body).encode('ISO-8859-1')
+
+        self.pages += 1
+        self.bytes_in += len(content)
+
+        if not self.same(kind, content, captured):
+            self.fallbacks += 1
+            self.bytes_out += len(content)
+            return content
+
+        self.bytes_out += len(captured)
+        return captured
+
+    @staticmethod
+    def regions(kind, txt):
+        """
+        Find the regions of a page used by the Parser.
+
+        :param kind: 'beer', 'review' or 'user'
+        :param txt: page decoded with ISO-8859-1
+        :return: sorted list of tuples (start, end) which do not overlap
+        """
+
+        spans = []
+
+        if kind == 'beer':
+            for regex in INFO:
+                spans += [m.span() for m in regex.finditer(txt)]
+
+        if kind in ['beer', 'review']:
+            for m in REVIEW_START.finditer(txt):
+                end = REVIEW_END.search(txt, m.end())
+                if end is not None:
+                    spans.append((m.start(), end.end()))
+
+        if kind == 'user':
+            for regex in USER:
+                spans += [m.span() for m in regex.finditer(txt)]
+
+        # Merge the regions which overlap
+        regions = []
+        for start, end in sorted(spans):
+            if len(regions) > 0 and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+            else:
+                regions.append((start, end))
+
+        return regions
+
+    @staticmethod
+    def same(kind, full, captured):
+        """
+        Check that the Parser gives the same results on the full page and on the captured one.
+
+        :param kind: 'beer', 'review' or 'user'
+        :param full: bytes of the full page
+        :param captured: bytes of the captured page
+        :return: True if the results are the same
+        """
+
+        full = decode(full)
+        captured = decode(captured)
+
+        if kind == 'beer':
+            # NaN is not equal to itself, the values are compared as text
+            if repr(beer_info(full)) != repr(beer_info(captured)):
+                return False
+
+        if kind in ['beer', 'review']:
+            return reviews(full) == reviews(captured)
+
+        if kind == 'user':
+            return user_info(full) == user_info(captured)
+
+        return True
+
+    def stats(self):
+        """
+        Get the counters
+
+        :return: dict with the number of pages, the bytes before and after the capture and the number of pages kept
+                 entirely
+        """
+
+        return {'pages': self.pages, 'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'fallbacks': self.fallbacks}
+
+
+def captured(content):
+    """
+    Read the marker of a captured page.
+
+    :param content: bytes of the page
+    :return: dict with the size of the full page, the number of bytes dropped and their SHA-1, None if the page was
+             not captured
+    """
+
+    grp = MARKER_RE.match(content)
+    if grp is None:
+        return None
+
+    return {'size': int(grp.group(1)), 'dropped': int(grp.group(2)), 'sha1': grp.group(3).decode('ascii')}
@@ -5,11 +5,18 @@
 #
 # Distributed under terms of the MIT license.
 
-from classes.helpers import round_
+from classes.helpers import round_, first_page
+from classes.extract import decode, beer_info, beer_info_bytes, review_keys
+from classes.engine import CrawlEngine, Job
+from classes.transport import Transport
+from classes.pagestore import open_store
+from classes.capture import Capture
+from classes.frontier import Frontier
+from classes.scheduler import Scheduler
+from classes.retry import RetryPolicy
+from classes.metrics import Metrics
 import pandas as pd
-import numpy as np
-import requests
-import html
+import math
 import time
 import re
 import os
@@ -20,12 +27,22 @@ class Crawler:
     Crawler for RateBeer website
     """
 
-    def __init__(self, delta_t, data_folder=None):
+    def __init__(self, delta_t, data_folder=None, concurrency=1, rate=None, max_rate=None, timeout=(10, 60),
+                 max_attempts=5, base_url='https://www.ratebeer.com', packed=None, capture=False):
         """
         Initialize the class.
 
-        :param delta_t: Average time in seconds between two requests
+        :param delta_t: Average time in seconds between two requests at the start
         :param data_folder: Folder to save the data
+        :param concurrency: Number of requests in flight at the same time
+        :param rate: Starting number of requests per second on RateBeer (default: 1/delta_t)
+        :param max_rate: Maximum number of requests per second on RateBeer (default: 4 times rate)
+        :param timeout: Tuple with the connect and the read timeouts in seconds
+        :param max_attempts: Maximum number of requests for one page before adding it to the dead letters
+        :param base_url: URL of RateBeer (can be changed to crawl an offline stand-in)
+        :param packed: Save the pages in a PageStore (segment files with an index) instead of one file per page
+                       (default: PageStore if data_folder/pages/ already exists)
+        :param capture: Only save the regions of the pages of the beers and the users used by the Parser
         """
 
         if data_folder is None:
@@ -34,6 +51,39 @@ class Crawler:
             self.data_folder = data_folder
 
         self.delta_t = delta_t
+        self.base_url = base_url
+
+        if rate is None:
+            rate = 1.0/delta_t
+
+        folder = self.data_folder + 'misc/'
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # Persistent queue with all the pages to crawl
+        self.frontier = Frontier(folder + 'frontier.db')
+
+        # Throughput, latencies and ETA of each step
+        self.metrics = Metrics(folder + 'metrics_crawler')
+
+        # Where the pages are saved
+        self.store = open_store(self.data_folder, packed)
+
+        if capture:
+            self.capture = Capture()
+        else:
+            self.capture = None
+
+        self.transport = Transport(concurrency, timeout)
+        self.engine = CrawlEngine(self.transport, concurrency, rate, max_rate, self.frontier,
+                                  RetryPolicy(max_attempts), self.metrics, self.store, self.capture)
+
+        # Function called once a page of the given kind has been downloaded
+        self.callbacks = {'places': self._places_jobs, 'beer': self._reviews_jobs,
+                          'beer_refresh': self._refresh_jobs, 'review_refresh': self._refresh_jobs}
+
+        # All the kinds of pages in the frontier
+        self.kinds = ['places', 'place', 'brewery', 'beer', 'review', 'beer_refresh', 'review_refresh', 'user']
 
         self.special_places = ['United States', 'Canada', 'England', 'Germany']
         self.codes = {213: 'United States', 39: 'Canada', 240: 'England', 79: 'Germany'}
@@ -51,30 +101,39 @@ class Crawler:
         Crawl all the places
         """
 
-        url_places = 'https://www.ratebeer.com/breweries/'
+        url_places = self.base_url + '/breweries/'
 
         # Create folder for all the HTML pages
         folder = self.data_folder + 'misc/'
         if not os.path.exists(folder):
             os.makedirs(folder)
 
-        # Crawl the countries
-        r = self.request_and_wait(url_places)
-        with open(folder + 'places.html', 'wb') as output:
-            output.write(r.content)
-
         # Create folder for all the places
         folder = self.data_folder + 'places/'
         if not os.path.exists(folder):
             os.makedirs(folder)
 
+        if not self.frontier.is_seeded('places'):
+            self.frontier.enqueue([(url_places, 'places', self.data_folder + 'misc/places.html', {},
+                                    Frontier.PENDING)])
+            self.frontier.mark_seeded('places')
+
+        # Crawl the countries, then all the places found in this page
+        self.crawl(['places', 'place'], step='1. places')
+
+    def _places_jobs(self, job, r):
+        """
+        Callback for the page with all the places. Return the jobs for each place.
+        """
+
         # Open the HTML file and parse it to get all the links
-        html = open(self.data_folder + 'misc/places.html', 'rb').read().decode('ISO-8859-1')
+        html = self.store.read(self.data_folder + 'misc/places.html').decode('ISO-8859-1')
 
         str_ = 'href="/breweries/(\S+)/(\d+)/(\d+)/">(.+?)</a>'
 
         grp = re.finditer(str_, str(html))
 
+        jobs = []
         # Go through all the links and download them
         for g in grp:
             place_small = g.group(1)
@@ -96,13 +155,10 @@ class Crawler:
 
             folder += place + '/'
 
-            if not os.path.exists(folder):
-                os.makedirs(folder)
+            url = self.base_url + '/breweries/{}/{:d}/{:d}/'.format(place_small, region_code, country_code)
+            jobs.append(Job(url, folder + 'brew.html', kind='place'))
 
-            url = 'https://www.ratebeer.com/breweries/{}/{:d}/{:d}/'.format(place_small, region_code, country_code)
-            r = self.request_and_wait(url)
-            with open(folder + 'brew.html', 'wb') as output:
-                output.write(r.content)
+        return jobs
 
     ########################################################################################
     ##                                                                                    ##
@@ -126,21 +182,31 @@ class Crawler:
         if not os.path.exists(folder):
             os.makedirs(folder)
 
+        if not self.frontier.is_seeded('brewery'):
+            self.frontier.enqueue(self._breweries_pages(df))
+            self.frontier.mark_seeded('brewery')
+
+        self.crawl(['brewery'], step='3. breweries')
+
+    def _breweries_pages(self, df):
+        """
+        Generator of the breweries pages for the frontier.
+        """
+
+        folder = self.data_folder + 'breweries/'
+
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
             link = row['link']
             id_ = row['id']
 
-            folder = self.data_folder + 'breweries/'
-
-            # Check if file already exists
-            if not os.path.exists(folder + str(id_) + '.html'):
-                # Get the HTML page
-                r = self.request_and_wait(link)
+            # Files downloaded before the frontier existed are marked as done
+            if self.store.exists(folder + str(id_) + '.html'):
+                status = Frontier.DONE
+            else:
+                status = Frontier.PENDING
 
-                # Save it
-                with open(folder + str(id_) + '.html', 'wb') as output:
-                    output.write(r.content)
+            yield link, 'brewery', folder + str(id_) + '.html', {}, status
 
     ########################################################################################
     ##                                                                                    ##
@@ -148,15 +214,29 @@ class Crawler:
     ##                                                                                    ##
     ########################################################################################
 
-    def crawl_all_beers_and_reviews(self):
+    def crawl_all_beers_and_reviews(self, policy=Scheduler.FILE, duration=None, incremental=False):
         """
         STEP 5
 
         Crawl all the reviews from all the beers.
 
         !!! Make sure step 4 was done with the parser !!!
+
+        With incremental=True, the beers already crawled are refreshed: the first page is downloaded again and only
+        the pages with new reviews are added (see refresh_beers_and_reviews).
+
+        :param policy: Order of the beers (see Scheduler): Scheduler.FILE (order of beers.csv), Scheduler.VALUE
+                       (most ratings first), Scheduler.FRESH (never crawled or oldest crawl first) or
+                       Scheduler.ROUND_ROBIN (one beer per brewery at a time)
+        :param duration: Time window in seconds. No new beer is started after it (default: no limit). The beers
+                         not crawled stay in the frontier for the next run.
+        :param incremental: Only download the new reviews of the beers already crawled
         """
 
+        if incremental:
+            self.refresh_beers_and_reviews(policy, duration)
+            return
+
         # Read the CSV file
         df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
 
@@ -165,112 +245,305 @@ class Crawler:
         if not os.path.exists(folder):
             os.makedirs(folder)
 
-        # Number of step for crawling the review pages
-        step = 10
+        items = self.plan_beers_and_reviews(df, policy, duration)
+        priorities = {(item['brewery_id'], item['beer_id']): item['priority'] for item in items}
 
-        for i in df.index:
-            row = df.ix[i]
-            brewery_id = row['brewery_id']
-            beer_id = row['beer_id']
+        if not self.frontier.is_seeded('beer'):
+            self.frontier.enqueue(self._beers_pages(df, priorities))
+            self.frontier.mark_seeded('beer')
+        else:
+            # The policy can change between two runs
+            urls = self.frontier.beer_urls()
+            self.frontier.set_priority((urls[key], priority) for key, priority in priorities.items() if key in urls)
 
-            # Create the folder
-            folder = self.data_folder + 'beers/{:d}/{:d}/'.format(brewery_id, beer_id)
-            if not os.path.exists(folder):
-                os.makedirs(folder)
+        if duration is not None:
+            deadline = time.time() + duration
+        else:
+            deadline = None
 
-            if not os.path.exists(folder + '1.html') or os.stat(folder + '1.html').st_size == 0:
+        self.crawl(['beer', 'review'], step='5. beers and reviews', deadline=deadline)
 
-                count = 0
-                code = 400
+    def refresh_beers_and_reviews(self, policy=Scheduler.FRESH, duration=None):
+        """
+        STEP 5 (incremental)
 
-                try:
-                    while code != 200:
-                        # Get it and write it
-                        r = self.request_and_wait(row['link'])
+        Download only the new reviews of the beers already crawled. For each beer, the first page is downloaded
+        again and its number of ratings is compared with the one of the last crawl. The next pages are downloaded
+        one by one until a page contains a review which was already on the first page of the last crawl (same user
+        and same date), at most up to the page where the new ratings end.
 
-                        code = r.status_code
-                        count += 1
+        The pages are saved as refresh{generation}_{page}.html next to the pages of the first crawl, which are never
+        modified. The Parser reads the newest pages first and keeps one review per user. The beers never crawled
+        are crawled entirely.
 
-                        if r.content == '':
-                            code = 400
+        :param policy: Order of the beers (see crawl_all_beers_and_reviews)
+        :param duration: Time window in seconds (see crawl_all_beers_and_reviews)
+        """
 
-                        if count == 5:
-                            raise Exception('Problem downloading file 1.html for '
-                                            'brewery_id {} and beer_id {} ( rm -r {}/{}) '.format(brewery_id, beer_id,
-                                                                                                  brewery_id, beer_id))
+        df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
+
+        kinds = ['beer', 'review', 'beer_refresh', 'review_refresh']
+
+        # An interrupted refresh is resumed, otherwise a new one is started
+        generation = 1
+        while self.frontier.is_seeded('refresh{:d}'.format(generation)):
+            generation += 1
+
+        # Only the pages of the last refresh tell if it was interrupted (not the pages left by a step 5 with a time
+        # window)
+        if generation > 1 and self.frontier.count(['beer_refresh', 'review_refresh'], Frontier.PENDING) > 0:
+            print('Resuming the refresh {:d}'.format(generation - 1))
+        else:
+            left = self.frontier.count(['beer', 'review'], Frontier.PENDING)
+            if left > 0:
+                print('{:d} pages of an earlier crawl of the beers are still pending, they are downloaded with the '
+                      'refresh {:d}'.format(left, generation))
 
-                except Exception as e:
-                    print('---------------------------------------------------------------------')
-                    print('')
-                    print(e)
-                    print('---------------------------------------------------------------------')
-                    print('')
+            items = self.plan_beers_and_reviews(df, policy, duration, incremental=True)
+            priorities = {(item['brewery_id'], item['beer_id']): item['priority'] for item in items}
 
-                # Save it
-                with open(folder + '1.html', 'wb') as output:
-                    output.write(r.content)
+            self.frontier.enqueue(self._refresh_pages(df, generation, priorities))
+            self.frontier.mark_seeded('refresh{:d}'.format(generation))
 
-            html_txt = open(folder + '1.html', 'rb').read().decode('ISO-8859-1')
+        if duration is not None:
+            deadline = time.time() + duration
+        else:
+            deadline = None
 
-            # Unescape the HTML characters
-            html_txt = html.unescape(html_txt)
+        self.crawl(kinds, step='5. beers and reviews (refresh)', deadline=deadline)
 
-            # Get the number of ratings
-            str_ = 'RATINGS: </abbr><big style="color: #777;"><b><span id="_ratingCount8" itemprop="ratingCount" ' \
-                   'itemprop="reviewCount">(\d+)</span>'
-            grp = re.search(str_, str(html_txt))
+    def _refresh_pages(self, df, generation, priorities):
+        """
+        Generator of the first page of each beer for an incremental crawl.
+        """
 
-            try:
-                nbr = round_(int(grp.group(1).replace(',', '')) - 1, step)
-            except Exception as e:
+        urls = self.frontier.beer_urls()
+        infos = self.frontier.beer_infos()
+
+        for i in df.index:
+            row = df.loc[i]
+            brewery_id = int(row['brewery_id'])
+            beer_id = int(row['beer_id'])
+
+            if (brewery_id, beer_id) in urls:
+                link = urls[(brewery_id, beer_id)]
+            elif 'link' in df.columns:
+                link = row['link']
+            else:
                 print('---------------------------------------------------------------------')
                 print('')
-                print('Cannot read file 1.html for brewery_id {} and beer_id {} '
-                      '( rm -r {}/{}) '.format(brewery_id, beer_id, brewery_id, beer_id))
+                print('No link for brewery_id {:d} and beer_id {:d}'.format(brewery_id, beer_id))
                 print('---------------------------------------------------------------------')
                 print('')
+                continue
 
-                nbr = 0
+            folder = self.data_folder + 'beers/{:d}/{:d}/'.format(brewery_id, beer_id)
+            data = {'brewery_id': brewery_id, 'beer_id': beer_id, 'folder': folder,
+                    'priority': priorities[(brewery_id, beer_id)]}
+
+            if not self.store.isdir(folder) or first_page(self.store.listdir(folder)) is None:
+                # Never crawled: all the pages are needed
+                data['cost'] = None
+                yield link, 'beer', folder + '1.html', data, Frontier.PENDING
+                continue
+
+            # Number of ratings at the last crawl
+            if (brewery_id, beer_id) in infos and infos[(brewery_id, beer_id)]['nbr_ratings'] >= 0:
+                data['nbr_ratings'] = infos[(brewery_id, beer_id)]['nbr_ratings']
+            elif 'nbr_ratings' in df.columns and row['nbr_ratings'] >= 0:
+                data['nbr_ratings'] = int(row['nbr_ratings'])
+            else:
+                data['nbr_ratings'] = None
+
+            data['link'] = link
+            data['generation'] = generation
+            data['page'] = 1
+            data['cost'] = 1
+
+            # The fragment makes the url unique in the frontier, it is not sent to the server
+            yield link + '#refresh{:d}'.format(generation), 'beer_refresh', \
+                folder + 'refresh{:d}_1.html'.format(generation), data, Frontier.PENDING
+
+    def _refresh_jobs(self, job, r):
+        """
+        Callback for the pages of an incremental crawl. Return the job for the next page if this page only contains
+        new reviews.
+        """
+
+        # Number of ratings per page
+        step = 10
 
-            # Get all the pages with the reviews and ratings
-            for j in range(1, int(nbr / step) + 1):
-                idx = j + 1
-                if not os.path.exists(folder + str(idx) + '.html') or \
-                                os.stat(folder + str(idx) + '.html').st_size == 0:
-                    url = row['link'] + '/1/{}/'.format(idx)
+        data = dict(job.data)
+        folder = data['folder']
+        generation = data['generation']
 
-                    # Download the file
-                    count = 0
-                    code = 400
+        html_txt = decode(r.content)
+        keys = review_keys(html_txt)
 
-                    try:
-                        while code != 200:
-                            # Get it and write it
-                            r = self.request_and_wait(url)
+        if data['page'] == 1:
+            info = beer_info(html_txt)
+            self.frontier.save_beer_info(data['brewery_id'], data['beer_id'], info)
 
-                            code = r.status_code
-                            count += 1
+            # Reviews (user ID and date) of the first page of the last crawl, i.e. the newest reviews we already
+            # have. A review edited or rated again since has a new date.
+            old_page = first_page(self.store.listdir(folder), generation)
+            data['known'] = sorted(review_keys(decode(self.store.read(folder + old_page))))
 
-                            if r.content == '':
-                                code = 400
+            old = data['nbr_ratings']
+            if info['nbr_ratings'] < 0:
+                print('---------------------------------------------------------------------')
+                print('')
+                print('Cannot read the number of ratings in file {} for brewery_id {} and beer_id {}'.format(
+                    os.path.basename(job.path), data['brewery_id'], data['beer_id']))
+                print('---------------------------------------------------------------------')
+                print('')
+                return []
 
-                            if count == 5:
-                                raise Exception('Problem downloading file {}.html for '
-                                                'brewery_id {} and beer_id {} ( rm -r {}/{}) '.format(str(idx),
-                                                                                                      brewery_id,
-                                                                                                      beer_id,
-                                                                                                      brewery_id,
-                                                                                                      beer_id))
+            if old is not None and info['nbr_ratings'] <= old:
+                # Nothing new
+                return []
 
-                    except Exception as e:
-                        print('---------------------------------------------------------------------')
-                        print('')
-                        print(e)
-                        print('---------------------------------------------------------------------')
-                        print('')
+            # Pages which can contain new reviews, plus one page if some reviews were deleted
+            new = info['nbr_ratings'] - (old or 0)
+            data['last_page'] = min(math.ceil(new/step) + 1, math.ceil(info['nbr_ratings']/step))
 
-                    with open(folder + str(idx) + '.html', 'wb') as output:
-                        output.write(r.content)
+        # Stop as soon as we reach a review we already have. The pages queued by an older version only have the
+        # user IDs: they are downloaded up to the last page.
+        known = set(tuple(key) for key in data['known'] if isinstance(key, (list, tuple)))
+        if len(keys & known) > 0 or data['page'] >= data['last_page']:
+            return []
+
+        data['page'] += 1
+        url = data['link'] + '/1/{:d}/#refresh{:d}'.format(data['page'], generation)
+        path = folder + 'refresh{:d}_{:d}.html'.format(generation, data['page'])
+
+        return [Job(url, path, self._refresh_jobs, data=data, kind='review_refresh')]
+
+    def plan_beers_and_reviews(self, df=None, policy=Scheduler.FILE, duration=None, incremental=False):
+        """
+        Order the beers following the policy and print the number of requests and the time needed for step 5.
+        The number of ratings is taken from beers.csv (if step 6 was already done) or from a previous crawl.
+
+        :param df: DataFrame of beers.csv (default: read the file)
+        :param policy: Order of the beers (see crawl_all_beers_and_reviews)
+        :param duration: Time window in seconds
+        :param incremental: Estimation for an incremental crawl, i.e. at least one request per beer
+        :return: list of dict with the brewery_id, beer_id, nbr_ratings, last_fetch and priority of each beer, in
+                 the order of the crawl
+        """
+
+        if df is None:
+            df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
+
+        infos = self.frontier.beer_infos()
+
+        items = []
+        for i in df.index:
+            row = df.loc[i]
+            key = (int(row['brewery_id']), int(row['beer_id']))
+            info = infos.get(key)
+
+            if 'nbr_ratings' in df.columns and row['nbr_ratings'] >= 0:
+                nbr_ratings = int(row['nbr_ratings'])
+            elif info is not None and info['nbr_ratings'] >= 0:
+                nbr_ratings = info['nbr_ratings']
+            else:
+                nbr_ratings = None
+
+            item = {'brewery_id': key[0], 'beer_id': key[1], 'nbr_ratings': nbr_ratings,
+                    'last_fetch': None if info is None else info['time']}
+
+            if incremental and info is not None:
+                # The new reviews are unknown before the first page is downloaded again
+                item['cost'] = 1
+
+            items.append(item)
+
+        scheduler = Scheduler(policy)
+        items = scheduler.plan(items)
+
+        controller = self.engine.limiter(self.base_url).controller
+        proj = scheduler.projection(items, controller.rate, self.engine.concurrency, controller.latency, duration)
+        print('Plan for the beers ({}): {}'.format(policy, Scheduler.format(proj)))
+
+        return items
+
+    def _beers_pages(self, df, priorities=None):
+        """
+        Generator of the first page of each beer for the frontier. The other pages are added once the first one
+        is known.
+        """
+
+        for i in df.index:
+            row = df.loc[i]
+            brewery_id = int(row['brewery_id'])
+            beer_id = int(row['beer_id'])
+
+            folder = self.data_folder + 'beers/{:d}/{:d}/'.format(brewery_id, beer_id)
+            data = {'brewery_id': brewery_id, 'beer_id': beer_id, 'folder': folder, 'cost': None}
+
+            if priorities is not None:
+                data['priority'] = priorities[(brewery_id, beer_id)]
+
+            # On a new crawl, the number of ratings is already known
+            if 'nbr_ratings' in df.columns and row['nbr_ratings'] >= 0:
+                data['cost'] = Scheduler.cost(row['nbr_ratings'])
+
+            if not self.store.exists(folder + '1.html'):
+                yield row['link'], 'beer', folder + '1.html', data, Frontier.PENDING
+            else:
+                # The first page was downloaded before the frontier existed, we add directly the missing reviews
+                yield row['link'], 'beer', folder + '1.html', data, Frontier.DONE
+
+                job = Job(row['link'], folder + '1.html', data=data, kind='beer')
+                for new_job in self._reviews_jobs(job, None):
+                    yield new_job.url, new_job.kind, new_job.path, new_job.data, Frontier.PENDING
+
+    def _reviews_jobs(self, job, r):
+        """
+        Callback for the first page of a beer. Save the information of the beer and return the jobs for the pages
+        with the reviews.
+        """
+
+        # Number of step for crawling the review pages
+        step = 10
+
+        folder = job.data['folder']
+
+        if r is not None:
+            # Use directly the page in memory
+            content = r.content
+        else:
+            content = self.store.read(folder + '1.html')
+
+        # Get the information, in particular the number of ratings, and save it for the parser
+        info = beer_info_bytes(content)
+        self.frontier.save_beer_info(job.data['brewery_id'], job.data['beer_id'], info)
+
+        if info['nbr_ratings'] >= 0:
+            nbr = round_(info['nbr_ratings'] - 1, step)
+        else:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('Cannot read the number of ratings in file 1.html for brewery_id {} and beer_id {}'.format(
+                job.data['brewery_id'], job.data['beer_id']))
+            print('---------------------------------------------------------------------')
+            print('')
+
+            nbr = 0
+
+        jobs = []
+        # Get all the pages with the reviews and ratings
+        for j in range(1, int(nbr / step) + 1):
+            idx = j + 1
+            if not self.store.exists(folder + str(idx) + '.html'):
+                url = job.url + '/1/{}/'.format(idx)
+
+                # The reviews are downloaded with the same priority as their beer
+                jobs.append(Job(url, folder + str(idx) + '.html', kind='review',
+                                data={'priority': job.data.get('priority', 0)}))
+
+        return jobs
 
     ########################################################################################
     ##                                                                                    ##
@@ -295,18 +568,33 @@ class Crawler:
         if not os.path.exists(folder):
             os.makedirs(folder)
 
+        if not self.frontier.is_seeded('user'):
+            self.frontier.enqueue(self._users_pages(df))
+            self.frontier.mark_seeded('user')
+
+        self.crawl(['user'], step='9. users')
+
+    def _users_pages(self, df):
+        """
+        Generator of the users pages for the frontier.
+        """
+
+        folder = self.data_folder + 'users/'
+
         for i in df.index:
-            row = df.ix[i]
+            row = df.loc[i]
 
             # Get the url
-            url = 'https://www.ratebeer.com/user/{}/'.format(row['user_id'])
+            url = self.base_url + '/user/{}/'.format(row['user_id'])
+            file = folder + str(row['user_id']) + '.html'
 
-            # Crawl the user's page
-            r = self.request_and_wait(url)
+            # Files downloaded before the frontier existed are marked as done
+            if self.store.exists(file):
+                status = Frontier.DONE
+            else:
+                status = Frontier.PENDING
 
-            # Save it
-            with open(folder + str(row['user_id']) + '.html', 'wb') as output:
-                output.write(r.content)
+            yield url, 'user', file, {}, status
 
     ########################################################################################
     ##                                                                                    ##
@@ -314,27 +602,130 @@ class Crawler:
     ##                                                                                    ##
     ########################################################################################
 
+    def crawl(self, kinds, status=Frontier.PENDING, step=None, deadline=None):
+        """
+        Download all the pages of the given kinds and status in the frontier.
+
+        :param kinds: list of kinds of pages
+        :param status: status of the pages to download
+        :param step: name of the step for the metrics (default: the kinds of pages)
+        :param deadline: time after which no new page is taken from the frontier (default: no limit)
+        """
+
+        if step is None:
+            step = ', '.join(kinds)
+
+        self.metrics.start(step, lambda: self.remaining(kinds, status))
+        try:
+            self.engine.run(self._frontier_jobs(kinds, status, deadline))
+        finally:
+            self.metrics.finish()
+
+    def remaining(self, kinds, status=Frontier.PENDING):
+        """
+        Estimate the number of requests still needed for the pages of the given kinds.
+
+        :param kinds: list of kinds of pages
+        :param status: status of the pages to download
+        :return: number of requests
+        """
+
+        if status == Frontier.FAILED:
+            return len(self.frontier.dead_letters(kinds))
+
+        # For the beers with an unknown number of ratings, we use the average number of review pages per beer
+        beers = self.frontier.count(['beer'], Frontier.DONE)
+        if beers > 0:
+            default_cost = 1 + self.frontier.count(['review'])/beers
+        else:
+            default_cost = 1
+
+        return self.frontier.remaining(kinds, default_cost)
+
+    def _frontier_jobs(self, kinds, status, deadline=None):
+        """
+        Generator of the jobs for the pages in the frontier, by decreasing priority.
+        """
+
+        while deadline is None or time.time() < deadline:
+            # Small batches with a deadline, such that the pages not started go back in the queue quickly
+            pages = self.frontier.claim(kinds, n=1000 if deadline is None else 10*self.engine.concurrency,
+                                        status=status)
+
+            if len(pages) == 0:
+                break
+
+            for idx, page in enumerate(pages):
+                if deadline is not None and time.time() >= deadline:
+                    # Give back the pages which were not started
+                    self.frontier.release([p['url'] for p in pages[idx:]], status)
+                    return
+
+                page['data']['priority'] = page['priority']
+                yield Job(page['url'], page['path'], self.callbacks.get(page['kind']), data=page['data'],
+                          kind=page['kind'])
+
+    def dead_letters(self, kinds=None):
+        """
+        Get the pages which permanently failed.
+
+        :param kinds: list of kinds of pages (default: all of them)
+        :return: DataFrame with the url, kind, number of attempts, time of the last attempt and last error
+        """
+
+        if kinds is None:
+            kinds = self.kinds
+
+        return pd.DataFrame(self.frontier.dead_letters(kinds),
+                            columns=['url', 'kind', 'attempts', 'last_fetch', 'error'])
+
+    def retry_dead_letters(self, kinds=None):
+        """
+        Download again only the pages which permanently failed.
+
+        :param kinds: list of kinds of pages (default: all of them)
+        """
+
+        if kinds is None:
+            kinds = self.kinds
+
+        self.crawl(kinds, Frontier.FAILED)
+
+    def current_rate(self):
+        """
+        Current number of requests per second sent to RateBeer. It is adapted to the behaviour of the server.
+
+        :return: number of requests per second
+        """
+
+        return self.engine.limiter(self.base_url).controller.rate
+
     def request_and_wait(self, url):
         """
-        Run the function get from the package requests, then wait a certain amount of time.
+        Wait for a free slot given by the rate controller, then run the request.
 
         :param url: url for the requests
         :return r: the request
         """
 
-        # Get the time we want to wait before running the function again
-        delta = np.abs(np.random.normal(self.delta_t, self.delta_t/2))
-
-        start = time.time()
+        limiter = self.engine.limiter(url)
 
-        # Run the function
-        r = requests.get(url)
+        # Wait for the next slot for this host
+        wait = limiter.reserve()
+        if wait > 0:
+            time.sleep(wait)
 
-        elapsed = time.time()-start
+        start = time.monotonic()
 
-        # If not enough time has been spend, sleep
-        if elapsed < delta:
-            time.sleep(delta-elapsed)
+        # Run the function
+        try:
+            r = self.transport.get(url)
+        except Exception:
+            limiter.controller.update(time.monotonic() - start, None)
+            raise
+
+        # Give the feedback to the rate controller
+        limiter.controller.update(time.monotonic() - start, r.status_code, r.headers.get('Retry-After'))
 
         # Return the result
         return r
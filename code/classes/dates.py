@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Conversion of the dates written on the pages into epochs. There are only     ##
+##      a few thousand different dates for millions of reviews, the conversions       ##
+##      are kept in a cache.                                                          ##
+##                                                                                    ##
+########################################################################################
+
+import functools
+import datetime
+import time
+
+
+def review_date(str_date):
+    """
+    Transform the date of a review into an epoch (at noon)
+
+    :param str_date: date as written on the page, e.g. 'Aug 14, 2014'
+    :return: epoch
+    """
+
+    try:
+        year = int(str_date.split(",")[1])
+    except (ValueError, IndexError):
+        # It's possible that there's an error due to the addition of the explanation
+        # why this rating doesn't count
+        year = int(str_date.split(",")[1].split('<')[0])
+
+    month = time.strptime(str_date[0:3], '%b').tm_mon
+    day = int(str_date.split(",")[0][4:])
+
+    return int(datetime.datetime(year, month, day, 12, 0).timestamp())
+
+
+def member_since(str_date):
+    """
+    Transform the joining date of a user into an epoch (at noon)
+
+    :param str_date: date as written on the page, e.g. 'Aug 14 2014'
+    :return: epoch
+    """
+
+    month = time.strptime(str_date.split(' ')[0], '%b').tm_mon
+    day = int(str_date.split(' ')[1])
+    year = int(str_date.split(' ')[2])
+
+    return int(datetime.datetime(year, month, day, 12, 0).timestamp())
+
+
+class DateCache:
+    """
+    Convert the dates with a bounded cache (least recently used dates are dropped first). The errors of the
+    conversion are raised as without the cache and are not kept.
+    """
+
+    def __init__(self, convert, size=2**16):
+        """
+        Initialize the cache.
+
+        :param convert: function transforming a string into an epoch (review_date or member_since)
+        :param size: Maximum number of dates in the cache
+        """
+
+        self.convert = convert
+        # Time spent in the conversions, i.e. for the dates which were not in the cache
+        self.time = 0.0
+        self.cached = functools.lru_cache(maxsize=size)(self._convert)
+
+    def _convert(self, str_date):
+        start = time.perf_counter()
+        try:
+            return self.convert(str_date)
+        finally:
+            self.time += time.perf_counter() - start
+
+    def __call__(self, str_date):
+        """
+        Convert a date.
+
+        :param str_date: date as written on the page
+        :return: epoch
+        """
+
+        return self.cached(str_date)
+
+    def stats(self):
+        """
+        Get the counters
+
+        :return: dict with the number of dates found in the cache, the number of dates converted and the time spent
+                 in the conversions
+        """
+
+        info = self.cached.cache_info()
+
+        return {'hits': info.hits, 'misses': info.misses, 'time': self.time}
+
+    @staticmethod
+    def format(stats):
+        """
+        Transform the counters into a text
+
+        :param stats: dict given by stats (or the sum of several of them)
+        :return: string
+        """
+
+        total = stats['hits'] + stats['misses']
+        if total == 0:
+            return 'no date converted'
+
+        # Each date found in the cache saves a conversion
+        saved = stats['hits']*stats['time']/max(stats['misses'], 1)
+
+        return '{:d} dates, {:.2f}% found in the cache, {:d} conversions in {:.2f} s, about {:.2f} s saved'.format(
+            total, 100*stats['hits']/total, stats['misses'], stats['time'], saved)
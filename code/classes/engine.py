@@ -0,0 +1,315 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.pagestore import FileStore
+from classes.frontier import Frontier
+from classes.rate import AIMDController
+from classes.retry import RetryPolicy
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import asyncio
+import time
+
+
+class Job:
+    """
+    One page to download
+    """
+
+    def __init__(self, url, path, callback=None, attempts=None, data=None, kind=None):
+        """
+        Initialize the job.
+
+        :param url: url of the page
+        :param path: file where the page is saved
+        :param callback: function called with (job, response) once the page is saved. It can return new jobs.
+        :param attempts: Maximum number of requests before giving up on this page (default: given by the RetryPolicy)
+        :param data: dict with anything the callback needs
+        :param kind: kind of page in the frontier
+        """
+
+        self.url = url
+        self.path = path
+        self.callback = callback
+        self.attempts = attempts
+        self.kind = kind
+
+        if data is None:
+            self.data = {}
+        else:
+            self.data = data
+
+
+class RateLimiter:
+    """
+    Give evenly spaced request slots for one host. The rate is adapted by an AIMDController.
+    """
+
+    def __init__(self, controller):
+        """
+        Initialize the limiter.
+
+        :param controller: AIMDController giving the number of requests per second allowed
+        """
+
+        self.controller = controller
+        self.next_slot = time.monotonic()
+
+    def reserve(self):
+        """
+        Reserve the next free slot for this host.
+
+        :return: time in seconds to wait before the slot
+        """
+
+        now = time.monotonic()
+        slot = max(now, self.next_slot, self.controller.pause_until)
+        self.next_slot = slot + 1.0/self.controller.rate
+
+        return slot - now
+
+    async def acquire(self):
+        """
+        Wait until the next free slot for this host.
+        """
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CrawlEngine:
+    """
+    Keep several requests in flight while honoring a requests-per-second budget per host
+    """
+
+    def __init__(self, transport, concurrency=1, rate=5.0, max_rate=None, frontier=None, policy=None,
+                 metrics=None, store=None, capture=None):
+        """
+        Initialize the engine.
+
+        :param transport: Transport used for the requests
+        :param concurrency: Number of requests in flight at the same time
+        :param rate: Starting number of requests per second for each host
+        :param max_rate: Maximum number of requests per second for each host (default: 4 times rate)
+        :param frontier: Frontier where the status of the pages is saved
+        :param policy: RetryPolicy for the failed requests
+        :param metrics: Metrics recording the requests
+        :param store: FileStore or PageStore where the pages are saved (default: FileStore)
+        :param capture: function called with (kind, content) which returns the bytes to save (default: the whole page)
+        """
+
+        self.metrics = metrics
+
+        if store is None:
+            self.store = FileStore()
+        else:
+            self.store = store
+
+        self.capture = capture
+
+        self.transport = transport
+        self.frontier = frontier
+
+        if policy is None:
+            self.policy = RetryPolicy()
+        else:
+            self.policy = policy
+
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_rate = max_rate
+
+        self.limiters = {}
+
+    def run(self, jobs):
+        """
+        Download all the jobs. New jobs returned by the callbacks are downloaded too.
+
+        :param jobs: iterable of Job
+        """
+
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # The pages are captured and saved one at a time in their own thread, such that the store is never written
+        # by two threads at once and the event loop keeps the other requests going
+        writer = ThreadPoolExecutor(max_workers=1)
+        try:
+            loop.run_until_complete(self._run(jobs, loop, executor, writer))
+        finally:
+            executor.shutdown(wait=True)
+            writer.shutdown(wait=True)
+            loop.close()
+
+    async def _run(self, jobs, loop, executor, writer):
+        """
+        Feed the queue with the jobs and start the workers.
+        """
+
+        queue = asyncio.Queue()
+
+        # Bound the number of jobs taken from the iterable such that huge lists of jobs are not loaded at once
+        slots = asyncio.Semaphore(10*self.concurrency)
+
+        workers = [loop.create_task(self._worker(queue, slots, loop, executor, writer))
+                   for _ in range(self.concurrency)]
+
+        try:
+            for job in jobs:
+                await slots.acquire()
+                await queue.put((job, True))
+
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+
+    async def _worker(self, queue, slots, loop, executor, writer):
+        """
+        Take the jobs in the queue one by one and download them.
+        """
+
+        while True:
+            job, fed = await queue.get()
+            try:
+                new_jobs = await self._process(job, loop, executor, writer)
+
+                if new_jobs:
+                    # Jobs added by the callbacks are saved in the frontier as claimed by this run...
+                    if self.frontier is not None:
+                        self.frontier.enqueue((j.url, j.kind, j.path, j.data, Frontier.IN_PROGRESS) for j in new_jobs)
+
+                    # ... and put back in the queue
+                    for new_job in new_jobs:
+                        queue.put_nowait((new_job, False))
+            except Exception as e:
+                if self.frontier is not None:
+                    self.frontier.fail(job.url, repr(e), 0)
+
+                print('---------------------------------------------------------------------')
+                print('')
+                print('Problem with {}: {}'.format(job.url, e))
+                print('---------------------------------------------------------------------')
+                print('')
+            finally:
+                if fed:
+                    slots.release()
+                queue.task_done()
+
+    async def _process(self, job, loop, executor, writer):
+        """
+        Download one job, save it and call its callback.
+        """
+
+        attempts = job.attempts
+        if attempts is None:
+            attempts = self.policy.max_attempts
+
+        count = 0
+        while True:
+            try:
+                r = await self.request(job.url, loop, executor)
+                outcome, error = self.policy.classify(r)
+            except Exception as e:
+                r = None
+                outcome, error = self.policy.classify(error=e)
+
+            count += 1
+
+            if outcome == RetryPolicy.OK:
+                break
+
+            if outcome == RetryPolicy.FATAL or count >= attempts:
+                # Failed pages are never saved. They are kept in the dead letters of the frontier.
+                if self.frontier is not None:
+                    self.frontier.fail(job.url, error, count)
+
+                print('---------------------------------------------------------------------')
+                print('')
+                print('Giving up on {} after {:d} attempt(s): {}'.format(job.url, count, error))
+                print('---------------------------------------------------------------------')
+                print('')
+
+                return None
+
+            await asyncio.sleep(self.policy.backoff(count))
+
+        # Save it
+        content = await loop.run_in_executor(writer, self.save, job, r.content)
+
+        if self.frontier is not None:
+            self.frontier.complete(job.url, len(content), count)
+
+        if job.callback is not None:
+            return job.callback(job, r)
+
+    def save(self, job, content):
+        """
+        Capture a page and save it in the store.
+
+        :param job: Job of the page
+        :param content: bytes of the page
+        :return: bytes saved
+        """
+
+        if self.capture is not None:
+            content = self.capture(job.kind, content)
+
+        self.store.write(job.path, content)
+
+        return content
+
+    async def request(self, url, loop, executor):
+        """
+        Wait for a free slot, run the request and give the feedback to the rate controller.
+
+        :param url: url for the request
+        :return r: the request
+        """
+
+        limiter = self.limiter(url)
+        await limiter.acquire()
+
+        start = time.monotonic()
+        try:
+            r = await loop.run_in_executor(executor, self.transport.get, url)
+        except Exception:
+            latency = time.monotonic() - start
+            limiter.controller.update(latency, None)
+            if self.metrics is not None:
+                self.metrics.record(latency, error=True)
+            raise
+
+        latency = time.monotonic() - start
+        limiter.controller.update(latency, r.status_code, r.headers.get('Retry-After'))
+        if self.metrics is not None:
+            self.metrics.record(latency, len(r.content), r.status_code != 200)
+
+        return r
+
+    def current_rate(self):
+        """
+        Current number of requests per second allowed for each host
+
+        :return: dict with the rate of each host
+        """
+
+        return {host: limiter.controller.rate for host, limiter in self.limiters.items()}
+
+    def limiter(self, url):
+        """
+        Get the rate limiter of the host of a url.
+
+        :param url: url for the request
+        :return: the RateLimiter of this host
+        """
+
+        host = urlparse(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = RateLimiter(AIMDController(self.rate, max_rate=self.max_rate))
+
+        return self.limiters[host]
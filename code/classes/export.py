@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Export of ratings.txt.gz into a Parquet file (one column per field). The     ##
+##      names of the beers, breweries, styles and users are dictionary-encoded and    ##
+##      the scores are small integers. pyarrow is only needed for this export.        ##
+##                                                                                    ##
+########################################################################################
+
+from classes.ratings import read_chunks, FIELDS
+
+# Fields which are dictionary-encoded (a few values repeated for many ratings)
+DICTIONARY = ['beer_name', 'brewery_name', 'style', 'user_name']
+
+# Fields stored as integers of 8 bits (the scores) and 32 bits (the IDs)
+INT8 = ['appearance', 'aroma', 'palate', 'taste', 'overall']
+INT32 = ['beer_id', 'brewery_id', 'user_id']
+
+
+def _pyarrow():
+    """
+    Import pyarrow and pyarrow.parquet.
+
+    :return: the modules pyarrow and pyarrow.parquet
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The Parquet export needs pyarrow: pip install pyarrow')
+
+    return pyarrow, pyarrow.parquet
+
+
+def schema(text=True):
+    """
+    Get the schema of the Parquet file.
+
+    :param text: Keep the column with the text of the ratings
+    :return: pyarrow.Schema
+    """
+
+    pa, _ = _pyarrow()
+
+    columns = []
+    for field in FIELDS:
+        if field in DICTIONARY:
+            type_ = pa.dictionary(pa.int32(), pa.string())
+        elif field in INT8:
+            type_ = pa.int8()
+        elif field in INT32:
+            type_ = pa.int32()
+        elif field == 'date':
+            type_ = pa.int64()
+        elif field == 'text':
+            if not text:
+                continue
+            type_ = pa.string()
+        else:
+            # abv and rating
+            type_ = pa.float64()
+
+        columns.append(pa.field(field, type_))
+
+    return pa.schema(columns)
+
+
+def export_ratings(ratings, filename, text=True, row_group=2**20, compression='zstd'):
+    """
+    Write the ratings in a Parquet file.
+
+    :param ratings: name of ratings.txt.gz
+    :param filename: name of the Parquet file
+    :param text: Keep the column with the text of the ratings (the biggest one by far)
+    :param row_group: Number of ratings in each row group of the file
+    :param compression: Compression of the columns
+    :return: number of ratings written
+    """
+
+    pa, pq = _pyarrow()
+
+    schema_ = schema(text)
+    fields = [field.name for field in schema_]
+
+    nbr = 0
+    with pq.ParquetWriter(filename, schema_, compression=compression) as writer:
+        columns = {field: [] for field in fields}
+        for chunk in read_chunks(ratings, fields):
+            for field in fields:
+                columns[field] += chunk[field]
+
+            if len(columns['rating']) >= row_group:
+                nbr += _write(pa, writer, schema_, columns)
+                columns = {field: [] for field in fields}
+
+        if len(columns['rating']) > 0 or nbr == 0:
+            nbr += _write(pa, writer, schema_, columns)
+
+    return nbr
+
+
+def _write(pa, writer, schema_, columns):
+    """
+    Write a row group.
+
+    :return: number of ratings written
+    """
+
+    arrays = []
+    for field in schema_:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+
+    writer.write_table(pa.Table.from_arrays(arrays, schema=schema_))
+
+    return len(columns['rating'])
+
+
+def load_ratings(filename, columns=None):
+    """
+    Load the ratings of a Parquet file in a DataFrame. The dictionary-encoded fields are categorical columns.
+
+    :param filename: name of the Parquet file
+    :param columns: list of the fields to load (default: all of them)
+    :return: pandas DataFrame
+    """
+
+    _, pq = _pyarrow()
+
+    return pq.read_table(filename, columns=columns).to_pandas()
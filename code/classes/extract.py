@@ -0,0 +1,535 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##         Functions to extract the information from one page. They are used          ##
+##                      by both the Crawler and the Parser.                           ##
+##                                                                                    ##
+########################################################################################
+
+import numpy as np
+import html
+import re
+
+# Number of ratings
+RATING_COUNT = re.compile('RATINGS: </abbr><big style="color: #777;"><b><span id="_ratingCount8" '
+                          'itemprop="ratingCount" itemprop="reviewCount">(\d+)</span>')
+
+# ABV
+ABV = re.compile('<abbr title="Alcohol By Volume">ABV</abbr>: <big style="color: #777;"><strong>(.+?)</strong></big>')
+
+# Weighted average
+WEIGHTED_AVG = re.compile('WEIGHTED AVG: <big style="color: #777;"><strong><span itemprop="ratingValue">(.+?)</span>')
+
+# Overall score
+OVERALL_SCORE = re.compile('overall</div><div class="ratingValue" itemprop="ratingValue">(\d+)</div>')
+
+# Style score
+STYLE_SCORE = re.compile('<div style="font-size: 25px; font-weight: bold; color: #fff; padding: 20px 0px; ">'
+                         '(\d+)<br><div class="style-text">style</div>')
+
+# One review, once the characters \r, \n and \t are removed: rating, aroma, appearance, taste, palate, overall,
+# displayed rating, user ID, user name, number of ratings of the user, location, date and text
+REVIEW = re.compile('<div style="display:inline; padding: 0px 0px; font-size: 24px; font-weight: bold; color: '
+                    '#036;" title="([^o]*) out of 5.0<br /><small>Aroma (\d+)/10<br />Appearance (\d+)/5<br />'
+                    'Taste (\d+)/10<br />Palate (\d+)/5<br />Overall (\d+)/20<br /></small>">(.+?)</div></div>'
+                    '<small style="color: #666666; font-size: 12px; font-weight: bold;"><A HREF="/user/(\d+)/">'
+                    '(.+?)\xa0\((\d+)\)</A></I> -(.+?)- (.+?)</small><BR><div style="padding: 20px 10px 20px '
+                    '0px; border-bottom: 1px solid #e0e0e0; line-height: 1.5;">(.+?)</div><br>')
+
+# Names of the groups of REVIEW
+REVIEW_FIELDS = ['rating', 'aroma', 'appearance', 'taste', 'palate', 'overall', 'displayed_rating', 'user_id',
+                 'user_name', 'user_ratings', 'location', 'date', 'text']
+
+# The same review cut into blocks by the tokenizer. Each block starts after the anchor and each field ends with its
+# delimiter. The user name ends with USER_RATINGS, which also gives the number of ratings of the user.
+REVIEW_ANCHOR = '<div style="display:inline; padding: 0px 0px; font-size: 24px; font-weight: bold; color: #036;" title="'
+REVIEW_DELIMITERS = [' out of 5.0<br /><small>Aroma ', '/10<br />Appearance ', '/5<br />Taste ', '/10<br />Palate ',
+                     '/5<br />Overall ', '/20<br /></small>">',
+                     '</div></div><small style="color: #666666; font-size: 12px; font-weight: bold;"><A HREF="/user/',
+                     '/">', None, None, '- ', '</small><BR><div style="padding: 20px 10px 20px 0px; border-bottom: 1px '
+                     'solid #e0e0e0; line-height: 1.5;">', '</div><br>']
+USER_RATINGS = re.compile('\xa0\((\d+)\)</A></I> -')
+
+# Fields made of digits
+REVIEW_DIGITS = [1, 2, 3, 4, 5, 7, 9]
+
+# Date when the user joined RateBeer
+MEMBER_SINCE = re.compile('Member since ([^<]*)')
+
+# Location of the user
+LOCATION = re.compile('<span class="glyphicon glyphicon-map-marker" aria-hidden="true"></span> ([^<]*)')
+
+
+# The byte patterns are the same as the patterns above, on the raw HTML. The non-breaking space can be written in
+# several ways before it is unescaped.
+NBSP_REFS = [b'&nbsp;', b'&#160;', b'&#xa0;', b'&#xA0;']
+NBSP = b'(?:\xa0|' + b'|'.join(NBSP_REFS) + b')'
+
+
+def _bytes_pattern(regex):
+    return re.compile(regex.pattern.encode('ISO-8859-1').replace(b'\xa0', NBSP))
+
+
+BYTES = {regex: _bytes_pattern(regex) for regex in [RATING_COUNT, ABV, WEIGHTED_AVG, OVERALL_SCORE, STYLE_SCORE]}
+REVIEW_BYTES = _bytes_pattern(REVIEW)
+
+# Beginning of a review up to the location, with short fields only, for the tokenizer
+REVIEW_HEAD = re.compile('([^o]*)' + ''.join(re.escape(delimiter) + '(\\d+)' for delimiter in REVIEW_DELIMITERS[:5]) +
+                         re.escape(REVIEW_DELIMITERS[5]) + '(.+?)' + re.escape(REVIEW_DELIMITERS[6]) + '(\\d+)' +
+                         re.escape(REVIEW_DELIMITERS[7]) + '(.+?)' + USER_RATINGS.pattern)
+
+# Anchor, delimiters, end of the user name, excluded character of the rating, test of the digits and pattern of the
+# beginning of a review for the tokenizer, on the unescaped text and on the raw HTML (where \d only matches ASCII
+# digits)
+TOKENS = (REVIEW_ANCHOR, REVIEW_DELIMITERS, USER_RATINGS, 'o', str.isdecimal, REVIEW_HEAD)
+TOKENS_BYTES = (REVIEW_ANCHOR.encode('ISO-8859-1'),
+                [None if delimiter is None else delimiter.encode('ISO-8859-1') for delimiter in REVIEW_DELIMITERS],
+                _bytes_pattern(USER_RATINGS), b'o', bytes.isdigit, _bytes_pattern(REVIEW_HEAD))
+
+# Character references, as found by html.unescape
+ENTITY = re.compile(b'&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)')
+
+# Ampersand which does not start one of the usual references. Those cannot change where the patterns match.
+OTHER_ENTITY = re.compile(b'&(?!(?:amp|quot|apos|#39|nbsp|#160|#xa0|#xA0);)')
+
+# Reference cut by one of the characters removed before REVIEW is searched
+CUT_ENTITY = re.compile(b'&[^\t\n\f <&#;]{0,31}[\r\n\t]')
+
+# Characters which change where the patterns match if they come from a reference (the markup, the numbers, the
+# separators and the characters excluded by [^o])
+STRUCTURAL = set('<>-o0123456789\xa0\r\n\t')
+
+
+def decode(content):
+    """
+    Transform the content of a page into a string with the HTML characters unescaped
+
+    :param content: bytes of the page
+    :return: string
+    """
+    return html.unescape(content.decode('ISO-8859-1'))
+
+
+def rating_count(html_txt):
+    """
+    Get the number of ratings on the first page of a beer
+
+    :param html_txt: unescaped HTML of the page
+    :return: number of ratings, -1 if it cannot be found
+    """
+    return _rating_count(_finder(html_txt))
+
+
+def beer_info(html_txt):
+    """
+    Get the information on the first page of a beer
+
+    :param html_txt: unescaped HTML of the page
+    :return: dict with nbr_ratings, abv, avg, overall_score and style_score
+    """
+    return _beer_info(_finder(html_txt))
+
+
+def beer_info_bytes(content):
+    """
+    Get the information on the first page of a beer without decoding the whole page
+
+    :param content: bytes of the page
+    :return: the same dict as beer_info(decode(content))
+    """
+    if not unescape_safe(content):
+        return beer_info(decode(content))
+
+    return _beer_info(_bytes_finder(content))
+
+
+def _finder(html_txt):
+    """
+    Search the patterns in the unescaped HTML
+
+    :param html_txt: unescaped HTML of the page
+    :return: function giving the first group of a pattern (None if it is not found)
+    """
+    def find(regex):
+        grp = regex.search(html_txt)
+        return None if grp is None else grp.group(1)
+
+    return find
+
+
+def _bytes_finder(content):
+    """
+    Search the byte patterns in the raw HTML
+
+    :param content: bytes of the page
+    :return: function giving the first group of a pattern, decoded and unescaped (None if it is not found)
+    """
+    def find(regex):
+        grp = BYTES[regex].search(content)
+        return None if grp is None else _text(grp.group(1))
+
+    return find
+
+
+def _rating_count(find):
+    value = find(RATING_COUNT)
+
+    try:
+        return int(value)
+    except TypeError:
+        return -1
+
+
+def _beer_info(find):
+    """
+    Get the information on the first page of a beer
+
+    :param find: function given by _finder or _bytes_finder
+    :return: dict with nbr_ratings, abv, avg, overall_score and style_score
+    """
+    nbr = _rating_count(find)
+
+    # Find the ABV
+    value = find(ABV)
+
+    try:
+        abv = float(value.replace('%', ''))
+    except (ValueError, AttributeError):
+        abv = np.nan
+
+    avg = np.nan
+    overall = np.nan
+    style = np.nan
+
+    if nbr != 0:
+        # Find the weighted average
+        value = find(WEIGHTED_AVG)
+
+        try:
+            avg = float(value)
+        except (ValueError, TypeError):
+            avg = np.nan
+
+        if nbr >= 10:
+            # Find the overall score
+            value = find(OVERALL_SCORE)
+
+            try:
+                overall = int(value)
+            except (ValueError, TypeError):
+                overall = np.nan
+
+            # Find the style score
+            value = find(STYLE_SCORE)
+
+            try:
+                style = int(value)
+            except (ValueError, TypeError):
+                style = np.nan
+
+    return {'nbr_ratings': nbr, 'abv': abv, 'avg': avg, 'overall_score': overall, 'style_score': style}
+
+
+def unescape_safe(content, removed=False):
+    """
+    Check that the byte patterns give the same groups on the raw HTML as the patterns on the unescaped HTML, i.e.
+    that no reference of the page is unescaped into a character of the markup.
+
+    :param content: bytes of the page
+    :param removed: the carriage returns, new lines and tabs are removed before the search
+    :return: True if the byte patterns can be used
+    """
+    if OTHER_ENTITY.search(content) is None:
+        return True
+
+    if removed and CUT_ENTITY.search(content) is not None:
+        return False
+
+    for ref in set(m.group(0) for m in ENTITY.finditer(content)):
+        if ref in NBSP_REFS:
+            continue
+
+        txt = ref.decode('ISO-8859-1')
+        unescaped = html.unescape(txt)
+        if unescaped != txt and (not STRUCTURAL.isdisjoint(unescaped) or any(c.isdecimal() for c in unescaped)):
+            return False
+
+    return True
+
+
+def _text(value):
+    """
+    Decode and unescape a group found by a byte pattern
+
+    :param value: bytes
+    :return: string
+    """
+    txt = value.decode('ISO-8859-1')
+    if b'&' in value:
+        txt = html.unescape(txt)
+
+    return txt
+
+
+def review_keys(html_txt):
+    """
+    Get the reviews on one page of a beer as pairs (user ID, date). A review edited or rated again by its user has a
+    new date, it is not the same review anymore.
+
+    :param html_txt: unescaped HTML of the page
+    :return: set with a tuple (user_id, date as written on the page) for each review
+    """
+    keys = set()
+    for g in tokenize_reviews(html_txt.replace('\r', '').replace('\n', '').replace('\t', '')):
+        if g[7] is None or g[11] is None or g[12] is None:
+            continue
+
+        try:
+            str_date, _ = review_date_text(g[11], g[12])
+        except (AttributeError, IndexError):
+            continue
+
+        keys.add((int(g[7]), str_date))
+
+    return keys
+
+
+def review_date_text(date, text):
+    """
+    Get the date of a review (the date of the update if the review was updated)
+
+    :param date: date of the review in REVIEW (after the location)
+    :param text: text of the review in REVIEW
+    :return: the date as written on the page and the text of the review without the update
+    """
+    if '<small style="color: #666666">UPDATED' in text:
+        # Update the date
+        str_ = '<small style="color: #666666">UPDATED: (.+?)</i></small> (.+)'
+        grp_txt = re.search(str_, text)
+
+        return grp_txt.group(1), grp_txt.group(2)
+
+    # Sometimes, the user will add a second position (or a job, not sure)
+    # Therefore, we simply split the str_date
+    splitted = date.split(' - ')
+
+    idx = 0
+
+    while not (', 20' in splitted[idx] or ', 19' in splitted[idx]):
+        idx += 1
+
+    return splitted[idx], text
+
+
+def reviews(html_txt):
+    """
+    Get the reviews on one page of a beer
+
+    :param html_txt: unescaped HTML of the page
+    :return: list with the groups of REVIEW for each review
+    """
+    html_txt = html_txt.replace('\r', '').replace('\n', '').replace('\t', '')
+
+    return [g.groups() for g in REVIEW.finditer(html_txt)]
+
+
+def reviews_bytes(content):
+    """
+    Get the reviews on one page of a beer without decoding the whole page. Only the groups are decoded and
+    unescaped.
+
+    :param content: bytes of the page
+    :return: the same list as reviews(decode(content))
+    """
+    if not unescape_safe(content, removed=True):
+        return reviews(decode(content))
+
+    content = content.translate(None, b'\r\n\t')
+
+    # The groups of a review are decoded at once, separated by a character which is not in the page
+    joined = b'\x00' not in content
+
+    found = []
+    for g in REVIEW_BYTES.finditer(content):
+        if joined:
+            values = b'\x00'.join(g.groups()).decode('ISO-8859-1').split('\x00')
+        else:
+            values = [value.decode('ISO-8859-1') for value in g.groups()]
+
+        if b'&' in g.group(0):
+            values = [html.unescape(value) if '&' in value else value for value in values]
+
+        found.append(tuple(values))
+
+    return found
+
+
+def tokenize_reviews(html_txt):
+    """
+    Cut the reviews on one page of a beer into their fields. The page is cut at the anchor at the beginning of each
+    review, then each field is taken up to its delimiter. A field which cannot be found is None, the other fields of
+    the review are kept. On a page where REVIEW finds all the reviews, the fields are the same as its groups.
+
+    :param html_txt: unescaped HTML of the page without the carriage returns, new lines and tabs
+    :return: list with a list of the 13 fields of each review (see REVIEW_FIELDS)
+    """
+    return _tokenize(html_txt, TOKENS)
+
+
+def tokenize_reviews_bytes(content):
+    """
+    Cut the reviews on one page of a beer into their fields without decoding the whole page. Only the fields are
+    decoded and unescaped.
+
+    :param content: bytes of the page
+    :return: the same list as tokenize_reviews on the unescaped page
+    """
+    if not unescape_safe(content, removed=True):
+        return tokenize_reviews(decode(content).replace('\r', '').replace('\n', '').replace('\t', ''))
+
+    content = content.translate(None, b'\r\n\t')
+
+    # The fields of a review are decoded at once, separated by a character which is not in the page
+    joined = b'\x00' not in content
+
+    found = []
+    for fields in _tokenize(content, TOKENS_BYTES):
+        if joined and None not in fields:
+            values = b'\x00'.join(fields).decode('ISO-8859-1').split('\x00')
+        else:
+            values = [None if value is None else value.decode('ISO-8859-1') for value in fields]
+
+        found.append([html.unescape(value) if value is not None and '&' in value else value for value in values])
+
+    return found
+
+
+def _tokenize(html_txt, tokens):
+    """
+    Cut the reviews into their fields, in a string or in bytes
+
+    :param html_txt: HTML of the page without the carriage returns, new lines and tabs
+    :param tokens: TOKENS or TOKENS_BYTES
+    :return: list with a list of the 13 fields of each review
+    """
+    anchor = tokens[0]
+
+    found = []
+
+    start = html_txt.find(anchor)
+    while start >= 0:
+        start += len(anchor)
+
+        # The review ends at the next anchor
+        nxt_review = html_txt.find(anchor, start)
+        stop = len(html_txt) if nxt_review < 0 else nxt_review
+
+        fields = _review(html_txt, start, stop, tokens)
+        if fields is None:
+            fields = _review_fields(html_txt, start, stop, tokens)
+
+        found.append(fields)
+        start = nxt_review
+
+    return found
+
+
+def _review(html_txt, start, stop, tokens):
+    """
+    Cut a review with all its fields
+
+    :return: list of the 13 fields, None if one of them is not found
+    """
+    anchor, delimiters, user_ratings, letter_o, digits, head = tokens
+
+    # Rating, scores, displayed rating, ID, name and number of ratings of the user
+    grp = head.match(html_txt, start, stop)
+    if grp is None:
+        return None
+
+    fields = list(grp.groups())
+    pos = grp.end()
+
+    # Location, date and text
+    for k in [10, 11, 12]:
+        end = html_txt.find(delimiters[k], pos + 1, stop)
+        if end < 0:
+            return None
+        fields.append(html_txt[pos:end])
+        pos = end + len(delimiters[k])
+
+    return fields
+
+
+def _review_fields(html_txt, start, stop, tokens):
+    """
+    Cut a review field by field. A field is None if it cannot be found.
+
+    :return: list of the 13 fields
+    """
+    anchor, delimiters, user_ratings, letter_o, digits, head = tokens
+
+    fields = [None]*13
+
+    # Start of the current field, -1 if the end of the previous field was not found
+    pos = start
+    # Where the next delimiter is searched
+    last = start
+
+    for k in range(13):
+        if k == 9:
+            continue
+
+        if k == 8:
+            # The user name ends with the number of ratings of the user
+            grp = user_ratings.search(html_txt, last + 1, stop)
+            if grp is None:
+                end = -1
+            else:
+                end = grp.start()
+                nxt = grp.end()
+                fields[9] = grp.group(1)
+        else:
+            # The rating can be empty, the other fields have at least one character
+            delimiter = delimiters[k]
+            end = html_txt.find(delimiter, last if k == 0 else last + 1, stop)
+            nxt = end + len(delimiter)
+
+        if end < 0:
+            pos = -1
+            continue
+
+        if pos >= 0:
+            value = html_txt[pos:end]
+            if k in REVIEW_DIGITS:
+                if digits(value):
+                    fields[k] = value
+            elif k != 0 or letter_o not in value:
+                fields[k] = value
+
+        pos = nxt
+        last = nxt
+
+    return fields
+
+
+def user_info(html_txt):
+    """
+    Get the raw information on the page of a user
+
+    :param html_txt: unescaped HTML of the page
+    :return: dict with the joining date and the location as written on the page (None if not found)
+    """
+    grp = MEMBER_SINCE.search(html_txt)
+    joined = None if grp is None else grp.group(1)
+
+    grp = LOCATION.search(html_txt)
+    location = None if grp is None else grp.group(1)
+
+    return {'joined': joined, 'location': location}
@@ -0,0 +1,284 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import sqlite3
+import json
+import time
+
+
+class Frontier:
+    """
+    Persistent queue with all the pages to crawl, saved in a SQLite file
+    """
+
+    PENDING = 'pending'
+    IN_PROGRESS = 'in_progress'
+    DONE = 'done'
+    # Dead letters: pages which permanently failed
+    FAILED = 'failed'
+
+    def __init__(self, filename):
+        """
+        Open (or create) the frontier.
+
+        :param filename: name of the SQLite file
+        """
+
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages ('
+                          'url TEXT PRIMARY KEY, '
+                          'kind TEXT NOT NULL, '
+                          'path TEXT NOT NULL, '
+                          'status TEXT NOT NULL, '
+                          'attempts INTEGER NOT NULL DEFAULT 0, '
+                          'last_fetch REAL, '
+                          'size INTEGER, '
+                          'priority INTEGER NOT NULL DEFAULT 0, '
+                          'data TEXT, '
+                          'error TEXT, '
+                          'cost INTEGER)')
+
+        # Frontiers created by older versions do not have all the columns
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(pages)')]
+        for column, type_ in [('error', 'TEXT'), ('cost', 'INTEGER')]:
+            if column not in columns:
+                self.conn.execute('ALTER TABLE pages ADD COLUMN {} {}'.format(column, type_))
+
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_queue ON pages (status, kind, priority)')
+
+        # Kinds of pages for which the whole work list has already been added
+        self.conn.execute('CREATE TABLE IF NOT EXISTS seeded (kind TEXT PRIMARY KEY, time REAL)')
+
+        # Information found on the first page of the beers while crawling them
+        self.conn.execute('CREATE TABLE IF NOT EXISTS beer_info ('
+                          'brewery_id INTEGER NOT NULL, '
+                          'beer_id INTEGER NOT NULL, '
+                          'nbr_ratings INTEGER, '
+                          'abv REAL, '
+                          'avg REAL, '
+                          'overall_score REAL, '
+                          'style_score REAL, '
+                          'time REAL, '
+                          'PRIMARY KEY (brewery_id, beer_id))')
+
+        # Pages claimed by a run that crashed go back in the queue
+        self.conn.execute('UPDATE pages SET status = ? WHERE status = ?', (self.PENDING, self.IN_PROGRESS))
+        self.conn.commit()
+
+    def is_seeded(self, kind):
+        """
+        Check if the work list for a kind of pages has already been added.
+
+        :param kind: kind of pages
+        :return: True if it has been seeded
+        """
+
+        cur = self.conn.execute('SELECT 1 FROM seeded WHERE kind = ?', (kind,))
+        return cur.fetchone() is not None
+
+    def mark_seeded(self, kind):
+        """
+        Remember that the work list for a kind of pages has been added.
+
+        :param kind: kind of pages
+        """
+
+        self.conn.execute('INSERT OR REPLACE INTO seeded VALUES (?, ?)', (kind, time.time()))
+        self.conn.commit()
+
+    def enqueue(self, pages):
+        """
+        Add pages to the frontier. Pages already in the frontier are ignored.
+
+        :param pages: iterable of tuples (url, kind, path, data, status) where data is a dict. The estimated number
+                      of requests for this page and the pages found in it is given by data['cost'] (default: 1,
+                      None if unknown). The pages with the highest data['priority'] are downloaded first (default: 0).
+        """
+
+        self.conn.executemany('INSERT OR IGNORE INTO pages (url, kind, path, data, status, cost, priority) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              ((url, kind, path, json.dumps(data), status, data.get('cost', 1),
+                                data.get('priority', 0))
+                               for url, kind, path, data, status in pages))
+        self.conn.commit()
+
+    def claim(self, kinds, n=1000, status=PENDING):
+        """
+        Take pending pages out of the queue.
+
+        :param kinds: list of kinds of pages
+        :param n: maximum number of pages
+        :param status: status of the pages to take (Frontier.FAILED to retry the dead letters)
+        :return: list of dict with the url, kind, path, attempts, priority and data of the pages
+        """
+
+        marks = ', '.join('?' for _ in kinds)
+        cur = self.conn.execute('SELECT url, kind, path, attempts, priority, data FROM pages '
+                                'WHERE status = ? AND kind IN ({}) '
+                                'ORDER BY priority DESC, rowid LIMIT ?'.format(marks),
+                                [status] + list(kinds) + [n])
+
+        pages = [{'url': row[0], 'kind': row[1], 'path': row[2], 'attempts': row[3], 'priority': row[4],
+                  'data': json.loads(row[5])}
+                 for row in cur.fetchall()]
+
+        self.conn.executemany('UPDATE pages SET status = ? WHERE url = ?',
+                              ((self.IN_PROGRESS, page['url']) for page in pages))
+        self.conn.commit()
+
+        return pages
+
+    def release(self, urls, status=PENDING):
+        """
+        Put claimed pages back in the queue.
+
+        :param urls: list of urls of the pages
+        :param status: status of the pages before they were claimed
+        """
+
+        self.conn.executemany('UPDATE pages SET status = ? WHERE url = ? AND status = ?',
+                              ((status, url, self.IN_PROGRESS) for url in urls))
+        self.conn.commit()
+
+    def set_priority(self, pages):
+        """
+        Change the priority of pages already in the frontier.
+
+        :param pages: iterable of tuples (url, priority)
+        """
+
+        self.conn.executemany('UPDATE pages SET priority = ? WHERE url = ?',
+                              ((priority, url) for url, priority in pages))
+        self.conn.commit()
+
+    def complete(self, url, size, attempts=1):
+        """
+        Mark a page as downloaded.
+
+        :param url: url of the page
+        :param size: number of bytes saved
+        :param attempts: number of requests done for this page
+        """
+
+        self.conn.execute('UPDATE pages SET status = ?, attempts = attempts + ?, last_fetch = ?, size = ?, '
+                          'error = NULL WHERE url = ?', (self.DONE, attempts, time.time(), size, url))
+        self.conn.commit()
+
+    def fail(self, url, error, attempts=1):
+        """
+        Mark a page as permanently failed, i.e. add it to the dead letters.
+
+        :param url: url of the page
+        :param error: description of the last error
+        :param attempts: number of requests done for this page
+        """
+
+        self.conn.execute('UPDATE pages SET status = ?, attempts = attempts + ?, last_fetch = ?, error = ? '
+                          'WHERE url = ?', (self.FAILED, attempts, time.time(), error, url))
+        self.conn.commit()
+
+    def dead_letters(self, kinds):
+        """
+        Get the pages which permanently failed.
+
+        :param kinds: list of kinds of pages
+        :return: list of tuples (url, kind, attempts, last_fetch, error)
+        """
+
+        marks = ', '.join('?' for _ in kinds)
+        cur = self.conn.execute('SELECT url, kind, attempts, last_fetch, error FROM pages '
+                                'WHERE status = ? AND kind IN ({}) ORDER BY rowid'.format(marks),
+                                [self.FAILED] + list(kinds))
+
+        return cur.fetchall()
+
+    def save_beer_info(self, brewery_id, beer_id, info):
+        """
+        Save the information found on the first page of a beer.
+
+        :param brewery_id: ID of the brewery
+        :param beer_id: ID of the beer
+        :param info: dict given by extract.beer_info
+        """
+
+        self.conn.execute('INSERT OR REPLACE INTO beer_info VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                          (brewery_id, beer_id, info['nbr_ratings'], info['abv'], info['avg'],
+                           info['overall_score'], info['style_score'], time.time()))
+        self.conn.commit()
+
+    def beer_infos(self):
+        """
+        Get the number of ratings of the beers already crawled and the time of the crawl.
+
+        :return: dict with (brewery_id, beer_id) as key and a dict with the nbr_ratings and the time as value
+        """
+
+        cur = self.conn.execute('SELECT brewery_id, beer_id, nbr_ratings, time FROM beer_info')
+
+        return {(row[0], row[1]): {'nbr_ratings': row[2], 'time': row[3]} for row in cur.fetchall()}
+
+    def beer_urls(self):
+        """
+        Get the url of the first page of all the beers in the frontier.
+
+        :return: dict with (brewery_id, beer_id) as key and the url as value
+        """
+
+        cur = self.conn.execute('SELECT url, data FROM pages WHERE kind = ?', ('beer',))
+
+        urls = {}
+        for url, data in cur.fetchall():
+            data = json.loads(data)
+            urls[(data['brewery_id'], data['beer_id'])] = url
+
+        return urls
+
+    def count(self, kinds, status=None):
+        """
+        Count the pages in the frontier.
+
+        :param kinds: list of kinds of pages
+        :param status: only count the pages with this status
+        :return: number of pages
+        """
+
+        marks = ', '.join('?' for _ in kinds)
+        query = 'SELECT COUNT(*) FROM pages WHERE kind IN ({})'.format(marks)
+        args = list(kinds)
+
+        if status is not None:
+            query += ' AND status = ?'
+            args.append(status)
+
+        return self.conn.execute(query, args).fetchone()[0]
+
+    def remaining(self, kinds, default_cost=1.0):
+        """
+        Estimate the number of requests still needed for the pages in the frontier.
+
+        :param kinds: list of kinds of pages
+        :param default_cost: cost of the pages for which it is unknown
+        :return: number of requests
+        """
+
+        marks = ', '.join('?' for _ in kinds)
+        cur = self.conn.execute('SELECT COUNT(*), COUNT(cost), SUM(cost) FROM pages '
+                                'WHERE status IN (?, ?) AND kind IN ({})'.format(marks),
+                                [self.PENDING, self.IN_PROGRESS] + list(kinds))
+        count, known, cost = cur.fetchone()
+
+        return (cost or 0) + (count - known)*default_cost
+
+    def close(self):
+        """
+        Close the SQLite file.
+        """
+
+        self.conn.close()
@@ -7,6 +7,11 @@
 
 import numpy as np
 import gzip
+import re
+import os
+
+# Pages of a beer downloaded by an incremental crawl: refresh{generation}_{page}.html
+REFRESH_PAGE = re.compile('^refresh(\d+)_(\d+)\.html$')
 
 
 def round_(x, base=50):
@@ -19,6 +24,68 @@ def round_(x, base=50):
     return int(base * np.floor(float(x)/base))
 
 
+def write_atomic(path, content):
+    """
+    Write the content in a temporary file and move it to its final name.
+    A crash never leaves a half-written file behind.
+
+    :param path: name of the file
+    :param content: bytes to write
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as output:
+        output.write(content)
+    os.replace(tmp, path)
+
+
+def beer_pages(files):
+    """
+    Sort the pages of a beer in the order used by the parser: the pages of the incremental crawls (the newest
+    first), then the pages of the first crawl.
+
+    :param files: names of the files in the folder of the beer
+    :return: list with the names of the HTML files
+    """
+    refresh = []
+    first = []
+    for file in files:
+        if not file.endswith('.html'):
+            continue
+
+        grp = REFRESH_PAGE.match(file)
+        if grp is not None:
+            refresh.append((-int(grp.group(1)), int(grp.group(2)), file))
+        else:
+            first.append(file)
+
+    first.sort()
+    return [file for _, _, file in sorted(refresh)] + first
+
+
+def first_page(files, generation=None):
+    """
+    Get the newest first page of a beer
+
+    :param files: names of the files in the folder of the beer
+    :param generation: ignore the incremental crawls from this generation on
+    :return: name of the file, None if there is no first page
+    """
+    best = None
+    for file in files:
+        grp = REFRESH_PAGE.match(file)
+        if grp is not None and int(grp.group(2)) == 1:
+            gen = int(grp.group(1))
+            if (generation is None or gen < generation) and (best is None or gen > best[0]):
+                best = (gen, file)
+
+    if best is not None:
+        return best[1]
+    elif '1.html' in files:
+        return '1.html'
+    else:
+        return None
+
+
 def parse(filename):
     """
     Parse a txt.gz file and return a generator for it
@@ -0,0 +1,446 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Random access index of ratings.txt.gz. One pass over the file writes a       ##
+##      sidecar index with the checkpoints of the decompressor and the offsets of     ##
+##      the ratings of each beer and each user, such that the ratings of one beer     ##
+##      or one user are read without decompressing the file from the beginning.      ##
+##                                                                                    ##
+########################################################################################
+
+from classes.ratings import parse_block, FIELDS, TYPES
+import bisect
+import sqlite3
+import zlib
+import re
+import os
+
+# Lines of beer_id and user_id in a record
+BEER_LINE = FIELDS.index('beer_id')
+USER_LINE = FIELDS.index('user_id')
+
+BEER_ID = re.compile(rb'(?:^|\n)beer_id: (\d+)')
+USER_ID = re.compile(rb'(?:^|\n)user_id: (\d+)')
+
+
+def _indexed_gzip():
+    """
+    Import indexed_gzip if it is installed.
+
+    :return: the module indexed_gzip or None
+    """
+
+    try:
+        import indexed_gzip
+    except ImportError:
+        return None
+
+    return indexed_gzip
+
+
+class _Members:
+    """
+    Decompress a GZIP file and keep the start of each of its GZIP members (compressed and uncompressed offsets).
+    A new member starts with an empty window: the decompression can start again there. The files written by step 7
+    have one member per batch of beers.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.checkpoints = []
+
+        self.compressed = 0
+        self.uncompressed = 0
+
+        self.decompressor = None
+        self.pending = b''
+
+    def read(self, size):
+        """
+        Decompress about size bytes (less at the end of the file).
+        """
+
+        blocks = []
+        nbr = 0
+        while nbr < size:
+            if len(self.pending) == 0:
+                self.pending = self.file.read(2**20)
+                if len(self.pending) == 0:
+                    break
+
+            if self.decompressor is None:
+                self.checkpoints.append((self.compressed, self.uncompressed))
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+            block = self.decompressor.decompress(self.pending)
+
+            self.compressed += len(self.pending) - len(self.decompressor.unused_data)
+            self.pending = self.decompressor.unused_data
+            if self.decompressor.eof:
+                self.decompressor = None
+
+            self.uncompressed += len(block)
+            nbr += len(block)
+            blocks.append(block)
+
+        return b''.join(blocks)
+
+    def close(self):
+        self.file.close()
+
+
+def build_index(ratings, spacing=2**22, size=2**24):
+    """
+    Build the index of ratings.txt.gz in one pass over the file. The original file is not modified.
+
+    The index is saved in {ratings}.idx (SQLite). With indexed_gzip, the window of the decompressor is saved every
+    spacing bytes in {ratings}.gzidx, such that the reading can start anywhere in the file. Without it, the reading
+    starts at the beginning of a GZIP member.
+
+    :param ratings: name of ratings.txt.gz
+    :param spacing: number of uncompressed bytes between two checkpoints of the decompressor (indexed_gzip)
+    :param size: number of bytes decompressed at once
+    :return: dict with the number of ratings, beers, users and checkpoints and the uncompressed size of the file
+    """
+
+    igzip = _indexed_gzip()
+
+    filename = ratings + '.idx'
+    if os.path.exists(filename + '.tmp'):
+        os.remove(filename + '.tmp')
+
+    conn = sqlite3.connect(filename + '.tmp')
+    conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value)')
+    # Ratings of a beer are contiguous in the file: one row per run of ratings
+    conn.execute('CREATE TABLE beers (beer_id INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, '
+                 'count INTEGER NOT NULL)')
+    conn.execute('CREATE TABLE users (user_id INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL)')
+    conn.execute('CREATE TABLE checkpoints (compressed INTEGER NOT NULL, uncompressed INTEGER NOT NULL)')
+
+    if igzip is not None:
+        f = igzip.IndexedGzipFile(ratings, spacing=spacing)
+    else:
+        f = _Members(ratings)
+
+    nbr = 0
+    # Current run of ratings of a beer: [beer_id, offset, length, count]
+    run = None
+    beers = []
+    users = []
+
+    offset = 0
+    rest = b''
+    while True:
+        block = f.read(size)
+
+        if len(block) == 0:
+            break
+
+        block = rest + block
+
+        end = block.rfind(b'\n\n')
+        if end == -1:
+            rest = block
+            continue
+
+        rest = block[end + 2:]
+
+        # The last part is empty (the block ends with an empty line)
+        for record in block[:end].split(b'\n\n'):
+            length = len(record) + 2
+            beer_id, user_id = _ids(record)
+
+            if run is not None and run[0] == beer_id and run[1] + run[2] == offset:
+                run[2] += length
+                run[3] += 1
+            else:
+                if run is not None:
+                    beers.append(tuple(run))
+                run = [beer_id, offset, length, 1]
+
+            users.append((user_id, offset, length))
+
+            offset += length
+            nbr += 1
+
+        if len(users) >= 2**16:
+            conn.executemany('INSERT INTO beers VALUES (?, ?, ?, ?)', beers)
+            conn.executemany('INSERT INTO users VALUES (?, ?, ?)', users)
+            beers = []
+            users = []
+
+    if run is not None:
+        beers.append(tuple(run))
+
+    conn.executemany('INSERT INTO beers VALUES (?, ?, ?, ?)', beers)
+    conn.executemany('INSERT INTO users VALUES (?, ?, ?)', users)
+
+    if igzip is not None:
+        f.export_index(ratings + '.gzidx')
+        checkpoints = []
+    else:
+        checkpoints = f.checkpoints
+    f.close()
+
+    conn.executemany('INSERT INTO checkpoints VALUES (?, ?)', checkpoints)
+
+    conn.execute('CREATE INDEX beers_id ON beers (beer_id)')
+    conn.execute('CREATE INDEX users_id ON users (user_id)')
+
+    # The index is only valid for this version of the file
+    st = os.stat(ratings)
+    meta = {'size': st.st_size, 'mtime': st.st_mtime, 'gzidx': int(igzip is not None), 'spacing': spacing,
+            'nbr_ratings': nbr}
+    conn.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+
+    conn.commit()
+
+    nbr_beers = conn.execute('SELECT COUNT(DISTINCT beer_id) FROM beers').fetchone()[0]
+    nbr_users = conn.execute('SELECT COUNT(DISTINCT user_id) FROM users').fetchone()[0]
+    conn.close()
+
+    os.replace(filename + '.tmp', filename)
+
+    return {'ratings': nbr, 'beers': nbr_beers, 'users': nbr_users,
+            'checkpoints': len(checkpoints) if igzip is None else 'indexed_gzip', 'size': offset}
+
+
+def _ids(record):
+    """
+    Get the beer_id and the user_id of a record.
+
+    :param record: bytes of the record (without the empty line at the end)
+    :return: beer_id, user_id
+    """
+
+    lines = record.split(b'\n', USER_LINE + 1)
+
+    if len(lines) > USER_LINE and lines[BEER_LINE].startswith(b'beer_id: ') \
+            and lines[USER_LINE].startswith(b'user_id: '):
+        return int(lines[BEER_LINE][9:]), int(lines[USER_LINE][9:])
+
+    # Record without one line per field
+    return int(BEER_ID.search(record).group(1)), int(USER_ID.search(record).group(1))
+
+
+class RatingsIndex:
+    """
+    Read the ratings of one beer or one user of ratings.txt.gz with the index written by build_index.
+    """
+
+    def __init__(self, ratings):
+        """
+        Open the index of ratings.txt.gz.
+
+        :param ratings: name of ratings.txt.gz
+        """
+
+        self.ratings = ratings
+
+        filename = ratings + '.idx'
+        if not os.path.exists(filename):
+            raise IOError('No index of {}, build it with build_index'.format(ratings))
+
+        self.conn = sqlite3.connect(filename)
+        meta = dict(self.conn.execute('SELECT key, value FROM meta').fetchall())
+
+        st = os.stat(ratings)
+        if (st.st_size, st.st_mtime) != (meta['size'], meta['mtime']):
+            raise IOError('The index of {} is older than the file, build it again with build_index'.format(ratings))
+
+        self.nbr_ratings = meta['nbr_ratings']
+
+        self.file = None
+        self.checkpoints = None
+        if meta['gzidx']:
+            igzip = _indexed_gzip()
+            if igzip is not None and os.path.exists(ratings + '.gzidx'):
+                self.file = igzip.IndexedGzipFile(ratings, index_file=ratings + '.gzidx')
+
+        if self.file is None:
+            self.checkpoints = self.conn.execute('SELECT uncompressed, compressed FROM checkpoints '
+                                                 'ORDER BY uncompressed').fetchall()
+            if len(self.checkpoints) == 0:
+                # Index written with indexed_gzip, read without it
+                self.checkpoints = [(0, 0)]
+            self.file = open(ratings, 'rb')
+
+        # Decompressing less than half the spacing of the checkpoints is faster than a seek
+        self.gap = meta['spacing']//2
+
+    def beer(self, beer_id, fields=None):
+        """
+        Read the ratings of a beer.
+
+        :param beer_id: ID of the beer
+        :param fields: list of the fields to read (default: all of them)
+        :return: list of dict with the value of each field
+        """
+
+        rows = self.conn.execute('SELECT offset, length FROM beers WHERE beer_id = ? ORDER BY offset',
+                                 (beer_id,)).fetchall()
+
+        return self._ratings(rows, fields)
+
+    def user(self, user_id, fields=None):
+        """
+        Read the ratings of a user.
+
+        :param user_id: ID of the user
+        :param fields: list of the fields to read (default: all of them)
+        :return: list of dict with the value of each field
+        """
+
+        rows = self.conn.execute('SELECT offset, length FROM users WHERE user_id = ? ORDER BY offset',
+                                 (user_id,)).fetchall()
+
+        return self._ratings(rows, fields)
+
+    def _ratings(self, rows, fields):
+        """
+        Read the records at the given offsets.
+
+        :param rows: list of (offset, length) sorted by offset
+        :param fields: list of the fields to read
+        :return: list of dict with the value of each field
+        """
+
+        if fields is None:
+            fields = FIELDS
+
+        for field in fields:
+            if field not in TYPES:
+                raise ValueError('Unknown field {} in ratings.txt.gz'.format(field))
+
+        if self.checkpoints is not None:
+            # One decompression for all the rows, started again only at a GZIP member closer to the next row
+            stream = None
+            records = []
+            for offset, length in rows:
+                if stream is None or offset < stream.start or self._checkpoint(offset) > stream.start:
+                    stream = self._stream(offset)
+                records.append(stream.read(offset, length))
+
+            return parse_block(b''.join(records), fields)
+
+        # Without a seek when the next row is closer than the checkpoints of indexed_gzip
+        records = []
+        position = None
+        for offset, length in rows:
+            if position is None or offset < position or offset - position >= self.gap:
+                self.file.seek(offset)
+            else:
+                self.file.read(offset - position)
+            records.append(self.file.read(length))
+            position = offset + length
+
+        return parse_block(b''.join(records), fields)
+
+    def read(self, offset, length):
+        """
+        Read bytes of the decompressed file.
+
+        :param offset: position in the decompressed file
+        :param length: number of bytes
+        :return: bytes
+        """
+
+        if self.checkpoints is None:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+        return self._stream(offset).read(offset, length)
+
+    def _checkpoint(self, offset):
+        """
+        Get the position of the last GZIP member before an offset.
+
+        :param offset: position in the decompressed file
+        :return: position in the decompressed file
+        """
+
+        return self.checkpoints[bisect.bisect_right(self.checkpoints, (offset, float('inf'))) - 1][0]
+
+    def _stream(self, offset):
+        """
+        Start the decompression at the last GZIP member before an offset.
+
+        :param offset: position in the decompressed file
+        :return: _Stream
+        """
+
+        k = bisect.bisect_right(self.checkpoints, (offset, float('inf'))) - 1
+        uncompressed, compressed = self.checkpoints[k]
+
+        return _Stream(self.file, compressed, uncompressed)
+
+    def close(self):
+        self.file.close()
+        self.conn.close()
+
+
+class _Stream:
+    """
+    Decompression of a GZIP file from the beginning of one of its members, read forward.
+    """
+
+    def __init__(self, file, compressed, uncompressed):
+        """
+        :param file: GZIP file opened in binary mode
+        :param compressed: position of the GZIP member in the file
+        :param uncompressed: position of the GZIP member in the decompressed file
+        """
+
+        self.file = file
+        self.position = compressed
+
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        # Decompressed bytes not read yet, starting at start
+        self.buffer = b''
+        self.start = uncompressed
+
+    def read(self, offset, length):
+        """
+        Read bytes of the decompressed file after the ones already read.
+
+        :param offset: position in the decompressed file
+        :param length: number of bytes
+        :return: bytes
+        """
+
+        end = offset + length
+        while self.start + len(self.buffer) < end:
+            data = b''
+            if self.decompressor.eof:
+                # Next GZIP member
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+            if len(data) == 0:
+                self.file.seek(self.position)
+                data = self.file.read(2**16)
+                if len(data) == 0:
+                    break
+                self.position += len(data)
+
+            block = self.decompressor.decompress(data)
+
+            if self.start + len(self.buffer) <= offset:
+                # Bytes before the offset
+                self.start += len(self.buffer)
+                self.buffer = block
+            else:
+                self.buffer += block
+
+        data = self.buffer[offset - self.start:end - self.start]
+
+        self.buffer = self.buffer[end - self.start:]
+        self.start = end
+
+        return data
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Normalization of the locations written by the users on their page. The       ##
+##      places which are not countries or US states (mostly cities) are mapped with   ##
+##      the table in locations.csv.                                                   ##
+##                                                                                    ##
+########################################################################################
+
+import numpy as np
+import csv
+import os
+
+# Table of the places given by the users: place,location (an empty location means that the place is unknown)
+LOCATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locations.csv')
+
+
+class Locations:
+    """
+    Transform the location of a user into a country (or 'United States, {state}'):
+
+    1. the place is the last part of the location, after ', '
+    2. a US state becomes 'United States, {state}'
+    3. the place is replaced with the one in the table (np.nan if it is unknown)
+    4. the country gets its conventional name
+
+    Each location is transformed once, the results are kept.
+    """
+
+    def __init__(self, us_states, country_to_change, files=None, known=None):
+        """
+        Load the table.
+
+        :param us_states: list of the US states
+        :param country_to_change: dict with the conventional name of some countries
+        :param files: list of CSV files with more rows (place,location), applied after locations.csv. A place in
+                      several files gets the location of the last one.
+        :param known: set of the places which are normalized (e.g. the locations of the breweries). The other places
+                      are counted in unmapped (default: no count).
+        """
+
+        self.us_states = set(us_states)
+        self.country_to_change = country_to_change
+
+        self.table = {}
+        for file in [LOCATIONS_FILE] + list(files or []):
+            self.load(file)
+
+        self.known = known
+        if self.known is not None:
+            self.known = set(self.known) | set(v for v in self.table.values() if isinstance(v, str))
+            self.known.update('United States, ' + state for state in self.us_states)
+
+        # Results for each location as written on the page: (place, True if it is unmapped)
+        self.cache = {}
+
+        # Number of users for each unmapped place
+        self.unmapped = {}
+
+    def load(self, file):
+        """
+        Add the rows of a CSV file to the table.
+
+        :param file: CSV file with the columns place and location
+        """
+
+        with open(file, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                self.table[row['place']] = row['location'] if row['location'] != '' else np.nan
+
+    def normalize(self, location):
+        """
+        Normalize the location of a user.
+
+        :param location: location as written on the page (None if there is none)
+        :return: country, 'United States, {state}' or np.nan
+        """
+
+        try:
+            place, unmapped = self.cache[location]
+        except KeyError:
+            place, unmapped = self._normalize(location)
+            self.cache[location] = place, unmapped
+
+        if unmapped:
+            self.unmapped[place] = self.unmapped.get(place, 0) + 1
+
+        return place
+
+    def _normalize(self, location):
+        if location is None:
+            return np.nan, False
+
+        place = location.replace('\n', '').replace('\r', '').replace('\t', '')
+
+        # Remove the space at the end of the string
+        place = place.rstrip(' ')
+        if place == '':
+            return np.nan, False
+
+        place = place.split(', ')[-1]
+
+        if place in self.us_states:
+            place = 'United States, ' + place
+
+        if place in self.table:
+            place = self.table[place]
+
+        # Change to conventional name
+        if place in self.country_to_change:
+            place = self.country_to_change[place]
+
+        unmapped = self.known is not None and isinstance(place, str) and place not in self.known
+
+        return place, unmapped
+
+    def report(self):
+        """
+        Get the unmapped places, to add them to the table
+
+        :return: list of (place, number of users), the most frequent first
+        """
+
+        return sorted(self.unmapped.items(), key=lambda x: (-x[1], x[0]))
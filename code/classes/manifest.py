@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Manifest of the pages parsed by each step of the Parser. It keeps the        ##
+##      size, the modification time and the hash of the pages of each brewery, beer   ##
+##      or user with what the step found in them, such that a new run only parses     ##
+##      the pages which changed.                                                      ##
+##                                                                                    ##
+########################################################################################
+
+import sqlite3
+import json
+import os
+
+
+class Manifest:
+    """
+    Pages parsed by the steps of the Parser, saved in data_folder/misc/manifest.db.
+
+    Each step has units (a brewery, a beer or a user) identified by a key. For each unit, the manifest keeps its pages
+    (size, modification time and hash), the values of the CSV files used to parse it (extra) and its output, i.e.
+    what the step found in the pages. A unit has not changed if it has the same pages with the same content and the
+    same extra values: its output can be used instead of parsing it again.
+
+    The hash of a page is only computed when its size is the same but not its modification time (e.g. a page
+    downloaded again with the same content). The PageStore gives the CRC32 of the pages for free.
+    """
+
+    def __init__(self, data_folder, store):
+        """
+        Open (or create) the manifest.
+
+        :param data_folder: Folder with the data
+        :param store: storage of the pages (FileStore or PageStore)
+        """
+
+        self.data_folder = data_folder
+        self.store = store
+
+        folder = data_folder + 'misc/'
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.conn = sqlite3.connect(folder + 'manifest.db')
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        self.conn.execute('CREATE TABLE IF NOT EXISTS units ('
+                          'step TEXT NOT NULL, '
+                          'key TEXT NOT NULL, '
+                          'inputs TEXT NOT NULL, '
+                          'extra TEXT NOT NULL, '
+                          'output TEXT NOT NULL, '
+                          'PRIMARY KEY (step, key))')
+
+        # Files written by the steps which are patched (not rebuilt) by the next run
+        self.conn.execute('CREATE TABLE IF NOT EXISTS outputs ('
+                          'step TEXT PRIMARY KEY, '
+                          'size INTEGER NOT NULL, '
+                          'mtime REAL NOT NULL)')
+        self.conn.commit()
+
+        # Units of the step loaded with load: key -> (inputs, extra, output) as JSON
+        self.step = None
+        self.units = {}
+        # Units parsed in this run
+        self.updates = {}
+
+    def load(self, step, full=False):
+        """
+        Load the units of a step.
+
+        :param step: name of the step
+        :param full: Forget the units, such that all of them are parsed again
+        """
+
+        self.step = step
+        self.updates = {}
+
+        if full:
+            self.clear(step)
+            self.units = {}
+        else:
+            cur = self.conn.execute('SELECT key, inputs, extra, output FROM units WHERE step = ?', (step,))
+            self.units = {row[0]: row[1:] for row in cur.fetchall()}
+
+    def check(self, key, paths, extra=None):
+        """
+        Check if a unit changed since the last run.
+
+        :param key: key of the unit
+        :param paths: names of the pages of the unit
+        :param extra: values (of the CSV files) used to parse the unit
+        :return: True if it changed, the state of its pages (for update) and its last output (None if it changed)
+        """
+
+        extra = json.dumps(extra)
+
+        if key in self.units:
+            inputs, last_extra, output = self.units[key]
+            inputs = json.loads(inputs)
+        else:
+            inputs, last_extra, output = {}, None, None
+
+        changed = last_extra != extra or len(inputs) != len(paths)
+
+        state = {}
+        for path in paths:
+            name = os.path.relpath(path, self.data_folder).replace(os.sep, '/')
+            state[name], same = self.compare(path, inputs.get(name))
+            changed = changed or not same
+
+        if changed:
+            return True, state, None
+
+        if state != inputs:
+            # Pages written again with the same content: the new modification times are kept
+            self.updates[key] = (json.dumps(state), extra, output)
+
+        return False, state, json.loads(output)
+
+    def compare(self, path, last):
+        """
+        Compare a page with its last state.
+
+        :param path: name of the page
+        :param last: list with the size, the modification time and the hash of the page (None if it is new)
+        :return: the current state of the page and True if the content is the same
+        """
+
+        size, mtime, hash_ = self.store.stat(path)
+
+        if last is None or size != last[0]:
+            return [size, mtime, hash_], False
+
+        if hash_ is not None:
+            return [size, mtime, hash_], hash_ == last[2]
+
+        if mtime == last[1]:
+            return last, True
+
+        # Same size but written again
+        hash_ = self.store.hash(path)
+        return [size, mtime, hash_], hash_ == last[2]
+
+    def update(self, key, state, output, extra=None):
+        """
+        Keep the output of a unit (saved with save).
+
+        :param key: key of the unit
+        :param state: state of its pages given by check
+        :param output: what the step found in the pages (JSON serializable)
+        :param extra: values (of the CSV files) used to parse the unit
+        """
+
+        self.updates[key] = (json.dumps(state), json.dumps(extra), json.dumps(output))
+
+    def save(self, keys):
+        """
+        Save the units updated in this run and delete the units which are not in the step anymore.
+
+        :param keys: keys of all the units of the step
+        """
+
+        keys = set(keys)
+
+        self.conn.executemany('INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?)',
+                              ((self.step, key) + values for key, values in self.updates.items()))
+
+        # The units which are not in the step anymore
+        removed = [key for key in self.units if key not in keys and key not in self.updates]
+        self.conn.executemany('DELETE FROM units WHERE step = ? AND key = ?', ((self.step, key) for key in removed))
+
+        self.conn.commit()
+
+        for key, values in self.updates.items():
+            self.units[key] = values
+        for key in removed:
+            del self.units[key]
+        self.updates = {}
+
+    def clear(self, step):
+        """
+        Forget all the units of a step.
+
+        :param step: name of the step
+        """
+
+        self.conn.execute('DELETE FROM units WHERE step = ?', (step,))
+        self.conn.execute('DELETE FROM outputs WHERE step = ?', (step,))
+        self.conn.commit()
+
+    def output_unchanged(self, step, path):
+        """
+        Check that a file written by a step was not modified since.
+
+        :param step: name of the step
+        :param path: name of the file
+        :return: True if it has the size and the modification time saved with set_output
+        """
+
+        row = self.conn.execute('SELECT size, mtime FROM outputs WHERE step = ?', (step,)).fetchone()
+
+        if row is None or not os.path.exists(path):
+            return False
+
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime) == tuple(row)
+
+    def set_output(self, step, path):
+        """
+        Save the size and the modification time of a file written by a step.
+
+        :param step: name of the step
+        :param path: name of the file
+        """
+
+        st = os.stat(path)
+        self.conn.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)', (step, st.st_size, st.st_mtime))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
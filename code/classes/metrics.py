@@ -0,0 +1,261 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import datetime
+import math
+import json
+import time
+import os
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with logarithmic buckets (10 buckets per decade, from 0.1 ms to 10'000 s)
+    """
+
+    min_latency = 1e-4
+    nbr_buckets = 80
+
+    def __init__(self):
+        """
+        Initialize the histogram.
+        """
+
+        self.counts = [0]*self.nbr_buckets
+        self.total = 0
+
+    def add(self, latency):
+        """
+        Add one latency to the histogram.
+
+        :param latency: latency in seconds
+        """
+
+        if latency <= self.min_latency:
+            idx = 0
+        else:
+            idx = min(int(10*math.log10(latency/self.min_latency)), self.nbr_buckets - 1)
+
+        self.counts[idx] += 1
+        self.total += 1
+
+    def quantile(self, q):
+        """
+        Get a quantile of the latencies.
+
+        :param q: quantile between 0 and 1
+        :return: upper bound of the bucket containing the quantile, in seconds (None if the histogram is empty)
+        """
+
+        if self.total == 0:
+            return None
+
+        target = q*self.total
+        cumul = 0
+        for idx, count in enumerate(self.counts):
+            cumul += count
+            if cumul >= target:
+                return self.min_latency*10**((idx + 1)/10)
+
+        return self.min_latency*10**(self.nbr_buckets/10)
+
+
+class StepMetrics:
+    """
+    Counters for one step
+    """
+
+    def __init__(self, name, remaining=None):
+        """
+        Initialize the counters.
+
+        :param name: name of the step
+        :param remaining: function returning the remaining work (number of pages) for this step
+        """
+
+        self.name = name
+        self.remaining = remaining
+
+        self.start = time.time()
+        self.stop = None
+
+        self.pages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+    def snapshot(self):
+        """
+        Get the current values of the counters
+
+        :return: dict with the counters, the throughput, the latencies and the ETA
+        """
+
+        end = time.time() if self.stop is None else self.stop
+        elapsed = max(end - self.start, 1e-9)
+
+        pages_sec = self.pages/elapsed
+
+        if self.remaining is not None and self.stop is None:
+            remaining = self.remaining()
+        else:
+            remaining = 0
+
+        if remaining == 0:
+            eta = 0.0
+        elif pages_sec > 0:
+            eta = remaining/pages_sec
+        else:
+            eta = None
+
+        return {'step': self.name,
+                'time': time.time(),
+                'elapsed': elapsed,
+                'pages': self.pages,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'pages_sec': pages_sec,
+                'bytes_sec': self.bytes/elapsed,
+                'error_rate': self.errors/self.pages if self.pages > 0 else 0.0,
+                'p50': self.latency.quantile(0.5),
+                'p99': self.latency.quantile(0.99),
+                'remaining': remaining,
+                'eta': eta}
+
+
+class Metrics:
+    """
+    Telemetry of the Crawler and the Parser: throughput, latencies and ETA for each step.
+    Snapshots are written periodically in a JSON file (last snapshot of each step) and a CSV file (history).
+    """
+
+    columns = ['step', 'time', 'elapsed', 'pages', 'bytes', 'errors', 'pages_sec', 'bytes_sec', 'error_rate', 'p50',
+               'p99', 'remaining', 'eta']
+
+    def __init__(self, filename, interval=60, verbose=True):
+        """
+        Initialize the metrics.
+
+        :param filename: name of the files without extension (.json and .csv are added)
+        :param interval: Time in seconds between two snapshots
+        :param verbose: Print a line with the snapshot
+        """
+
+        self.filename = filename
+        self.interval = interval
+        self.verbose = verbose
+
+        self.steps = {}
+        self.current = None
+        self.last_write = time.monotonic()
+
+    def start(self, name, remaining=None, total=None):
+        """
+        Start the counters for a step.
+
+        :param name: name of the step
+        :param remaining: function returning the remaining work (number of pages) for this step
+        :param total: total work (number of pages) for this step, if remaining is not given
+        """
+
+        self.current = StepMetrics(name, remaining)
+        if remaining is None and total is not None:
+            step = self.current
+            step.remaining = lambda: max(total - step.pages, 0)
+        self.steps[name] = self.current
+        self.last_write = time.monotonic()
+
+    def record(self, latency=None, nbytes=0, error=False, pages=1):
+        """
+        Record some work done in the current step.
+
+        :param latency: time in seconds to get (or parse) the page
+        :param nbytes: number of bytes downloaded (or read)
+        :param error: True if it failed
+        :param pages: number of pages
+        """
+
+        step = self.current
+        if step is None:
+            return
+
+        step.pages += pages
+        step.bytes += nbytes
+        if error:
+            step.errors += 1
+        if latency is not None:
+            step.latency.add(latency)
+
+        if time.monotonic() - self.last_write > self.interval:
+            self.write()
+
+    def finish(self):
+        """
+        Stop the counters of the current step and write the last snapshot.
+        """
+
+        if self.current is None:
+            return
+
+        self.current.stop = time.time()
+        self.write()
+        self.current = None
+
+    def write(self):
+        """
+        Write a snapshot of the current step.
+        """
+
+        self.last_write = time.monotonic()
+
+        if self.current is None:
+            return
+
+        snap = self.current.snapshot()
+
+        folder = os.path.dirname(self.filename)
+        if folder != '' and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # Last snapshot of all the steps
+        snaps = {name: step.snapshot() for name, step in self.steps.items()}
+        tmp = self.filename + '.json.tmp'
+        with open(tmp, 'w') as output:
+            json.dump(snaps, output, indent=2)
+        os.replace(tmp, self.filename + '.json')
+
+        # History
+        new = not os.path.exists(self.filename + '.csv')
+        with open(self.filename + '.csv', 'a') as output:
+            if new:
+                output.write(','.join(self.columns) + '\n')
+            output.write(','.join('' if snap[c] is None else str(snap[c]) for c in self.columns) + '\n')
+
+        if self.verbose:
+            print(self.format(snap))
+
+    @staticmethod
+    def format(snap):
+        """
+        Transform a snapshot into a line of text
+
+        :param snap: dict given by StepMetrics.snapshot
+        :return: string
+        """
+
+        def sec(x):
+            return '-' if x is None else '{:.3f}s'.format(x)
+
+        if snap['eta'] is None:
+            eta = '-'
+        else:
+            eta = str(datetime.timedelta(seconds=int(snap['eta'])))
+
+        return '[{}] {:d} pages, {:.2f} pages/s, {:.1f} kB/s, p50 {}, p99 {}, errors {:.2%}, ' \
+               'remaining {:d}, ETA {}'.format(snap['step'], snap['pages'], snap['pages_sec'],
+                                               snap['bytes_sec']/1000, sec(snap['p50']), sec(snap['p99']),
+                                               snap['error_rate'], int(snap['remaining']), eta)
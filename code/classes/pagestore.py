@@ -0,0 +1,446 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Storage of the HTML pages. FileStore keeps one file per page (the layout     ##
+##      of the first crawls). PageStore appends the compressed pages to large         ##
+##      segment files with an index in SQLite.                                        ##
+##                                                                                    ##
+########################################################################################
+
+from classes.helpers import write_atomic
+import hashlib
+import sqlite3
+import struct
+import zlib
+import time
+import os
+
+
+class FileStore:
+    """
+    One file per page, e.g. beers/{brewery_id}/{beer_id}/{page}.html
+    """
+
+    def write(self, path, content):
+        """
+        Save a page.
+
+        :param path: name of the file
+        :param content: bytes of the page
+        """
+
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        write_atomic(path, content)
+
+    def read(self, path):
+        """
+        Read a page.
+
+        :param path: name of the file
+        :return: bytes of the page
+        """
+
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def exists(self, path):
+        """
+        Check if a page was saved.
+
+        :param path: name of the file
+        :return: True if the file exists and is not empty
+        """
+
+        return os.path.exists(path) and os.stat(path).st_size > 0
+
+    def stat(self, path):
+        """
+        Get the size and the modification time of a page.
+
+        :param path: name of the file
+        :return: tuple (size, modification time, hash of the content or None if it must be computed with hash)
+        """
+
+        st = os.stat(path)
+        return st.st_size, st.st_mtime, None
+
+    def hash(self, path):
+        """
+        Get the hash of the content of a page.
+
+        :param path: name of the file
+        :return: SHA-1 of the content (hexadecimal)
+        """
+
+        return hashlib.sha1(self.read(path)).hexdigest()
+
+    def isdir(self, folder):
+        """
+        Check if a folder contains pages.
+
+        :param folder: name of the folder
+        :return: True if it exists
+        """
+
+        return os.path.isdir(folder)
+
+    def listdir(self, folder):
+        """
+        List the pages and the subfolders of a folder.
+
+        :param folder: name of the folder
+        :return: list of names
+        """
+
+        return os.listdir(folder)
+
+    def read_folder(self, folder, names):
+        """
+        Read several pages of the same folder.
+
+        :param folder: name of the folder
+        :param names: names of the pages
+        :return: generator of (name, bytes of the page), in the order of names
+        """
+
+        for name in names:
+            yield name, self.read(os.path.join(folder, name))
+
+    def close(self):
+        pass
+
+
+class PageStore(FileStore):
+    """
+    Pages compressed with zlib and appended to segment files of about segment_size bytes in data_folder/pages/.
+    The index (in data_folder/pages/index.db) gives the position of each page with the key (kind, id, page), taken
+    from the path of the page: beers/12/345/2.html is the page '2.html' of the id '12/345' of the kind 'beers'.
+
+    With files=True, the pages which are not in the store are read from the layout with one file per page, such
+    that the corpora crawled before the store existed can still be used.
+    """
+
+    # Header of each record: magic, length of the compressed page, CRC32 of the page
+    header = struct.Struct('<4sII')
+    magic = b'RBPG'
+
+    def __init__(self, data_folder, segment_size=2**30, level=6, files=True):
+        """
+        Open (or create) the store.
+
+        :param data_folder: Folder with the data
+        :param segment_size: A new segment file is started when the current one is bigger than this number of bytes
+        :param level: Compression level of zlib
+        :param files: Read the pages missing in the store from the layout with one file per page
+        """
+
+        self.data_folder = data_folder
+        self.folder = data_folder + 'pages/'
+        self.segment_size = segment_size
+        self.level = level
+        self.files = files
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        # The CrawlEngine writes the pages in its own thread
+        self.conn = sqlite3.connect(self.folder + 'index.db', check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages ('
+                          'kind TEXT NOT NULL, '
+                          'id TEXT NOT NULL, '
+                          'page TEXT NOT NULL, '
+                          'path TEXT NOT NULL UNIQUE, '
+                          'segment INTEGER NOT NULL, '
+                          'offset INTEGER NOT NULL, '
+                          'length INTEGER NOT NULL, '
+                          'size INTEGER NOT NULL, '
+                          'crc INTEGER NOT NULL, '
+                          'time REAL, '
+                          'PRIMARY KEY (kind, id, page))')
+        self.conn.commit()
+
+        # Segment where the pages are appended
+        row = self.conn.execute('SELECT MAX(segment) FROM pages').fetchone()
+        self.segment = row[0] or 0
+        self.output = None
+
+        # Segments opened for reading
+        self.inputs = {}
+
+    def key(self, path):
+        """
+        Get the key of a page from its path.
+
+        :param path: name of the file in the layout with one file per page
+        :return: tuple (kind, id, page, relative path)
+        """
+
+        rel = os.path.relpath(path, self.data_folder).replace(os.sep, '/')
+        parts = rel.split('/')
+
+        return parts[0], '/'.join(parts[1:-1]), parts[-1], rel
+
+    def segment_name(self, segment):
+        return self.folder + 'segment_{:05d}.bin'.format(segment)
+
+    def write(self, path, content):
+        """
+        Append a page to the current segment. A page saved again replaces the previous one in the index.
+
+        :param path: name of the file in the layout with one file per page
+        :param content: bytes of the page
+        """
+
+        kind, id_, page, rel = self.key(path)
+
+        if self.output is None or self.output.tell() > self.segment_size:
+            if self.output is not None:
+                self.output.close()
+                self.segment += 1
+            self.output = open(self.segment_name(self.segment), 'ab')
+
+        data = zlib.compress(content, self.level)
+        crc = zlib.crc32(content)
+
+        # A record left half-written by a crash is never in the index, the next ones go after it
+        offset = self.output.tell() + self.header.size
+        self.output.write(self.header.pack(self.magic, len(data), crc))
+        self.output.write(data)
+        self.output.flush()
+
+        self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          (kind, id_, page, rel, self.segment, offset, len(data), len(content), crc, time.time()))
+        self.conn.commit()
+
+    def _read_record(self, segment, offset, length, crc):
+        """
+        Read and decompress one page.
+        """
+
+        if segment not in self.inputs:
+            if segment == self.segment and self.output is not None:
+                self.output.flush()
+            self.inputs[segment] = open(self.segment_name(segment), 'rb')
+
+        file = self.inputs[segment]
+        file.seek(offset)
+        content = zlib.decompress(file.read(length))
+
+        if zlib.crc32(content) != crc:
+            raise IOError('Corrupted page in segment {:d} at offset {:d}'.format(segment, offset))
+
+        return content
+
+    def read(self, path):
+        """
+        Read a page.
+
+        :param path: name of the file in the layout with one file per page
+        :return: bytes of the page
+        """
+
+        kind, id_, page, rel = self.key(path)
+
+        row = self.conn.execute('SELECT segment, offset, length, crc FROM pages WHERE kind = ? AND id = ? AND page = ?',
+                                (kind, id_, page)).fetchone()
+
+        if row is None:
+            if self.files:
+                return FileStore.read(self, path)
+            raise FileNotFoundError(path)
+
+        return self._read_record(*row)
+
+    def exists(self, path):
+        """
+        Check if a page was saved.
+
+        :param path: name of the file in the layout with one file per page
+        :return: True if the page is in the store (or in a non-empty file)
+        """
+
+        kind, id_, page, rel = self.key(path)
+
+        row = self.conn.execute('SELECT size FROM pages WHERE kind = ? AND id = ? AND page = ?',
+                                (kind, id_, page)).fetchone()
+
+        if row is not None:
+            return row[0] > 0
+
+        return self.files and FileStore.exists(self, path)
+
+    def stat(self, path):
+        """
+        Get the size and the time of writing of a page. The CRC32 of the page is its hash.
+
+        :param path: name of the file in the layout with one file per page
+        :return: tuple (size, time of writing, hash of the content)
+        """
+
+        kind, id_, page, rel = self.key(path)
+
+        row = self.conn.execute('SELECT size, time, crc FROM pages WHERE kind = ? AND id = ? AND page = ?',
+                                (kind, id_, page)).fetchone()
+
+        if row is None:
+            if self.files:
+                return FileStore.stat(self, path)
+            raise FileNotFoundError(path)
+
+        return row[0], row[1], 'crc32:{:08x}'.format(row[2])
+
+    def hash(self, path):
+        """
+        Get the hash of the content of a page.
+
+        :param path: name of the file in the layout with one file per page
+        :return: CRC32 of the page in the store, SHA-1 of the file otherwise
+        """
+
+        size, mtime, hash_ = self.stat(path)
+        if hash_ is not None:
+            return hash_
+
+        return FileStore.hash(self, path)
+
+    def _entries(self, folder):
+        """
+        Relative paths of the pages in a folder and its subfolders.
+        """
+
+        prefix = os.path.relpath(folder, self.data_folder).replace(os.sep, '/').rstrip('/') + '/'
+
+        # All the paths starting with the prefix
+        cur = self.conn.execute('SELECT path FROM pages WHERE path >= ? AND path < ?',
+                                (prefix, prefix[:-1] + chr(ord('/') + 1)))
+
+        return prefix, [row[0] for row in cur.fetchall()]
+
+    def isdir(self, folder):
+        """
+        Check if a folder contains pages.
+
+        :param folder: name of the folder
+        :return: True if it exists in the store (or in the layout with one file per page)
+        """
+
+        prefix, paths = self._entries(folder)
+        return len(paths) > 0 or (self.files and FileStore.isdir(self, folder))
+
+    def listdir(self, folder):
+        """
+        List the pages and the subfolders of a folder.
+
+        :param folder: name of the folder
+        :return: list of names (pages in the store and files)
+        """
+
+        prefix, paths = self._entries(folder)
+        names = set(path[len(prefix):].split('/')[0] for path in paths)
+
+        if self.files and FileStore.isdir(self, folder):
+            names.update(FileStore.listdir(self, folder))
+        elif len(names) == 0:
+            raise FileNotFoundError(folder)
+
+        return sorted(names)
+
+    def read_folder(self, folder, names):
+        """
+        Read several pages of the same folder. The pages in the store are read in the order of the segments.
+
+        :param folder: name of the folder
+        :param names: names of the pages
+        :return: generator of (name, bytes of the page), in the order of names
+        """
+
+        kind, id_, _, _ = self.key(os.path.join(folder, 'x'))
+
+        cur = self.conn.execute('SELECT page, segment, offset, length, crc FROM pages WHERE kind = ? AND id = ?',
+                                (kind, id_))
+        rows = {row[0]: row[1:] for row in cur.fetchall()}
+
+        contents = {}
+        for name in sorted((n for n in names if n in rows), key=lambda n: rows[n][:2]):
+            contents[name] = self._read_record(*rows[name])
+
+        for name in names:
+            if name in contents:
+                yield name, contents.pop(name)
+            elif self.files:
+                yield name, FileStore.read(self, os.path.join(folder, name))
+            else:
+                raise FileNotFoundError(os.path.join(folder, name))
+
+    def pack(self, folder, remove=False):
+        """
+        Move the pages of the layout with one file per page into the store.
+
+        :param folder: folder with the HTML files (e.g. data_folder + 'beers/')
+        :param remove: delete the files once they are in the store
+        :return: number of pages added
+        """
+
+        nbr = 0
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith('.html'):
+                    continue
+
+                path = os.path.join(root, name)
+                kind, id_, page, rel = self.key(path)
+                if self.conn.execute('SELECT 1 FROM pages WHERE kind = ? AND id = ? AND page = ?',
+                                     (kind, id_, page)).fetchone() is None:
+                    self.write(path, FileStore.read(self, path))
+                    nbr += 1
+
+                if remove:
+                    os.remove(path)
+
+        return nbr
+
+    def close(self):
+        """
+        Close the segments and the index.
+        """
+
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+        for file in self.inputs.values():
+            file.close()
+        self.inputs = {}
+
+        self.conn.close()
+
+
+def open_store(data_folder, packed=None):
+    """
+    Open the storage of the pages of a data folder.
+
+    :param data_folder: Folder with the data
+    :param packed: True for a PageStore, False for a FileStore (default: PageStore if it already exists)
+    :return: FileStore or PageStore
+    """
+
+    if packed is None:
+        packed = os.path.exists(data_folder + 'pages/index.db')
+
+    if packed:
+        return PageStore(data_folder)
+    else:
+        return FileStore()
@@ -5,12 +5,27 @@
 #
 # Distributed under terms of the MIT license.
 
-from classes.helpers import parse
+from classes.helpers import beer_pages, first_page
+from classes.extract import decode, beer_info, beer_info_bytes, reviews, reviews_bytes, tokenize_reviews, \
+    tokenize_reviews_bytes, review_date_text, REVIEW_FIELDS, MEMBER_SINCE, LOCATION
+from classes.pagestore import open_store, PageStore
+from classes.dates import DateCache, review_date, member_since
+from classes.locations import Locations
+from classes.manifest import Manifest
+from classes.segments import SegmentedFile
+from classes.blocks import footer, read_blocks
+from classes.ratings import parse_columns
+from classes.export import export_ratings
+from classes.index import build_index
+from classes.metrics import Metrics
+import multiprocessing
+import hashlib
 import pandas as pd
 import numpy as np
-import datetime
+import sqlite3
 import time
 import html
+import json
 import gzip
 import re
 import os
@@ -21,11 +36,14 @@ class Parser:
     Parser for BeerAdvocate website
     """
 
-    def __init__(self, data_folder=None):
+    def __init__(self, data_folder=None, base_url='https://www.ratebeer.com', packed=None):
         """
         Initialize the class
 
         :param data_folder: Folder to save the data
+        :param base_url: URL of RateBeer used for the links in the CSV files
+        :param packed: Read the pages from a PageStore (the pages missing in it are read from the files) instead of
+                       one file per page (default: PageStore if data_folder/pages/ exists)
         """
 
         if data_folder is None:
@@ -33,6 +51,14 @@ class Parser:
         else:
             self.data_folder = data_folder
 
+        self.base_url = base_url
+
+        # Where the pages were saved by the crawler
+        self.store = open_store(self.data_folder, packed)
+
+        # Throughput, latencies and ETA of each step
+        self.metrics = Metrics(self.data_folder + 'misc/metrics_parser')
+
         self.special_places = ['United States', 'Canada', 'England', 'Germany']
         self.codes = {213: 'United_States', 39: 'Canada', 240: 'England', 79: 'Germany'}
 
@@ -75,7 +101,7 @@ class Parser:
 
         folder = self.data_folder + 'places/'
 
-        list_ = os.listdir(folder)
+        list_ = self.store.listdir(folder)
 
         json_brewery = {'name': [], 'id': [], 'location': [], 'link': []}
         # Go through all the countries
@@ -83,7 +109,7 @@ class Parser:
             # Check if the country is in the list of special countries
             if country not in self.special_places:
                 # Open the file...
-                html_txt = open(folder + country + '/brew.html', 'rb').read().decode('ISO-8859-1')
+                html_txt = self.store.read(folder + country + '/brew.html').decode('ISO-8859-1')
 
                 # Change name of the country to a more convenient one
                 if country in self.country_to_change:
@@ -97,7 +123,7 @@ class Parser:
 
                 grp = re.finditer(str_, str(html_txt))
                 for g in grp:
-                    link = 'https://www.ratebeer.com/brewers/{}/{}/'.format(g.group(1), g.group(2))
+                    link = self.base_url + '/brewers/{}/{}/'.format(g.group(1), g.group(2))
 
                     json_brewery['name'].append(g.group(3))
                     json_brewery['id'].append(g.group(2))
@@ -106,18 +132,18 @@ class Parser:
 
             else:
                 # Get the list of regions
-                list_2 = os.listdir(folder + country)
+                list_2 = self.store.listdir(folder + country)
                 # Go through all regions
                 for region in list_2:
                     # Open the file...
-                    html_txt = open(folder + country + '/' + region + '/brew.html', 'rb').read().decode('ISO-8859-1')
+                    html_txt = self.store.read(folder + country + '/' + region + '/brew.html').decode('ISO-8859-1')
 
                     # ... and parse it
                     str_ = '<A HREF="/brewers/(\S+)/(\d+)/"> (.+?)</A>'
 
                     grp = re.finditer(str_, str(html_txt))
                     for g in grp:
-                        link = 'https://www.ratebeer.com/brewers/{}/{}/'.format(g.group(1), g.group(2))
+                        link = self.base_url + '/brewers/{}/{}/'.format(g.group(1), g.group(2))
 
                         json_brewery['name'].append(g.group(3))
                         json_brewery['id'].append(g.group(2))
@@ -140,13 +166,16 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_brewery_files(self):
+    def parse_brewery_files(self, full=False):
         """
         STEP 4
 
         Parse the brewery HTML files to get new info about the breweries and create the CSV for the beers
 
         !!! Make sure step 3 was done with the crawler !!!
+
+        :param full: Parse all the breweries (False: only the breweries whose page changed since the last run, the
+                     beers of the others are taken from the manifest)
         """
 
         # Load the DF
@@ -157,42 +186,68 @@ class Parser:
         # Prepare the json for the DF
         json_beers = {'beer_name': [], 'brewery_name': [], 'beer_id': [], 'brewery_id': [], 'style': [], 'link': []}
 
+        manifest = Manifest(self.data_folder, self.store)
+        manifest.load('4. breweries', full)
+
+        self.metrics.start('4. breweries', total=len(df))
+
         nbr_beers = []
         # Go through all the breweries
         for i in df.index:
-            id_ = df.ix[i]['id']
+            start = time.time()
+
+            id_ = df.loc[i]['id']
+            file = folder + str(id_) + '.html'
 
-            # Open the file
-            html_txt = open(folder + str(id_) + '.html', 'rb').read().decode('ISO-8859-1')
+            changed, state, beers = manifest.check(str(id_), [file], [str(df.loc[i]['name'])])
 
-            # Unescape the HTML characters
-            html_txt = html.unescape(html_txt)
+            if changed:
+                # Open the file
+                content = self.store.read(file)
+                html_txt = content.decode('ISO-8859-1')
 
-            # String to search for
-            str_ = '<strong><A HREF="/beer/(\S+)/(\d+)/">([^<]*)</A></strong> (?!<em class="small">\(alias\)</em>)' \
-                   '(.+?)<a href="/beerstyles/(\S+)/(\d+)/">([^<]*)</a>'
+                # Unescape the HTML characters
+                html_txt = html.unescape(html_txt)
 
-            grp = re.finditer(str_, str(html_txt))
+                # String to search for
+                str_ = '<strong><A HREF="/beer/(\S+)/(\d+)/">([^<]*)</A></strong> ' \
+                       '(?!<em class="small">\(alias\)</em>)(.+?)<a href="/beerstyles/(\S+)/(\d+)/">([^<]*)</a>'
+
+                grp = re.finditer(str_, str(html_txt))
+
+                # Name, ID, style and link of each beer
+                beers = [[g.group(3), g.group(2), g.group(7), self.base_url + '/beer/{}/{}/'.format(g.group(1),
+                                                                                                    g.group(2))]
+                         for g in grp]
+
+                manifest.update(str(id_), state, beers, [str(df.loc[i]['name'])])
+                nbytes = len(content)
+            else:
+                nbytes = 0
 
-            nbr = 0
-            for g in grp:
+            for beer_name, beer_id, style, link in beers:
                 # Add the beer
-                json_beers['beer_name'].append(g.group(3))
-                json_beers['brewery_name'].append(df.ix[i]['name'])
-                json_beers['beer_id'].append(g.group(2))
+                json_beers['beer_name'].append(beer_name)
+                json_beers['brewery_name'].append(df.loc[i]['name'])
+                json_beers['beer_id'].append(beer_id)
                 json_beers['brewery_id'].append(id_)
-                json_beers['style'].append(g.group(7))
-                json_beers['link'].append('https://www.ratebeer.com/beer/{}/{}/'.format(g.group(1), g.group(2)))
+                json_beers['style'].append(style)
+                json_beers['link'].append(link)
 
-                nbr += 1
+            nbr_beers.append(len(beers))
 
-            nbr_beers.append(nbr)
+            self.metrics.record(time.time() - start, nbytes)
+
+        self.metrics.finish()
+
+        manifest.save(str(id_) for id_ in df['id'])
+        manifest.close()
 
         # Add to the DF
         df.loc[:, 'nbr_beers'] = nbr_beers
 
         # Delete the links to the breweries
-        df = df.drop(['link'], 1, errors='ignore')
+        df = df.drop(['link'], axis=1, errors='ignore')
 
         # Save it again
         df.to_csv(self.data_folder + 'parsed/breweries.csv', index=False)
@@ -209,18 +264,35 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_beer_files_for_information(self):
+    def parse_beer_files_for_information(self, use_crawl_info=True, raw=True, full=False):
         """
         STEP 6
 
         Parse the beer files to get some information on the beers
 
         !!! Make sure step 5 was done with the crawler !!!
+
+        :param use_crawl_info: Use the information saved by the crawler when it downloaded the first page of the
+                               beers. Only the beers without this information are parsed again.
+        :param raw: Search the patterns in the bytes of the pages and only decode the values found (False: decode and
+                    unescape the whole pages first). The results are the same.
+        :param full: Parse all the beers (False: only the beers whose first page changed since the last run, the
+                     information of the others is taken from the manifest)
         """
 
         # Load the DF
         df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
 
+        if use_crawl_info:
+            crawl_info = self.load_crawl_info()
+        else:
+            crawl_info = {}
+
+        manifest = Manifest(self.data_folder, self.store)
+        manifest.load('6. beers information', full)
+
+        self.metrics.start('6. beers information', total=len(df))
+
         nbr_ratings = []
         overall_score = []
         style_score = []
@@ -228,82 +300,42 @@ class Parser:
         abv = []
 
         for i in df.index:
-            row = df.ix[i]
-
-            file = self.data_folder + 'beers/{}/{}/1.html'.format(row['brewery_id'], row['beer_id'])
-
-            # Open the file
-            html_txt = open(file, 'rb').read().decode('ISO-8859-1')
-
-            # Unescape the HTML characters
-            html_txt = html.unescape(html_txt)
-
-            # Find number of ratings
-            str_ = 'RATINGS: </abbr><big style="color: #777;"><b><span id="_ratingCount8" itemprop="ratingCount" ' \
-                   'itemprop="reviewCount">(\d+)</span>'
-            grp = re.search(str_, html_txt)
-            
-            try:
-                nbr = int(grp.group(1))
-            except AttributeError:
-                nbr = -1
-
-            nbr_ratings.append(nbr)
+            start = time.time()
 
-            # Find the ABV
-            str_ = '<abbr title="Alcohol By Volume">ABV</abbr>: <big style="color: #777;"><strong>(.+?)</strong></big>'
+            row = df.loc[i]
 
-            grp = re.search(str_, html_txt)
+            key = (int(row['brewery_id']), int(row['beer_id']))
 
-            try:
-                abv_val = float(grp.group(1).replace('%', ''))
-            except (ValueError, AttributeError):
-                abv_val = np.nan
-
-            abv.append(abv_val)
-
-            if nbr == 0:
-                overall_score.append(np.nan)
-                style_score.append(np.nan)
-                avg.append(np.nan)
+            if key in crawl_info:
+                info = crawl_info[key]
+                nbytes = 0
             else:
-                # Find the weighted average
-                str_ = 'WEIGHTED AVG: <big style="color: #777;"><strong><span itemprop="ratingValue">(.+?)</span>'
-                grp = re.search(str_, html_txt)
-
-                try:
-                    avg_val = float(grp.group(1))
-                except (ValueError, AttributeError):
-                    avg_val = np.nan
+                folder = self.data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+                files = self.store.listdir(folder)
 
-                avg.append(avg_val)
+                # Newest first page (an incremental crawl can have downloaded it again)
+                file = folder + (first_page(files) or '1.html')
+                changed, state, info = manifest.check('{}/{}'.format(*key), [file])
 
-                if nbr < 10:
-                    overall_score.append(np.nan)
-                    style_score.append(np.nan)
+                if changed:
+                    _, content, info = read_beer_info(self.store, folder, raw, files)
+                    manifest.update('{}/{}'.format(*key), state, info)
+                    nbytes = len(content)
                 else:
-                    # Find the overall score
-                    str_ = 'overall</div><div class="ratingValue" itemprop="ratingValue">(\d+)</div>'
-                    grp = re.search(str_, html_txt)
-
-                    try:
-                        overall = int(grp.group(1))
-                    except (ValueError, AttributeError):
-                        overall = np.nan
+                    nbytes = 0
 
-                    overall_score.append(overall)
+            nbr_ratings.append(info['nbr_ratings'])
+            overall_score.append(info['overall_score'])
+            style_score.append(info['style_score'])
+            avg.append(info['avg'])
+            abv.append(info['abv'])
 
-                    # Find the style score
-                    str_ = '<div style="font-size: 25px; font-weight: bold; color: #fff; padding: 20px 0px; ">' \
-                           '(\d+)<br><div class="style-text">style</div>'
-                    grp = re.search(str_, html_txt)
+            self.metrics.record(time.time() - start, nbytes)
 
-                    try:
-                        style = int(grp.group(1))
-                    except (ValueError, AttributeError):
-                        style = np.nan
+        self.metrics.finish()
 
-                    style_score.append(style)
+        manifest.save('{}/{}'.format(*key) for key in zip(df['brewery_id'], df['beer_id']) if key not in crawl_info)
+        manifest.close()
 
         # Add the new columns
         df.loc[:, 'nbr_ratings'] = nbr_ratings
@@ -313,7 +345,7 @@ class Parser:
         df.loc[:, 'abv'] = abv
 
         # Delete the column with the links
-        df = df.drop(['link'], 1, errors='ignore')
+        df = df.drop(['link'], axis=1, errors='ignore')
 
         # Delete columns with -1 as nbr of ratings
         df = df[df['nbr_ratings'] > -1]
@@ -321,17 +353,69 @@ class Parser:
         # Save it again
         df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
 
+    def load_crawl_info(self):
+        """
+        Load the information saved by the crawler when it downloaded the first page of the beers
+
+        :return: dict with (brewery_id, beer_id) as keys and the dict of information as values
+        """
+
+        file = self.data_folder + 'misc/frontier.db'
+        if not os.path.exists(file):
+            return {}
+
+        conn = sqlite3.connect('file:{}?mode=ro'.format(file), uri=True)
+        try:
+            cur = conn.execute('SELECT brewery_id, beer_id, nbr_ratings, abv, avg, overall_score, style_score '
+                               'FROM beer_info')
+            rows = cur.fetchall()
+        except sqlite3.OperationalError:
+            # Frontier created before the crawler saved this information
+            rows = []
+        finally:
+            conn.close()
+
+        crawl_info = {}
+        for row in rows:
+            values = [np.nan if v is None else v for v in row[3:]]
+            crawl_info[(row[0], row[1])] = {'nbr_ratings': row[2], 'abv': values[0], 'avg': values[1],
+                                            'overall_score': values[2], 'style_score': values[3]}
+
+        return crawl_info
+
     ########################################################################################
     ##                                                                                    ##
     ##                      Parse the beer files to get the reviews                       ##
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_beer_files_for_reviews(self):
+    def parse_beer_files_for_reviews(self, processes=1, batch=64, raw=True, tokenizer=True, full=False, checkpoint=60,
+                                     blocks=False):
         """
         STEP 7
 
         Parse the beer files to get some information on the beers
+
+        :param processes: Number of processes parsing the beers (None for the number of cores). With more than one
+                          process, each batch of beers is a separate member of the GZIP file. The content of the
+                          file is the same as with one process.
+        :param batch: Number of beers sent at once to a process
+        :param raw: Search the reviews in the bytes of the pages and only decode the values found (False: decode and
+                    unescape the whole pages first). The results are the same.
+        :param tokenizer: Cut the pages into reviews and the reviews into fields (False: search each review with one
+                          pattern). A review with a field which cannot be read is then counted in the fields not found
+                          instead of being skipped silently. It is kept if the field is not written in the ratings.
+        :param full: Parse all the beers (False: only the beers whose pages changed since the last run, the reviews of
+                     the others are copied from the last ratings.txt.gz)
+        :param checkpoint: Number of seconds between two checkpoints. The reviews are written in segments in
+                           parsed/ratings.txt.gz.parts/ and a new run after a crash starts from the last checkpoint.
+                           The segments are joined into ratings.txt.gz at the end.
+        :param blocks: Write each batch of beers as a separate GZIP member (also with one process) and the index of
+                       these blocks at the end of the file, such that classes.blocks.read_blocks reads it with several
+                       processes. It is still read by gzip and by parse.
+
+        The users are counted while the reviews are written and saved in users.csv (see save_users): step 8 is not
+        needed after this step.
         """
 
         # Load the DF
@@ -340,177 +424,475 @@ class Parser:
         # Drop duplicates. No idea why they're here.
         df = df.drop_duplicates('beer_id', keep='first')
 
-        # Open the GZIP file
-        f = gzip.open(self.data_folder + 'parsed/ratings.txt.gz', 'wb')
-        # Go through all beers
-        for i in df.index:
-            row = df.ix[i]
+        ratings = self.data_folder + 'parsed/ratings.txt.gz'
+
+        # The reviews of the beers which did not change are copied from the last ratings.txt.gz. It must not have been
+        # written by something else since the last run.
+        manifest = Manifest(self.data_folder, self.store)
+        manifest.load('7. reviews', full or not manifest.output_unchanged('7. reviews', ratings))
+
+        index = list(df.index)
+        rows = [df.loc[i].to_dict() for i in index]
+
+        # Number of reviews and position in the last file of the beers which did not change
+        last = {}
+        states = {}
+        for i, row in zip(index, rows):
+            key, changed, states[i], output = self.check_beer_reviews(manifest, row)
+            if not changed:
+                last[i] = output
+
+        # The reviews are copied while reading the last file once, the beers must be in the same order
+        positions = [last[i][1] for i in index if i in last]
+        if any(a >= b for a, b in zip(positions, positions[1:])):
+            manifest.load('7. reviews', True)
+            last = {}
+
+        # Number of pages of each beer (10 ratings per page)
+        pages = np.ceil(df['nbr_ratings'].clip(lower=0)/10).sum()
+        self.metrics.start('7. reviews', total=int(pages))
+
+        if processes is None:
+            processes = os.cpu_count()
+
+        # Batches of consecutive beers to parse, in the order of the file, and the beers copied in between
+        plan = []
+        for k, i in enumerate(index):
+            if i in last:
+                plan.append(('copy', [k]))
+            elif len(plan) > 0 and plan[-1][0] == 'parse' and len(plan[-1][1]) < batch:
+                plan[-1][1].append(k)
+            else:
+                plan.append(('parse', [k]))
 
-            nbr_rat = row['nbr_ratings']
-            count = 0
+        batches = [[rows[k] for k in ks] for kind, ks in plan if kind == 'parse']
 
-            # Check that this beer has at least 1 rating
-            if row['nbr_ratings'] > 0:
+        # The output is written as segments with checkpoints, a new run with the same plan starts from the last one
+        key = json.dumps([[kind, [_beer_key(rows[k]) for k in ks]] for kind, ks in plan] + [raw, tokenizer, blocks])
+        compress = processes > 1 or blocks
+        output = SegmentedFile(ratings, hashlib.sha1(key.encode('utf-8')).hexdigest(), compressed=compress)
 
-                folder = self.data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+        if output.state is None:
+            state = {'done': 0, 'counts': [], 'failures': {}, 'dates': {'hits': 0, 'misses': 0, 'time': 0.0},
+                     'users': {}}
+            if blocks:
+                # Size and number of reviews of the blocks
+                state['blocks'] = []
+        else:
+            state = output.state
+            print('Resuming from the checkpoint: {:d} beers already parsed'.format(len(state['counts'])))
+
+        # Number of reviews of each beer
+        counts = state['counts']
+        # Number of reviews where each field was not found
+        failures = state['failures']
+        # Counters of the conversions of the dates
+        dates = state['dates']
+        # Aggregates of the ratings of each user
+        users = state['users']
+
+        batches = [[rows[k] for k in ks] for kind, ks in plan[state['done']:] if kind == 'parse']
+
+        pool, results = self.map_batches(_parse_reviews_batch, _parse_reviews_batch_gzip, batches, processes, raw,
+                                         tokenizer)
+
+        # Records of the last file
+        records = _read_reviews(ratings) if len(last) > 0 else None
+
+        try:
+            copied = []
+            nbr_copied = 0
+            last_checkpoint = time.time()
+            for done, (kind, ks) in enumerate(plan[state['done']:], state['done'] + 1):
+                if kind == 'copy':
+                    k = ks[0]
+                    count = last[index[k]][0]
+
+                    # With several processes or blocks, the copied records are compressed together as a GZIP member
+                    copied.append(_copy_reviews(records, _beer_key(rows[k]), count))
+                    nbr_copied += count
+
+                    _users_of_block(users, copied[-1])
+                    if not compress or sum(len(c) for c in copied) > 2**20:
+                        self.write_block(output, b''.join(copied), compress, nbr_copied, state)
+                        copied = []
+                        nbr_copied = 0
+
+                    beers = [(count, None, 0, None)]
+                    self.metrics.record(pages=int(np.ceil(max(rows[k]['nbr_ratings'], 0)/10)))
+                else:
+                    if len(copied) > 0:
+                        self.write_block(output, b''.join(copied), compress, nbr_copied, state)
+                        copied = []
+                        nbr_copied = 0
+
+                    block, beers, batch_failures, batch_dates, batch_users = next(results)
+                    # With several processes, the block is already a GZIP member
+                    self.write_block(output, block, compress and pool is None, sum(beer[0] for beer in beers), state)
+
+                    for field, nbr in batch_failures.items():
+                        failures[field] = failures.get(field, 0) + nbr
+
+                    for key in dates:
+                        dates[key] += batch_dates[key]
+
+                    _merge_users(users, batch_users)
+
+                for count, elapsed, nbytes, nbr_pages in beers:
+                    counts.append(count)
+
+                    if nbr_pages is not None:
+                        self.metrics.record(elapsed, nbytes, pages=nbr_pages)
+
+                if time.time() - last_checkpoint > checkpoint:
+                    if len(copied) > 0:
+                        self.write_block(output, b''.join(copied), compress, nbr_copied, state)
+                        copied = []
+                        nbr_copied = 0
+
+                    state['done'] = done
+                    output.checkpoint(state)
+                    last_checkpoint = time.time()
+
+            if len(copied) > 0:
+                self.write_block(output, b''.join(copied), compress, nbr_copied, state)
+
+            state['done'] = len(plan)
+            output.finish(state, footer(state['blocks']) if blocks else b'')
+        finally:
+            output.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if records is not None:
+                records.close()
+
+        for k, (i, count) in enumerate(zip(index, counts)):
+            if count != df.loc[i, 'nbr_ratings']:
+                # If there's a problem in the HTML file, we replace the count of ratings
+                # with the number we have now.
+                df.loc[i, 'nbr_ratings'] = count
 
-                list_ = os.listdir(folder)
-                list_.sort()
+            if i not in last or last[i] != [count, k]:
+                manifest.update(_beer_key(rows[k]), states[i], [count, k], _beer_extra(rows[k]))
 
-                list_users = []
+        manifest.set_output('7. reviews', ratings)
+        manifest.save(_beer_key(row) for row in rows)
+        manifest.close()
 
-                for file in list_:
+        self.metrics.finish()
 
-                    # Open the file
-                    html_txt = open(folder + file, 'rb').read().decode('ISO-8859-1')
+        self.print_reviews_report(failures, dates)
 
-                    # Unescape the HTML characters
-                    html_txt = html.unescape(html_txt)
+        # Save the CSV again
+        df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
+
+        self.save_users(pd.DataFrame.from_dict(users, orient='index', columns=USER_COLUMNS))
 
-                    # Remove the \n, \r and \t characters
-                    html_txt = html_txt.replace('\r', '').replace('\n', '').replace('\t', '')
+    def check_beer_reviews(self, manifest, row):
+        """
+        Check if the pages of a beer changed since the last run of step 7
 
-                    # Search for all the elements
-                    str_ = '<div style="display:inline; padding: 0px 0px; font-size: 24px; font-weight: bold; color: ' \
-                           '#036;" title="([^o]*) out of 5.0<br /><small>Aroma (\d+)/10<br />Appearance (\d+)/5<br />' \
-                           'Taste (\d+)/10<br />Palate (\d+)/5<br />Overall (\d+)/20<br /></small>">(.+?)</div></div>' \
-                           '<small style="color: #666666; font-size: 12px; font-weight: bold;"><A HREF="/user/(\d+)/">' \
-                           '(.+?)\xa0\((\d+)\)</A></I> -(.+?)- (.+?)</small><BR><div style="padding: 20px 10px 20px ' \
-                           '0px; border-bottom: 1px solid #e0e0e0; line-height: 1.5;">(.+?)</div><br>'
+        :param manifest: Manifest with the units of step 7 loaded
+        :param row: dict with the columns of beers.csv for this beer
+        :return: the key of the beer, True if it changed, the state of its pages and the number of reviews and the
+                 position of the beer in the last ratings.txt.gz (None if it changed)
+        """
 
-                    grp = re.finditer(str_, html_txt)
+        key = _beer_key(row)
 
-                    for g in grp:
-                        rating = float(g.group(1))
+        # The pages of the beers without rating are not read
+        if row['nbr_ratings'] > 0:
+            folder = self.data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+            paths = [folder + file for file in beer_pages(self.store.listdir(folder))]
+        else:
+            paths = []
 
-                        appearance = int(g.group(3))
-                        aroma = int(g.group(2))
-                        palate = int(g.group(5))
-                        taste = int(g.group(4))
-                        overall = int(g.group(6))
+        changed, state, output = manifest.check(key, paths, _beer_extra(row))
 
-                        user_name = g.group(9)
-                        user_id = int(g.group(8))
+        return key, changed, state, output
 
-                        if user_name in list_users:
-                            add_rev = False
-                        else:
-                            list_users.append(user_name)
-                            add_rev = True
+    @staticmethod
+    def write_block(f, block, compress, nbr=0, state=None):
+        """
+        Write records in ratings.txt.gz
 
-                        text = g.group(13)
+        :param f: file (or SegmentedFile) where the records are written
+        :param block: records (bytes)
+        :param compress: True if f is not a GZIP file, the block is then written as a GZIP member
+        :param nbr: Number of records in the block
+        :param state: state of step 7, the size and the number of records of the block are added to its blocks
+        """
 
-                        if '<small style="color: #666666">UPDATED' in text:
-                            # Update the date
-                            str_ = '<small style="color: #666666">UPDATED: (.+?)</i></small> (.+)'
-                            grp_txt = re.search(str_, text)
+        if compress:
+            block = gzip.compress(block)
 
-                            try:
-                                str_date = grp_txt.group(1)
-                            except:
-                                print(folder, file)
-                            text = grp_txt.group(2)
+        f.write(block)
 
-                        else:
-                            str_date = g.group(12)
-
-                            # Sometimes, the user will add a second position (or a job, not sure)
-                            # Therefore, we simply split the str_date
-                            splitted = str_date.split(' - ')
-
-                            idx = 0
-
-                            while not (', 20' in splitted[idx] or ', 19' in splitted[idx]):
-                                idx += 1
-
-                            str_date = splitted[idx]
-
-                        try:
-                            year = int(str_date.split(",")[1])
-                        except (ValueError, IndexError):
-                            # It's possible that there's an error due to the addition of the explanation
-                            # why this rating doesn't count
-                            year = int(str_date.split(",")[1].split('<')[0])
-
-                        month = time.strptime(str_date[0:3], '%b').tm_mon
-                        day = int(str_date.split(",")[0][4:])
-
-                        date = int(datetime.datetime(year, month, day, 12, 0).timestamp())
-
-                        # Clean the text
-                        text = re.sub('<[^>]+>', '', text)
-
-                        if add_rev:
-                            count += 1
-
-                            # Write to file
-                            f.write('beer_name: {}\n'.format(row['beer_name']).encode('utf-8'))
-                            f.write('beer_id: {:d}\n'.format(row['beer_id']).encode('utf-8'))
-                            f.write('brewery_name: {}\n'.format(row['brewery_name']).encode('utf-8'))
-                            f.write('brewery_id: {:d}\n'.format(row['brewery_id']).encode('utf-8'))
-                            f.write('style: {}\n'.format(row['style']).encode('utf-8'))
-                            f.write('abv: {}\n'.format(row['abv']).encode('utf-8'))
-                            f.write('date: {:d}\n'.format(date).encode('utf-8'))
-                            f.write('user_name: {}\n'.format(user_name).encode('utf-8'))
-                            f.write('user_id: {:d}\n'.format(user_id).encode('utf-8'))
-                            f.write('appearance: {:d}\n'.format(appearance).encode('utf-8'))
-                            f.write('aroma: {:d}\n'.format(aroma).encode('utf-8'))
-                            f.write('palate: {:d}\n'.format(palate).encode('utf-8'))
-                            f.write('taste: {:d}\n'.format(taste).encode('utf-8'))
-                            f.write('overall: {:d}\n'.format(overall).encode('utf-8'))
-                            f.write('rating: {:.2f}\n'.format(rating).encode('utf-8'))
-                            f.write('text: {}\n'.format(text).encode('utf-8'))
-                            f.write('\n'.encode('utf-8'))
-
-            if count != nbr_rat:
-                # If there's a problem in the HTML file, we replace the count of ratings
-                # with the number we have now.
-                df = df.set_value(i, 'nbr_ratings', count)
+        if state is not None and 'blocks' in state:
+            state['blocks'].append([len(block), nbr])
 
-        f.close()
+    def map_batches(self, function, function_gzip, batches, processes, raw, tokenizer):
+        """
+        Send the batches of beers to the processes parsing them
+
+        :param function: function parsing a batch and giving back the records in bytes
+        :param function_gzip: same function giving back the records compressed as a GZIP member
+        :param batches: list of batches of beers
+        :param processes: Number of processes
+        :param raw: Search the patterns in the bytes of the pages
+        :param tokenizer: Cut the reviews into fields
+        :return: the pool (None with one process) and the iterator of the results in the order of the batches, with
+                 the blocks of records compressed as GZIP members with several processes
+        """
 
-        # Save the CSV again
+        packed = isinstance(self.store, PageStore)
+
+        if processes > 1:
+            # The workers compress their batch themselves. The batches are given back in order.
+            pool = multiprocessing.Pool(processes, _init_reviews_worker, (self.data_folder, packed, raw, tokenizer))
+            results = pool.imap(function_gzip, batches)
+        else:
+            pool = None
+            _init_reviews_worker(self.data_folder, packed, raw, tokenizer, self.store)
+            results = map(function, batches)
+
+        return pool, results
+
+    @staticmethod
+    def print_reviews_report(failures, dates):
+        """
+        Print the counters of the conversions of the dates and the fields of the reviews not found
+
+        :param failures: dict with the number of reviews where each field was not found (and 'skipped')
+        :param dates: dict with the counters of the conversions of the dates
+        """
+
+        print('Dates of the reviews: {}'.format(DateCache.format(dates)))
+
+        if len(failures) > 0:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('Reviews skipped because of a missing field: {:d}'.format(failures.pop('skipped', 0)))
+            print('Fields not found: {}'.format(', '.join('{} ({:d})'.format(field, failures[field])
+                                                          for field in REVIEW_FIELDS if field in failures)))
+            print('---------------------------------------------------------------------')
+            print('')
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##             Parse the beer files to get the information and the reviews            ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def parse_beer_files(self, use_crawl_info=True, processes=1, batch=64, raw=True, tokenizer=True):
+        """
+        STEPS 6 AND 7
+
+        Parse the beer files to get the information on the beers and their reviews in one pass: each folder is
+        visited once, the first page is read once and beers.csv is written once. The files are the same as with
+        parse_beer_files_for_information followed by parse_beer_files_for_reviews (users.csv included).
+
+        !!! Make sure step 5 was done with the crawler !!!
+
+        :param use_crawl_info: Use the information saved by the crawler when it downloaded the first page of the
+                               beers
+        :param processes: Number of processes parsing the beers (None for the number of cores)
+        :param batch: Number of beers sent at once to a process
+        :param raw: Search the patterns in the bytes of the pages
+        :param tokenizer: Cut the pages into reviews and the reviews into fields
+        """
+
+        # Load the DF
+        df = pd.read_csv(self.data_folder + 'parsed/beers.csv')
+
+        if use_crawl_info:
+            crawl_info = self.load_crawl_info()
+        else:
+            crawl_info = {}
+
+        infos = {}
+        for i in df.index:
+            key = (int(df.loc[i, 'brewery_id']), int(df.loc[i, 'beer_id']))
+            if key in crawl_info:
+                infos[i] = crawl_info[key]
+
+        # Step 6 deletes the beers with -1 as nbr of ratings and step 7 then keeps the first of the duplicates. The
+        # information of the duplicates is needed before parsing the reviews to keep the same beer.
+        duplicated = df['beer_id'].duplicated(keep=False)
+        for i in df.index[duplicated]:
+            if i not in infos:
+                folder = self.data_folder + 'beers/{}/{}/'.format(df.loc[i, 'brewery_id'], df.loc[i, 'beer_id'])
+                infos[i] = read_beer_info(self.store, folder, raw)[2]
+
+        kept = [i for i in df.index[duplicated] if infos[i]['nbr_ratings'] > -1]
+        dropped = df.index[duplicated].difference(df.loc[kept].drop_duplicates('beer_id', keep='first').index)
+        df = df.drop(dropped)
+
+        # Number of pages (10 ratings per page), at least the first page for the beers without information
+        pages = sum(np.ceil(max(infos[i]['nbr_ratings'], 0)/10) if i in infos else 1 for i in df.index)
+        self.metrics.start('6-7. beers', total=int(pages))
+
+        if processes is None:
+            processes = os.cpu_count()
+
+        # Batches of beers, in the order of the file
+        index = list(df.index)
+        rows = [(df.loc[i].to_dict(), infos.get(i)) for i in index]
+        batches = [rows[k:k + batch] for k in range(0, len(rows), batch)]
+
+        pool, results = self.map_batches(_parse_beers_batch, _parse_beers_batch_gzip, batches, processes, raw,
+                                         tokenizer)
+
+        if pool is None:
+            f = gzip.open(self.data_folder + 'parsed/ratings.txt.gz', 'wb')
+        else:
+            f = open(self.data_folder + 'parsed/ratings.txt.gz', 'wb')
+
+        columns = {'nbr_ratings': [], 'overall_score': [], 'style_score': [], 'avg': [], 'abv': []}
+        counts = []
+
+        # Number of reviews where each field was not found
+        failures = {}
+        # Counters of the conversions of the dates
+        dates = {'hits': 0, 'misses': 0, 'time': 0.0}
+        # Aggregates of the ratings of each user
+        users = {}
+
+        try:
+            for block, beers, batch_failures, batch_dates, batch_users in results:
+                f.write(block)
+
+                for field, nbr in batch_failures.items():
+                    failures[field] = failures.get(field, 0) + nbr
+
+                for key in dates:
+                    dates[key] += batch_dates[key]
+
+                _merge_users(users, batch_users)
+
+                for info, count, elapsed, nbytes, nbr_pages in beers:
+                    for key in columns:
+                        columns[key].append(info[key])
+                    counts.append(count)
+
+                    self.metrics.record(elapsed, nbytes, pages=nbr_pages)
+        finally:
+            f.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.metrics.finish()
+
+        self.print_reviews_report(failures, dates)
+
+        # Add the new columns
+        for key in columns:
+            df.loc[:, key] = columns[key]
+
+        # Delete the column with the links
+        df = df.drop(['link'], axis=1, errors='ignore')
+
+        # Delete columns with -1 as nbr of ratings
+        df = df[df['nbr_ratings'] > -1]
+
+        # The count of ratings is replaced with the number of reviews found
+        df['nbr_ratings'] = [count for count, keep in zip(counts, columns['nbr_ratings']) if keep > -1]
+
+        # Save it
         df.to_csv(self.data_folder + 'parsed/beers.csv', index=False)
 
+        self.save_users(pd.DataFrame.from_dict(users, orient='index', columns=USER_COLUMNS))
+
+    def export_ratings(self, text=True):
+        """
+        Export ratings.txt.gz into parsed/ratings.parquet (after step 7), with one column per field. Needs pyarrow.
+
+        :param text: Keep the column with the text of the ratings
+        """
+
+        start = time.time()
+        nbr = export_ratings(self.data_folder + 'parsed/ratings.txt.gz', self.data_folder + 'parsed/ratings.parquet',
+                             text=text)
+
+        print('{:d} ratings exported to ratings.parquet in {:.2f} s'.format(nbr, time.time() - start))
+
+    def index_ratings(self, spacing=2**22):
+        """
+        Write the index of ratings.txt.gz (after step 7) in parsed/ratings.txt.gz.idx, such that the ratings of one
+        beer or one user are read with classes.index.RatingsIndex without decompressing the whole file. The file itself
+        is not modified. With indexed_gzip, the checkpoints of the decompressor are written in ratings.txt.gz.gzidx.
+
+        :param spacing: number of uncompressed bytes between two checkpoints of the decompressor (indexed_gzip)
+        """
+
+        start = time.time()
+        nbr = build_index(self.data_folder + 'parsed/ratings.txt.gz', spacing=spacing)
+
+        print('{:d} ratings of {:d} beers and {:d} users indexed in {:.2f} s'.format(nbr['ratings'], nbr['beers'],
+                                                                                   nbr['users'], time.time() - start))
+
+        # Without indexed_gzip, a reading starts at the beginning of a GZIP member
+        if nbr['checkpoints'] != 'indexed_gzip' and nbr['checkpoints'] < nbr['size']//spacing:
+            print('---------------------------------------------------------------------')
+            print('')
+            print('WARNING: indexed_gzip is not installed and ratings.txt.gz ({:d} MB) has only {:d} GZIP member(s).'
+                  .format(nbr['size']//2**20, nbr['checkpoints']))
+            print('Each reading of a beer or a user decompresses the file from the closest member before it, i.e. up '
+                  'to the whole file.')
+            print('Install indexed_gzip or write the file with parse_beer_files_for_reviews(blocks=True) and build '
+                  'the index again.')
+            print('---------------------------------------------------------------------')
+            print('')
+
     ########################################################################################
     ##                                                                                    ##
     ##                           Get the users from the ratings                           ##
     ##                                                                                    ##
     ########################################################################################
 
-    def get_users_from_ratings(self):
+    def get_users_from_ratings(self, processes=1):
         """
         STEP 8
 
-        Go through the file ratings.txt.gz and get all the users who have rated the beers
+        Go through the file ratings.txt.gz and get all the users who have rated the beers. Step 7 already writes
+        users.csv, this step writes it again from ratings.txt.gz alone (e.g. a file written by something else).
+
+        :param processes: Number of processes reading the file, if it was written with blocks (None for the number of
+                          cores)
         """
 
-        # Load the file ratings.txt.gz in the data/parsed folder
-        iterator = parse(self.data_folder + 'parsed/ratings.txt.gz')
+        # Aggregates of each chunk of ratings, the users in the order of their first rating
+        parts = []
+        for chunk in read_blocks(self.data_folder + 'parsed/ratings.txt.gz', USER_FIELDS, processes):
+            df = pd.DataFrame(chunk)
+            df['cents'] = (df['rating']*100).round().astype('int64')
 
-        users = {}
+            parts.append(df.groupby('user_name', sort=False).agg(
+                user_id=('user_id', 'first'), nbr_ratings=('user_id', 'size'), first_date=('date', 'min'),
+                last_date=('date', 'max'), cents=('cents', 'sum')))
 
-        # Go through the elements in the iterator
-        for item in iterator:
-            # Get the user name
-            user_name = item['user_name']
+        if len(parts) == 0:
+            users = pd.DataFrame(columns=USER_COLUMNS)
+        else:
+            users = pd.concat(parts).groupby(level=0, sort=False).agg(
+                {'user_id': 'first', 'nbr_ratings': 'sum', 'first_date': 'min', 'last_date': 'max', 'cents': 'sum'})
 
-            # Check if it's in the JSON for the users
-            if user_name not in users.keys():
-                users[user_name] = {'user_id': item['user_id'], 'nbr_ratings': 1}
-            else:
-                # And update the number of ratings
-                users[user_name]['nbr_ratings'] += 1
+        self.save_users(users[USER_COLUMNS])
+
+    def save_users(self, users):
+        """
+        Save the users who have rated the beers in users.csv: user_name, nbr_ratings, user_id, first_date and
+        last_date (dates of their first and last ratings) and avg_rating (mean of their ratings).
 
-        # Prepare the JSON DataFrame
-        json_df = {'user_name': [], 'nbr_ratings': [], 'user_id': []}
-        for key in users.keys():
-            json_df['user_name'].append(key)
-            json_df['nbr_ratings'].append(users[key]['nbr_ratings'])
-            json_df['user_id'].append(users[key]['user_id'])
+        :param users: DataFrame indexed by the names of the users, with the columns of USER_COLUMNS
+        """
 
-        # Transform it into a DF
-        df = pd.DataFrame(json_df)
+        df = pd.DataFrame({'user_name': users.index, 'nbr_ratings': users['nbr_ratings'].values,
+                           'user_id': users['user_id'].values, 'first_date': users['first_date'].values,
+                           'last_date': users['last_date'].values,
+                           'avg_rating': users['cents'].values/users['nbr_ratings'].values/100})
 
         # Save the CSV
         df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
@@ -521,13 +903,19 @@ class Parser:
     ##                                                                                    ##
     ########################################################################################
 
-    def parse_all_users(self):
+    def parse_all_users(self, locations=None, full=False):
         """
         STEP 10
 
         Parse all the users to get some information
 
         !!! Make sure step 9 was done with the crawler !!!
+
+        :param locations: list of CSV files (place,location) with more places for the table of classes/locations.csv.
+                          The places which are neither in the table nor a location of a brewery are saved with their
+                          number of users in parsed/unmapped_locations.csv.
+        :param full: Parse all the users (False: only the users whose page changed since the last run, the joining
+                     date and the location of the others are taken from the manifest)
         """
 
         # Load the DF of users
@@ -538,391 +926,521 @@ class Parser:
 
         folder = self.data_folder + 'users/'
 
+        self.metrics.start('10. users', total=len(df))
+
+        # Joining dates already converted
+        dates = DateCache(member_since)
+
+        # The locations of the breweries are normalized
+        file = self.data_folder + 'parsed/breweries.csv'
+        known = set(pd.read_csv(file)['location'].dropna()) if os.path.exists(file) else None
+
+        locations = Locations(self.us_states, self.country_to_change, files=locations, known=known)
+
+        manifest = Manifest(self.data_folder, self.store)
+        manifest.load('10. users', full)
+
         for i in df.index:
-            row = df.ix[i]
+            start = time.time()
+
+            row = df.loc[i]
 
             file = str(row['user_id']) + '.html'
 
-            # Open the file
-            html_txt = open(folder + file, 'rb').read().decode('ISO-8859-1')
+            # The location is kept as written on the page, the table of the locations can change
+            changed, state, output = manifest.check(str(row['user_id']), [folder + file])
 
-            # Unescape the HTML characters
-            html_txt = html.unescape(html_txt)
+            if changed:
+                # Open the file
+                content = self.store.read(folder + file)
+                html_txt = content.decode('ISO-8859-1')
 
-            # Get the joining date
-            str_ = 'Member since ([^<]*)'
+                # Unescape the HTML characters
+                html_txt = html.unescape(html_txt)
 
-            grp = re.search(str_, html_txt)
-            try:
-                str_date = grp.group(1)
+                # Get the joining date
+                grp = MEMBER_SINCE.search(html_txt)
+                try:
+                    str_date = grp.group(1)
 
-                # Transform string to epoch
-                month = time.strptime(str_date.split(' ')[0], '%b').tm_mon
-                day = int(str_date.split(' ')[1])
-                year = int(str_date.split(' ')[2])
-                date = int(datetime.datetime(year, month, day, 12, 0).timestamp())
-            except AttributeError:
-                date = np.nan
+                    # Transform string to epoch
+                    date = dates(str_date)
+                except AttributeError:
+                    date = np.nan
+
+                # Get the location
+                grp = LOCATION.search(html_txt)
+                place = None if grp is None else grp.group(1)
+
+                manifest.update(str(row['user_id']), state, [date, place])
+                nbytes = len(content)
+            else:
+                date, place = output
+                nbytes = 0
 
             joined.append(date)
+            location.append(locations.normalize(place))
 
-            # Get the location
-            str_ = '<span class="glyphicon glyphicon-map-marker" aria-hidden="true"></span> ([^<]*)'
-            grp = re.search(str_, html_txt)
+            self.metrics.record(time.time() - start, nbytes)
 
-            try:
-                place = grp.group(1).replace('\n', '').replace('\r', '').replace('\t', '')
+        self.metrics.finish()
 
-                # Remove the space at the end of the string
-                while place[-1] == ' ':
-                    place = place[:-1]
+        manifest.save(str(user_id) for user_id in df['user_id'])
+        manifest.close()
 
-                arr = place.split(', ')
+        print('Joining dates: {}'.format(DateCache.format(dates.stats())))
 
-                if len(arr) == 1:
-                    place = arr[0]  # .replace(',', '')
-                else:
-                    place = arr[-1]
-
-                if place in self.us_states:
-                    place = 'United States, ' + place
-
-                ## MANUAL FIXING ##
-                ## IN THE US ##
-
-                if place in ['Huntsville,', 'Mobile,', 'Wedowee,']:
-                    place = 'United States, Alabama'
+        if known is not None:
+            unmapped = locations.report()
+
+            pd.DataFrame(unmapped, columns=['place', 'nbr_users']).to_csv(
+                self.data_folder + 'parsed/unmapped_locations.csv', index=False)
+
+            if len(unmapped) > 0:
+                print('---------------------------------------------------------------------')
+                print('')
+                print('{:d} places of {:d} users are not in the table of the locations, the most frequent: {}'.format(
+                    len(unmapped), sum(nbr for _, nbr in unmapped),
+                    ', '.join('{} ({:d})'.format(place, nbr) for place, nbr in unmapped[:10])))
+                print('---------------------------------------------------------------------')
+                print('')
+
+        df.loc[:, 'joined'] = joined
+        df.loc[:, 'location'] = location
+
+        # Save the CSV again
+        df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
+
+
+########################################################################################
+##                                                                                    ##
+##               Parse the reviews of the beers (STEP 7), in one or more processes    ##
+##                                                                                    ##
+########################################################################################
+
+# Storage of the pages in the process parsing the reviews
+_reviews_store = None
+_reviews_data_folder = None
+_reviews_raw = True
+_reviews_tokenizer = True
+_reviews_dates = None
 
-                if place in ['Fairbanks,', 'Seward,', 'Soldotna,']:
-                    place = 'United States, Alaska'
+# Fields of a review written in ratings.txt.gz: rating, scores, user ID, user name, date and text
+REVIEW_WRITTEN = [0, 1, 2, 3, 4, 5, 7, 8, 11, 12]
 
-                if place == 'Little Rock,':
-                    place = 'United States, Arkansas'
+# Fields of ratings.txt.gz used for the aggregates of the users
+USER_FIELDS = ['user_name', 'user_id', 'date', 'rating']
+# Aggregates of the users (see _add_user), the sum of the ratings is in hundredths
+USER_COLUMNS = ['user_id', 'nbr_ratings', 'first_date', 'last_date', 'cents']
 
-                if place in ['Gilbert,', 'Phoenix,', 'Prescott Valley,', 'Prescott,', 'Scottsdale,', 'Sierra Vista,',
-                             'Surprise,', 'Tempe,', 'Tucson,', 'mesa,']:
-                    place = 'United States, Arizona'
 
-                if place in ['Aliso Viejo,', 'Atwater,', 'Burbank,', 'Brentwood,', 'California,', 'Carlsbad,',
-                             'Clovis,', 'Corona,', 'Davis,', 'Escondido,', 'Eureka,', 'Fountain Valley,', 'Fremont,',
-                             'Long Beach,', 'Los Angeles,', 'Los Gatos,', 'Lucerne Valley,', 'Magalia,',
-                             'Malibu,', 'Mission Viejo,', 'Modesto,', 'Mountain View / San Luis Obispo,', 'Oakland,',
-                             'Oceanside,', 'Porterville,', 'Rancho Santa Margarita,', 'Riverside,', 'Rocklin,',
-                             'Sacramento,', 'San Diego,', 'San Francisco,', 'San Jose,', 'San Rafael,', 'Santa Cruz,',
-                             'Santa Rosa,', 'South Pasadena,', 'Tarzana,', 'Travis AFB,', 'Vandenberg AFB,',
-                             'Victorville,', 'WHITTIER,', 'West Sacramento,', 'Woodland Hills,', 'anaheim,',
-                             'apple valley,', 'los angeles,', 'modesto,', 'oakland,', 'pinole,', 'redding,',
-                             'riverside,', 'san diego,', 'stockton,', 'vacaville,']:
-                    place = 'United States, California'
-
-                if place in ['Boulder,', 'Broomfield,', 'Colorado Springs,', 'Denver,', 'Fort Collins,', 'Lakewood,',
-                             'Littleton,', 'Loveland,', 'beavercreek,', 'colorado springs,']:
-                    place = 'United States, Colorado'
-
-                if place in ['Haddam,', 'Milford,', 'Niantic,', 'Somers,', 'West Hartford,', 'fairfield,', 'groton ct,',
-                             'meriden,']:
-                    place = 'United States, Connecticut'
-
-                if place in ['Boynton Beach,', 'Cape Coral,', 'Cocoa,', 'Coral Springs,', 'DELRAY BCH,', 'Gainesville,',
-                             'Jacksonville,', 'Lakeland,', 'Mary Esther,', 'Miami,', 'Mount Dora,', 'Niceville,',
-                             'Northport,', 'Orlando,', 'Pembroke Pines,', 'Plantation,', 'Port Charlotte,',
-                             'Port St Lucie,', 'Sebastian,', 'Tallahassee,', 'Tampa,', 'central florida,', 'sarasota,',
-                             'winter garden,']:
-                    place = 'United States, Florida'
-
-                if place in ['Atlanta,', 'Decatur,', 'Lawrenceville (Atlanta),', 'Lawrenceville,', 'Norcross,',
-                             'Powder Springs,', 'Ringgold,Ga.,']:
-                    place = 'United States, Georgia'
-
-                if place in ['Albany Park,', 'CHICAGO,', 'Carbondale,', 'Carpentersville,', 'Champaign,', 'Chicago,',
-                             'Chicagoland,', 'Edwardsville,', 'Forest Glen,', 'Granite City,', 'Joliet,', 'Lisle,',
-                             'New Lenox,', 'Plainfield,', 'River Forest,', 'Schaumburg,', 'South Elgin,',
-                             'Stillman Valley,', 'Urbana,', 'central Illinois,', 'chicago,', 'hinsdale,', 'lisle,']:
-                    place = 'United States, Illinois'
+def _init_reviews_worker(data_folder, packed, raw=True, tokenizer=True, store=None):
+    """
+    Open the storage of the pages in a process parsing the reviews.
 
-                if place in ['Bloomington,', 'Fishers,', 'Greenfield,', 'Indianapolis,', 'Indy,', 'Whiting,',
-                             'fort wayne,']:
-                    place = 'United States, Indiana'
+    :param data_folder: Folder with the data
+    :param packed: True if the pages are in a PageStore
+    :param raw: Search the reviews in the bytes of the pages
+    :param tokenizer: Cut the reviews into fields instead of searching them with one pattern
+    :param store: storage already opened (default: open a new one)
+    """
+    global _reviews_store, _reviews_data_folder, _reviews_raw, _reviews_tokenizer, _reviews_dates
 
-                if place in ['Bettendorf,', 'CEDAR RAPIDS,', 'IOWA CITY,', 'Iowa City,', 'Johnston,',
-                             'Windsor Heights,']:
-                    place = 'United States, Iowa'
+    if store is None:
+        store = open_store(data_folder, packed)
 
-                if place in ['Fort Riley,', 'Kansas City,', 'Lenexa,', 'Winfield,']:
-                    place = 'United States, Kansas'
-
-                if place in ['Bowling Green,', 'Louisville,', 'clay,']:
-                    place = 'United States, Kentucky'
-
-                if place in ['Baton Rouge,', 'Bossier,city,', 'Kenner,', 'Louisiana,', 'New Orleans,', 'new orleans,']:
-                    place = 'United States, Louisiana'
+    _reviews_store = store
+    _reviews_data_folder = data_folder
+    _reviews_raw = raw
+    _reviews_tokenizer = tokenizer
+    _reviews_dates = DateCache(review_date)
 
-                if place in ['Gardiner,', 'Sabattus,', 'Saco,', 'Waterville,']:
-                    place = 'United States, Maine'
 
-                if place in ['Baltimore,', 'Darnestown,', 'Frederick,', 'Glen Arm,', 'North Bethesda,', 'Pikesville,',
-                             'baltimore,', 'gaithersburg,', 'middle river,']:
-                    place = 'United States, Maryland'
+def _parse_reviews_batch(rows):
+    """
+    Parse the reviews of a batch of beers.
 
-                if place in ['Boston,', 'Cohasset,', 'Concord,', 'East Bridgewater,', 'FITCHBURG,', 'Lowell City,',
-                             'Natick,', 'Newbedford,', 'Newton,', 'Salem,', 'Somerville,', 'Waltham,', 'Woburn,',
-                             'boston,', 'salem,', 'walpole,', 'westford,']:
-                    place = 'United States, Massachusetts'
+    :param rows: list of dict with the columns of beers.csv
+    :return: the records for ratings.txt.gz (bytes), a list with the number of reviews, the time, the number of
+             bytes read and the number of pages (None if the beer has no rating) of each beer, a dict with the
+             number of reviews where each field was not found, a dict with the counters of the conversions of the
+             dates and the aggregates of the users (see _add_user) for this batch
+    """
 
-                if place in ['Ann Arbor,', 'Au Gres,', 'East Lansing,', 'Bay CIty,', 'Bloomfield Hills,', 'Clarkston,',
-                             'Freeland,', 'Grand Rapids,', 'Grandville,', 'ISHPEMING,', 'Kalamazoo,',
-                             'Kalamazoo..Bells Paradise,', 'Lansing,', 'MI,', 'Michigan,', 'Rogers,', 'Warren,',
-                             'warren,']:
-                    place = 'United States, Michigan'
+    before = _reviews_dates.stats()
 
-                if place in ['Burnsville,', 'Cannon Falls,', 'Eden Prairie,', 'Gardner,', 'Garvin,', 'Minneapolis,',
-                             'North Branch,', 'Saint Paul,', 'Wayzata,', 'Winnebago,', 'minneapolis,']:
-                    place = 'United States, Minnesota'
+    records = []
+    beers = []
+    failures = {}
+    users = {}
+    for row in rows:
+        start = time.time()
+        count, nbytes, nbr_pages = _parse_beer_reviews(row, records, failures, users=users)
+        beers.append((count, time.time() - start, nbytes, nbr_pages))
 
-                if place in ['Gulfport,', 'Jackson,', 'Ocean Springs,']:
-                    place = 'United States, Mississippi'
+    after = _reviews_dates.stats()
+    dates = {key: after[key] - before[key] for key in after}
 
-                if place in ['Independence,', 'Jefferson,', 'Nixa,', 'Raytown,', 'St Charles,', 'St. Louis,']:
-                    place = 'United States, Missouri'
+    return ''.join(records).encode('utf-8'), beers, failures, dates, users
 
-                if place in ['Billings,', 'Wibaux,']:
-                    place = 'United States, Montana'
 
-                if place in ['North Platte,', 'OMAHA,', 'Omaha,']:
-                    place = 'United States, Nebraska'
+def _parse_reviews_batch_gzip(rows):
+    """
+    Parse the reviews of a batch of beers and compress the records as a GZIP member.
+    """
 
-                if place in ['Las Vegas,', 'Sparks,']:
-                    place = 'United States, Nevada'
+    block, beers, failures, dates, users = _parse_reviews_batch(rows)
 
-                if place in ['Barnegat,', 'Burlington,', 'Collingswood,', 'Moorestown,', 'Newark,', 'North Brunswick,',
-                             'Nutley,', 'Pitman,', 'Princeton,', 'Teaneck,', 'Waldwick,', 'West Deptford,',
-                             'glen ridge,', 'morristown,']:
-                    place = 'United States, New Jersey'
+    return gzip.compress(block), beers, failures, dates, users
 
-                if place in ['Albuquerque,', 'Los Ranchos,', 'Santa Fe,']:
-                    place = 'United States, New Mexico'
 
-                if place in ['Albany,', 'Brooklyn,', 'CENTERPORT,', 'Columbia,', 'Commack,', 'Feura Bush,', 'Flushing,',
-                             'Fort Plain,', 'Gansevoort,', 'Gladstone,', 'Ithaca,', 'Katonah,', 'Lindenhurst,',
-                             'New York,', 'North Tonawanda,', 'Pelham,', 'Rochester,', 'The Big Apple,', 'Tonawanda,',
-                             'Westchester,', 'White Plains,', 'albany,', 'brooklyn,', 'fredonia,', 'lockport,',
-                             'patchogue,', 'port jeff sta,']:
-                    place = 'United States, New York'
+def _parse_beers_batch(rows):
+    """
+    Parse the information and the reviews of a batch of beers.
+
+    :param rows: list of tuples with a dict with the columns of beers.csv and the information of the beer (None if
+                 it must be read on the first page)
+    :return: the records for ratings.txt.gz (bytes), a list with the information, the number of reviews, the time,
+             the number of bytes read and the number of pages read of each beer, a dict with the number of reviews
+             where each field was not found, a dict with the counters of the conversions of the dates and the
+             aggregates of the users
+    """
 
-                if place in ['Boone,', 'Charlotte,', 'Greensboro,', 'Louisburg,', 'Norlina,', 'Raleigh,', 'Shelby,',
-                             'Tarawa Terrace,', 'Wilmington,', 'Winston-Salem,', 'fayetteville,', 'indian trail,']:
-                    place = 'United States, North Carolina'
+    before = _reviews_dates.stats()
 
-                if place in ['Centerville,', 'Cincinnati,', 'Cleveland,', 'Columbus,', 'Dayton,', 'HAMILTON OHIO,',
-                             'Powell,', 'SAINT BERNARD,', 'Springboro,', 'Springfield,', 'Tiffin,', 'akron,',
-                             'cleveland,', 'middle point,', 'north royalton,', 'oregonia,']:
-                    place = 'United States, Ohio'
+    records = []
+    beers = []
+    failures = {}
+    users = {}
+    for row, info in rows:
+        start = time.time()
 
-                if place in ['Jenks,', 'Middleberg,', 'NORMAN,', 'Shawnee,', 'owasso,']:
-                    place = 'United States, Oklahoma'
+        folder = _reviews_data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
+        files = _reviews_store.listdir(folder)
 
-                if place in ['Astoria,', 'Bend,', 'Eugene,', 'Hillsboro,', 'Oregon City,', 'Portland,', 'Scio,']:
-                    place = 'United States, Oregon'
+        if info is None:
+            first = read_beer_info(_reviews_store, folder, _reviews_raw, files)
+            info = first[2]
+            first = first[:2]
+        else:
+            first = None
 
-                if place in ['Aliquippa,', 'East Stroudsburg,', 'Erie,', 'Harrison,', 'Lock Haven,', 'Lower Burrell,',
-                             'Mechanicsburg,', 'Mount Pocono,', 'New Cumberland,', 'PA,', 'Philadelphia,', 'Philly,',
-                             'Pittsburgh,', 'Pocono Summit,', 'Red Lion,', 'Ridley Park,', 'Valley Forge,', 'cresson,',
-                             'fenelton,', 'philadelphia,', 'roaring spring,']:
-                    place = 'United States, Pennsylvania'
+        # The reviews are written with the new information
+        row = dict(row, **info)
 
-                if place == 'North Providence,':
-                    place = 'United States, Rhode Island'
+        count, nbytes, nbr_pages = _parse_beer_reviews(row, records, failures, files, first, users)
 
-                if place in ['Bluffton,', 'Charleston,', 'Clemson,', 'travelers rest,']:
-                    place = 'United States, South Carolina'
+        if first is not None and nbr_pages is None:
+            nbytes, nbr_pages = len(first[1]), 1
 
-                if place == 'Spearfish,':
-                    place = 'United States, South Dakota'
+        beers.append((info, count, time.time() - start, nbytes, nbr_pages or 0))
 
-                if place in ['Chattanooga,', 'Knoxville,']:
-                    place = 'United States, Tennessee'
+    after = _reviews_dates.stats()
+    dates = {key: after[key] - before[key] for key in after}
 
-                if place in ['Amarillo City,', 'Aransas Pass,', 'Arlington,', 'Austin,', 'Baytown,', 'Bryan,',
-                             'Carrollton,', 'Dallas,', 'El Paso,', 'Frisco (Dallas),', 'Hewitt,', 'Houston,', 'Irving,',
-                             'Killeen,', 'Kingwood,', 'Nolanville,', 'Republic of Texas,', 'San Antonio,', 'Timpson,',
-                             'anna,', 'dallas,', 'helotes,', 'kyle,', 'plano,']:
-                    place = 'United States, Texas'
+    return ''.join(records).encode('utf-8'), beers, failures, dates, users
 
-                if place in ['Herriman,', 'LEHI,', 'Salt Lake City,', 'West Valley City,', 'clinton,',
-                             'north salt lake,']:
-                    place = 'United States, Utah'
 
-                if place == 'montpelier,':
-                    place = 'United States, Vermont'
+def _parse_beers_batch_gzip(rows):
+    """
+    Parse the information and the reviews of a batch of beers and compress the records as a GZIP member.
+    """
 
-                if place in ['Virginia Beach,', 'Nellysford,', 'Norfolk,', 'Richmond,', 'Staunton,']:
-                    place = 'United States, Virginia'
+    block, beers, failures, dates, users = _parse_beers_batch(rows)
 
-                if place in ['Bellingham,', 'Bremerton,', 'Chehalis,', 'DC Metro Area,', 'Kelso,', 'Millcreek,',
-                             'Oak Harbor,', 'Olympia,', 'Puyallup,', 'Renton,', 'Rosedale,', 'Seattle,', 'Tacoma,',
-                             'Washington DC', 'Washington,', 'Washougal,']:
-                    place = 'United States, Washington'
+    return gzip.compress(block), beers, failures, dates, users
 
-                if place in ['Beckley,', 'Elkins,', 'Huntington,']:
-                    place = 'United States, West Virginia'
 
-                if place in ['Wauwatosa,', 'Eau Claire,', 'Green Bay,', 'Madison,', 'Milwaukee,', 'New Berlin,',
-                             'Oshkosh,', 'Phillips,', 'River Falls,', 'Stevens Point,', 'Stoughton,', 'Whitefish Bay,']:
-                    place = 'United States, Wisconsin'
+def read_beer_info(store, folder, raw=True, files=None):
+    """
+    Read the information on the newest first page of a beer (an incremental crawl can have downloaded it again)
 
-                if place == 'Sheridan,':
-                    place = 'United States, Wyoming'
+    :param store: storage of the pages
+    :param folder: folder of the beer
+    :param raw: Search the patterns in the bytes of the page
+    :param files: names of the files in the folder (default: list the folder)
+    :return: the name of the page, its bytes and the dict with the information
+    """
 
-                ## OUTSIDE US ##
+    if files is None:
+        files = store.listdir(folder)
 
-                if place in ['Australia,', 'Brisbane,', 'Geelong,', 'Newtown,', 'Pental Island,', 'Tasmania,',
-                             'brunswick,']:
-                    place = 'Australia'
+    name = first_page(files) or '1.html'
+    content = store.read(folder + name)
 
-                if place in ['Vienna,', 'Wien,']:
-                    place = 'Austria'
+    if raw:
+        info = beer_info_bytes(content)
+    else:
+        # Unescape the HTML characters
+        info = beer_info(decode(content))
 
-                if place == 'flanders,':
-                    place = 'Belgium'
+    return name, content, info
 
-                if place in ['Mostar,', 'Sarajevo,']:
-                    place = 'Bosnia and Herzegovina'
 
-                if place == 'Sofia,':
-                    place = 'Bulgaria'
+def _parse_beer_reviews(row, records, failures, files=None, first=None, users=None):
+    """
+    Parse all the pages of one beer.
+
+    :param row: dict with the columns of beers.csv for this beer
+    :param records: list where the records of the reviews are added
+    :param failures: dict where the fields not found are counted (and the reviews skipped with 'skipped')
+    :param files: names of the files in the folder of the beer (default: list the folder)
+    :param first: tuple with the name and the bytes of a page already read
+    :param users: dict where the reviews written are added to the aggregates of their user (see _add_user)
+    :return: the number of reviews, the number of bytes read and the number of pages (None if the beer has no rating)
+    """
 
-                if place in ['campinas,', 'santa branca,']:
-                    place = 'Brazil'
+    store = _reviews_store
 
-                if place in ['Alberta', 'Brandon,', 'British Columbia', 'Milton,', 'Montreal,', 'New Brunswick',
-                             'Ontario', 'Ottawa,', 'Quebec', 'Québec,', 'Toronto,', 'Victoria,', 'Waterloo,',
-                             'jonquiere,']:
-                    place = 'Canada'
+    nbytes = 0
+    count = 0
 
-                if place == 'valparaiso,':
-                    place = 'Chile'
+    # Check that this beer has at least 1 rating
+    if not row['nbr_ratings'] > 0:
+        return count, nbytes, None
 
-                if place == 'canton,':
-                    place = 'China'
+    folder = _reviews_data_folder + 'beers/{}/{}/'.format(row['brewery_id'], row['beer_id'])
 
-                if place == 'CROATIA,':
-                    place = 'Croatia'
+    if files is None:
+        files = store.listdir(folder)
 
-                if place == 'ostrava,':
-                    place = 'Czech Republic'
+    # Newest pages first, such that the newest version of a review is kept
+    list_ = beer_pages(files)
 
-                if place == 'copenhagen,':
-                    place = 'Denmark'
+    list_users = []
 
-                if place in ['Butt Burp Egypt,', 'Mount Sinai,']:
-                    place = 'Egypt'
+    # The pages of a beer are read together, except the one already read
+    if first is None:
+        pages = store.read_folder(folder, list_)
+    else:
+        pages = _insert_page(store.read_folder(folder, [name for name in list_ if name != first[0]]), list_, first)
 
-                if place in ['coventry,', 'Durham,', 'BROMLEY,', 'Banbury,', 'Bedford,', 'Berwick,', 'Bingley,',
-                             'Birmingham,', 'Brighton,', 'Bristol,', 'Byrness,', 'Cambridge,', 'Carlisle,', 'Chelsea,',
-                             'East Molesey,', 'Exeter,', 'Faversham,', 'Greater London', 'HAYWARDS HEATH,',
-                             'Hillsborough,', 'Houghton,', 'Kendal,', 'Lancaster,', 'Leicester,', 'Lockport,',
-                             'London,', 'Manchester,', 'Nottingham,', 'Oxford,', 'Plymouth,', 'Plynouth,',
-                             'Portsmouth,', 'PoultonLancashire,', 'Reading,', 'Solihull,', 'Southampton,', 'Stafford,',
-                             'Wells,', 'Westminster,', 'Woodley,', 'Worcester,', 'jarrow,', 'nottingham,',
-                             'summertown,', 'taunton,']:
-                    place = 'England'
+    for file, content in pages:
 
-                if place in ['Macon,', 'st germain en laye,']:
-                    place = 'France'
+        nbytes += len(content)
 
-                if place in ['Berlin,', 'Hadamar,', 'Marienwerder bei Bernau bei Berl,']:
-                    place = 'Germany'
+        # Search for all the elements (the \n, \r and \t characters are removed and the HTML characters are
+        # unescaped)
+        if _reviews_tokenizer:
+            if _reviews_raw:
+                grp = tokenize_reviews_bytes(content)
+            else:
+                grp = tokenize_reviews(decode(content).replace('\r', '').replace('\n', '').replace('\t', ''))
+        elif _reviews_raw:
+            grp = reviews_bytes(content)
+        else:
+            grp = reviews(decode(content))
 
-                if place == 'sepolia,':
-                    place = 'Greece'
+        for g in grp:
+            if None in g:
+                for k, value in enumerate(g):
+                    if value is None:
+                        failures[REVIEW_FIELDS[k]] = failures.get(REVIEW_FIELDS[k], 0) + 1
 
-                if place in ['Pearl,', 'hawaii,']:
-                    place = 'Hawaii'
+                if any(g[k] is None for k in REVIEW_WRITTEN):
+                    failures['skipped'] = failures.get('skipped', 0) + 1
+                    continue
 
-                if place in ['Budapest,', 'Budaörs,', 'Dunakeszi,', 'Esztergom,', 'Fót,', 'Hajdúnánás,']:
-                    place = 'Hungary'
+            rating = float(g[0])
 
-                if place == 'Dublin,':
-                    place = 'Ireland'
+            appearance = int(g[2])
+            aroma = int(g[1])
+            palate = int(g[4])
+            taste = int(g[3])
+            overall = int(g[5])
 
-                if place in ['Italia,', 'Venice,', 'roma,']:
-                    place = 'Italy'
+            user_name = g[8]
+            user_id = int(g[7])
 
-                if place == 'KENYA,':
-                    place = 'Kenya'
+            text = g[12]
 
-                if place == 'Lebanon,':
-                    place = 'Lebanon'
+            try:
+                str_date, text = review_date_text(g[11], text)
+
+                date = _reviews_dates(str_date)
+            except (AttributeError, IndexError, ValueError):
+                # The date cannot be read: the review is skipped, an older version of it can still be kept
+                failures['date'] = failures.get('date', 0) + 1
+                failures['skipped'] = failures.get('skipped', 0) + 1
+                continue
+
+            # Name as read back from ratings.txt.gz (the values are stripped when they are parsed)
+            user_key = user_name.rstrip()
+            if user_key in list_users:
+                add_rev = False
+            else:
+                list_users.append(user_key)
+                add_rev = True
+
+            # Clean the text
+            text = re.sub('<[^>]+>', '', text)
+
+            if add_rev:
+                count += 1
+
+                # Write to file
+                records.append('beer_name: {}\n'.format(row['beer_name']))
+                records.append('beer_id: {:d}\n'.format(row['beer_id']))
+                records.append('brewery_name: {}\n'.format(row['brewery_name']))
+                records.append('brewery_id: {:d}\n'.format(row['brewery_id']))
+                records.append('style: {}\n'.format(row['style']))
+                records.append('abv: {}\n'.format(row['abv']))
+                records.append('date: {:d}\n'.format(date))
+                records.append('user_name: {}\n'.format(user_name))
+                records.append('user_id: {:d}\n'.format(user_id))
+                records.append('appearance: {:d}\n'.format(appearance))
+                records.append('aroma: {:d}\n'.format(aroma))
+                records.append('palate: {:d}\n'.format(palate))
+                records.append('taste: {:d}\n'.format(taste))
+                records.append('overall: {:d}\n'.format(overall))
+                records.append('rating: {:.2f}\n'.format(rating))
+                records.append('text: {}\n'.format(text))
+                records.append('\n')
+
+                if users is not None:
+                    # Same rating as written in the record
+                    _add_user(users, user_key, user_id, date, round(rating, 2))
+
+    return count, nbytes, len(list_)
+
+
+def _add_user(users, user_name, user_id, date, rating):
+    """
+    Add a rating to the aggregates of its user. The ratings are summed in hundredths, such that the sum is exact.
+
+    :param users: dict user_name -> [user_id, number of ratings, first date, last date, sum of the ratings x 100], in
+                  the order of the first rating of each user
+    :param user_name: name of the user
+    :param user_id: ID of the user (the first one is kept)
+    :param date: date of the rating (epoch)
+    :param rating: rating (2 decimals)
+    """
 
-                if place == 'La Paz,':
-                    place = 'Mexico'
+    cents = int(round(rating*100))
 
-                if place in ['Breda,', 'Holland,', 'leiden,']:
-                    place = 'Netherlands'
+    if user_name in users:
+        user = users[user_name]
+        user[1] += 1
+        user[2] = min(user[2], date)
+        user[3] = max(user[3], date)
+        user[4] += cents
+    else:
+        users[user_name] = [user_id, 1, date, date, cents]
 
-                if place == 'Bergen,':
-                    place = 'Norway'
 
-                if place == 'Palestine/West Bank':
-                    place = 'Palestine'
+def _merge_users(users, batch):
+    """
+    Add the aggregates of the users of a batch to the aggregates of the ratings before it.
 
-                if place in ['D±browa Górnicza,', 'Mysłowice,', 'UPPER SILESIA,', 'Wrocław,', 'poznan,']:
-                    place = 'Poland'
+    :param users: aggregates of the users (see _add_user)
+    :param batch: aggregates of the users of the next batch
+    """
 
-                if place == 'Fatima,':
-                    place = 'Portugal'
+    for user_name, (user_id, nbr, first, last, cents) in batch.items():
+        if user_name in users:
+            user = users[user_name]
+            user[1] += nbr
+            user[2] = min(user[2], first)
+            user[3] = max(user[3], last)
+            user[4] += cents
+        else:
+            users[user_name] = [user_id, nbr, first, last, cents]
 
-                if place in ['Black Earth,', 'Moscow,', 'SAINT PETERSBURG,', 'Saint-Petersburg,']:
-                    place = 'Russia'
 
-                if place == 'St Helena':
-                    place = 'Saint Helena'
+def _users_of_block(users, block):
+    """
+    Add the ratings of records of ratings.txt.gz to the aggregates of their users.
 
-                if place in ['Aberdeen,', 'Edinburgh,', 'Glasgow,', 'Midlothian,', 'Motherwell,']:
-                    place = 'Scotland'
+    :param users: aggregates of the users (see _add_user)
+    :param block: bytes of complete records
+    """
 
-                if place == 'Belgrade,':
-                    place = 'Serbia'
+    columns = parse_columns(block, USER_FIELDS)
 
-                if place in ['Pova\x9eská Bystrica,', 'Trnava,']:
-                    place = 'Slovakia'
+    for values in zip(*[columns[field] for field in USER_FIELDS]):
+        _add_user(users, *values)
 
-                if place in ['Compostela (Galiza),', 'BARCELONA,', 'Badalona,', 'Barcelona,', 'Bilbao,', 'CATALONIA,',
-                             'Catalunya,', 'Figueres,', 'Galicia,', 'Galiza,', 'Getxo (Basque Country),', 'Gijón,',
-                             'Girona,', 'Manresa,', 'Sabadell,', 'Sant Cugat,', 'Sant Julià de Vilatorta,',
-                             'Sant Quirze De Besora,', 'barcelona,', 'spain,', 'toledo,']:
-                    place = 'Spain'
 
-                if place in ['Ljungbyholm,', 'Malmö,', 'Nossebro,', 'Stockholm,', 'Vallentuna,', 'Örebro,']:
-                    place = 'Sweden'
+def _beer_key(row):
+    """
+    Key of a beer in the manifest: '{brewery_id}/{beer_id}'
+    """
 
-                if place == 'pully,':
-                    place = 'Switzerland'
+    return '{}/{}'.format(row['brewery_id'], row['beer_id'])
 
-                if place in ['CARDIFF,', 'Cardiff,']:
-                    place = 'Wales'
 
-                if place in ['APO AE,', 'APO,', 'Anytown,', 'Arcadia,', 'Bartlett,', 'Belgrade / Hamburg,', 'Benton,',
-                             'Bled/SF,', 'Capital City,', 'Coolest place on EArth,', 'Cranford,', 'Echo,', 'FPO AP,',
-                             'Graveyard,', 'Gùrny Slùnsk / Oberschlesien,', 'Hook,', 'K,', 'Keystone,',
-                             'Marijuanaville,', 'Mendota,', 'Moab,', 'Monroe,', 'Mutriku/Rio Gallegos,',
-                             'New England,', 'Operation Joint Forge,', 'Sa,', 'Savage,', 'Sittingbourne / Bydgoszcz,',
-                             'The Sea,', 'USA,', 'United Kingdom,', 'Val Verde,', 'WY & Chicagoland,', 'anywhere usa,',
-                             'beanercentral,', 'bibilau,', 'http://westchesterbeer.com,', 'imperial,', 'mtn home afb,',
-                             'n/a', 'pampa,']:
-                    place = np.nan
+def _beer_extra(row):
+    """
+    Values of beers.csv written with the reviews of a beer (and if its pages are read), for the manifest
+    """
 
-                # Change to conventional name
-                if place in self.country_to_change.keys():
-                    place = self.country_to_change[place]
+    extra = [str(row[column]) for column in ['beer_name', 'brewery_name', 'style', 'abv']]
 
-            except (AttributeError, IndexError):
-                place = np.nan
+    return extra + [bool(row['nbr_ratings'] > 0)]
 
-            location.append(place)
 
-        df.loc[:, 'joined'] = joined
-        df.loc[:, 'location'] = location
+def _read_reviews(filename):
+    """
+    Read the records of ratings.txt.gz.
 
-        # Save the CSV again
-        df.to_csv(self.data_folder + 'parsed/users.csv', index=False)
+    :param filename: name of the file
+    :return: generator of (key of the beer, bytes of the record with the empty line at the end)
+    """
+
+    with gzip.open(filename, 'rb') as f:
+        lines = []
+        ids = {}
+        for line in f:
+            if line == b'\n':
+                lines.append(line)
+                yield '{}/{}'.format(ids[b'brewery_id'], ids[b'beer_id']), b''.join(lines)
+                lines = []
+                ids = {}
+            else:
+                if len(ids) < 2:
+                    name, _, value = line.partition(b': ')
+                    if name in [b'beer_id', b'brewery_id'] and name not in ids:
+                        ids[name] = int(value)
+                lines.append(line)
+
+
+def _copy_reviews(records, key, count):
+    """
+    Copy the records of a beer from the last ratings.txt.gz. The records of the beers before it are skipped.
+
+    :param records: generator given by _read_reviews
+    :param key: key of the beer
+    :param count: number of records of the beer
+    :return: bytes of the records
+    """
+
+    block = []
+    if count == 0:
+        return b''
+
+    for record_key, record in records:
+        if record_key == key:
+            block.append(record)
+            if len(block) == count:
+                return b''.join(block)
+        elif len(block) > 0:
+            break
+
+    raise IOError('The reviews of the beer {} are not in the last ratings.txt.gz'.format(key))
+
+
+def _insert_page(pages, names, page):
+    """
+    Insert a page already read among the pages read from the storage.
+
+    :param pages: generator of (name, bytes) for the names except the one of page
+    :param names: names of all the pages, in order
+    :param page: tuple with the name and the bytes of the page already read
+    :return: generator of (name, bytes of the page), in the order of names
+    """
+
+    for name in names:
+        if name == page[0]:
+            yield page
+        else:
+            yield next(pages)
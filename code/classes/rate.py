@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from email.utils import parsedate_to_datetime
+from collections import deque
+import time
+
+
+class AIMDController:
+    """
+    Adapt the rate of requests to the behaviour of the server (Additive Increase, Multiplicative Decrease)
+    """
+
+    def __init__(self, rate, min_rate=0.2, max_rate=None, increase=0.05, decrease=0.5, latency_factor=2.0,
+                 max_error_rate=0.1, window=50):
+        """
+        Initialize the controller.
+
+        :param rate: Starting number of requests per second
+        :param min_rate: The rate never goes below this value
+        :param max_rate: The rate never goes above this value (default: 4 times the starting rate)
+        :param increase: Increase of the rate per second while the server is healthy
+        :param decrease: Factor applied to the rate when the server is throttling or struggling
+        :param latency_factor: The server is struggling if the latency goes above this factor times the usual one
+        :param max_error_rate: The server is struggling if the fraction of errors goes above this value
+        :param window: Number of responses used to compute the error rate
+        """
+
+        self.rate = rate
+        self.min_rate = min_rate
+        if max_rate is None:
+            self.max_rate = 4*rate
+        else:
+            self.max_rate = max_rate
+
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.max_error_rate = max_error_rate
+
+        self.errors = deque(maxlen=window)
+
+        # Smoothed latency and the usual latency of the server
+        self.latency = None
+        self.baseline = None
+
+        # Time of the last decrease. We do not decrease twice for the requests which were already in flight.
+        self.last_decrease = 0.0
+
+        # Do not send any request before this time
+        self.pause_until = 0.0
+
+    def update(self, latency, status, retry_after=None):
+        """
+        Update the rate with the response of one request.
+
+        :param latency: Time in seconds to get the response
+        :param status: HTTP status code (None if the request failed without response)
+        :param retry_after: Value of the header Retry-After, if any
+        :return: the new rate
+        """
+
+        now = time.monotonic()
+
+        error = status is None or status >= 500 or status == 429
+        self.errors.append(error)
+
+        # Smoothed latency
+        if self.latency is None:
+            self.latency = latency
+            self.baseline = latency
+        else:
+            self.latency += 0.1*(latency - self.latency)
+            # The usual latency follows the lowest values and slowly drifts up
+            self.baseline = min(self.latency, self.baseline + 0.001*(self.latency - self.baseline))
+
+        wait = self._retry_after(retry_after)
+        if wait is not None:
+            self.pause_until = max(self.pause_until, now + wait)
+
+        throttled = status == 429 or status == 503 or wait is not None
+        # Small variations of a very short latency are not a signal
+        slow = self.latency > max(self.latency_factor*self.baseline, self.baseline + 0.1)
+        failing = len(self.errors) >= 10 and sum(self.errors)/len(self.errors) > self.max_error_rate
+
+        if throttled or slow or failing:
+            # At most one decrease per period of the current rate
+            if now - self.last_decrease > max(1.0, 1.0/self.rate):
+                self.rate = max(self.min_rate, self.rate*self.decrease)
+                self.last_decrease = now
+                # The fraction of errors has to be measured again at the new rate
+                self.errors.clear()
+        elif not error:
+            # Each healthy response adds increase/rate, i.e. the rate grows by increase every second
+            self.rate = min(self.max_rate, self.rate + self.increase/self.rate)
+
+        return self.rate
+
+    @staticmethod
+    def _retry_after(value):
+        """
+        Transform the header Retry-After in a number of seconds.
+        """
+
+        if value is None:
+            return None
+
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
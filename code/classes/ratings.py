@@ -0,0 +1,200 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       Fast reader of ratings.txt.gz. The file is decompressed in large blocks,     ##
+##      the records are cut on the bytes and only the fields asked for are decoded    ##
+##      and converted to their type.                                                  ##
+##                                                                                    ##
+########################################################################################
+
+import gzip
+
+# Fields of a rating, in the order of ratings.txt.gz, with their type (see the README)
+FIELDS = ['beer_name', 'beer_id', 'brewery_name', 'brewery_id', 'style', 'abv', 'date', 'user_name', 'user_id',
+          'appearance', 'aroma', 'palate', 'taste', 'overall', 'rating', 'text']
+
+TYPES = {'beer_name': str, 'beer_id': int, 'brewery_name': str, 'brewery_id': int, 'style': str, 'abv': float,
+         'date': int, 'user_name': str, 'user_id': int, 'appearance': int, 'aroma': int, 'palate': int, 'taste': int,
+         'overall': int, 'rating': float, 'text': str}
+
+# Number of lines of a record: one per field and the empty line at the end
+LINES = len(FIELDS) + 1
+
+
+def read_chunks(filename, fields=None, size=2**24):
+    """
+    Read ratings.txt.gz by chunks of ratings.
+
+    The values are the same as with helpers.parse, converted to the types of TYPES. The text values are stripped
+    like the lines in parse.
+
+    :param filename: name of the file
+    :param fields: list of the fields to read (default: all of them)
+    :param size: number of bytes decompressed at once
+    :return: generator of dict with a list of values for each field (the same number of ratings in each list)
+    """
+
+    if fields is None:
+        fields = FIELDS
+
+    for field in fields:
+        if field not in TYPES:
+            raise ValueError('Unknown field {} in ratings.txt.gz'.format(field))
+
+    with gzip.open(filename, 'rb') as f:
+        rest = b''
+        while True:
+            block = f.read(size)
+
+            if len(block) == 0:
+                # Like parse, a record without the empty line at the end is not given
+                return
+
+            block = rest + block
+
+            # The records end with an empty line
+            end = block.rfind(b'\n\n')
+            if end == -1:
+                rest = block
+                continue
+
+            rest = block[end + 2:]
+            yield _records(block[:end + 2], fields)
+
+
+def read_ratings(filename, fields=None, size=2**24):
+    """
+    Read ratings.txt.gz rating by rating.
+
+    :param filename: name of the file
+    :param fields: list of the fields to read (default: all of them)
+    :param size: number of bytes decompressed at once
+    :return: generator of dict with the value of each field
+    """
+
+    if fields is None:
+        fields = FIELDS
+
+    for chunk in read_chunks(filename, fields, size):
+        for values in zip(*[chunk[field] for field in fields]):
+            yield dict(zip(fields, values))
+
+
+def parse_block(block, fields=None):
+    """
+    Cut bytes of complete records of ratings.txt.gz into ratings.
+
+    :param block: bytes of the records, each one ending with an empty line
+    :param fields: list of the fields to read (default: all of them)
+    :return: list of dict with the value of each field
+    """
+
+    if fields is None:
+        fields = FIELDS
+
+    columns = parse_columns(block, fields)
+
+    return [dict(zip(fields, values)) for values in zip(*[columns[field] for field in fields])]
+
+
+def parse_columns(block, fields=None):
+    """
+    Cut bytes of complete records of ratings.txt.gz into columns, like the chunks of read_chunks.
+
+    :param block: bytes of the records, each one ending with an empty line
+    :param fields: list of the fields to read (default: all of them)
+    :return: dict with a list of values for each field
+    """
+
+    if fields is None:
+        fields = FIELDS
+
+    if len(block) == 0:
+        return {field: [] for field in fields}
+
+    return _records(block, fields)
+
+
+def _records(block, fields):
+    """
+    Cut a block of complete records into columns.
+
+    :param block: bytes of the records, ending with an empty line
+    :param fields: fields to read
+    :return: dict with a list of values for each field
+    """
+
+    lines = block.split(b'\n')
+    # The block ends with '\n\n': the last two lines are empty
+    lines.pop()
+
+    nbr = len(lines)//LINES
+
+    # Each record written by the Parser has one line per field in the order of FIELDS
+    if len(lines) == nbr*LINES and lines[LINES - 1::LINES].count(b'') == nbr:
+        columns = {}
+        for field in fields:
+            k = FIELDS.index(field)
+            values = lines[k::LINES]
+
+            prefix = field.encode('utf-8') + b': '
+            if not all(value.startswith(prefix) for value in values):
+                return _records_slow(lines, fields)
+
+            columns[field] = _convert(values, len(prefix), TYPES[field])
+
+        return columns
+
+    return _records_slow(lines, fields)
+
+
+def _convert(values, start, type_):
+    """
+    Convert the values of a field.
+
+    :param values: lines of the field (bytes)
+    :param start: position of the value in the lines
+    :param type_: str, int or float
+    :return: list of values
+    """
+
+    if type_ is str:
+        # Same as the strip of the whole line in parse
+        return [value[start:].decode('utf-8').rstrip() for value in values]
+    else:
+        # int and float also read bytes
+        return [type_(value[start:]) for value in values]
+
+
+def _records_slow(lines, fields):
+    """
+    Cut lines into records like parse, for the files whose records do not have one line per field.
+
+    :param lines: lines of complete records (bytes)
+    :param fields: fields to read
+    :return: dict with a list of values for each field
+    """
+
+    columns = {field: [] for field in fields}
+
+    entry = {}
+    for line in lines:
+        line = line.decode('utf-8').strip()
+
+        colon_pos = line.find(':')
+        if colon_pos == -1:
+            if len(entry) > 0:
+                for field in fields:
+                    columns[field].append(TYPES[field](entry[field]))
+            entry = {}
+            continue
+
+        entry[line[:colon_pos]] = line[colon_pos + 2:]
+
+    return columns
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+import requests
+import random
+
+
+class RetryPolicy:
+    """
+    Decide if a request has to be retried and how long to wait before retrying it
+    """
+
+    OK = 'ok'
+    RETRY = 'retry'
+    FATAL = 'fatal'
+
+    # Status codes for which the same request can succeed later
+    retryable_codes = [408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524]
+
+    # Exceptions for which the same request can succeed later
+    retryable_errors = (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+    def __init__(self, max_attempts=5, base=1.0, cap=60.0):
+        """
+        Initialize the policy.
+
+        :param max_attempts: Maximum number of requests for one page
+        :param base: Base of the exponential backoff in seconds
+        :param cap: Maximum time in seconds between two attempts
+        """
+
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+
+    def classify(self, r=None, error=None):
+        """
+        Classify the result of a request.
+
+        :param r: the request, if there was a response
+        :param error: the exception, if there was no response
+        :return: RetryPolicy.OK, RetryPolicy.RETRY or RetryPolicy.FATAL, and a description of the error
+        """
+
+        if error is not None:
+            if isinstance(error, self.retryable_errors):
+                return self.RETRY, repr(error)
+            else:
+                return self.FATAL, repr(error)
+
+        if r.status_code == 200:
+            if len(r.content) == 0:
+                return self.RETRY, 'Empty page'
+            else:
+                return self.OK, None
+
+        if r.status_code in self.retryable_codes:
+            return self.RETRY, 'HTTP {:d}'.format(r.status_code)
+        else:
+            return self.FATAL, 'HTTP {:d}'.format(r.status_code)
+
+    def backoff(self, attempt):
+        """
+        Time to wait before the next attempt. Exponential backoff with full jitter.
+
+        :param attempt: Number of attempts already done
+        :return: time in seconds
+        """
+
+        return random.uniform(0, min(self.cap, self.base*2**attempt))
@@ -0,0 +1,168 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from classes.helpers import round_
+import datetime
+
+
+class Scheduler:
+    """
+    Order the beers to crawl and estimate the number of requests and the time needed to crawl them
+    """
+
+    # Order of beers.csv
+    FILE = 'file'
+    # Beers with the most ratings first
+    VALUE = 'value'
+    # Beers never crawled first, then the ones crawled the longest time ago
+    FRESH = 'fresh'
+    # One beer of each brewery, then the second beer of each brewery, etc.
+    ROUND_ROBIN = 'round_robin'
+
+    policies = [FILE, VALUE, FRESH, ROUND_ROBIN]
+
+    def __init__(self, policy=FILE):
+        """
+        Initialize the scheduler.
+
+        :param policy: Scheduler.FILE, Scheduler.VALUE, Scheduler.FRESH or Scheduler.ROUND_ROBIN
+        """
+
+        if policy not in self.policies:
+            raise ValueError('Unknown policy {}, it must be one of {}'.format(policy, ', '.join(self.policies)))
+
+        self.policy = policy
+
+    @staticmethod
+    def cost(nbr_ratings, step=10):
+        """
+        Number of requests for one beer: 1 request for the first page plus 1 request for each step ratings after
+        the first one.
+
+        :param nbr_ratings: number of ratings of the beer (None or negative if unknown)
+        :param step: number of ratings per page
+        :return: number of requests (None if unknown)
+        """
+
+        if nbr_ratings is None or nbr_ratings != nbr_ratings or nbr_ratings < 0:
+            return None
+
+        return 1 + int(max(round_(nbr_ratings - 1, step), 0))//step
+
+    def plan(self, items):
+        """
+        Give a priority to each beer following the policy. The first beer to crawl has the highest priority.
+
+        :param items: list of dict with the brewery_id, the beer_id, the nbr_ratings (None if unknown) and the
+                      last_fetch (time of the last crawl of the beer, None if never crawled)
+        :return: the same list in the order of the crawl, with a priority added to each dict
+        """
+
+        if self.policy == self.VALUE:
+            # The beers with an unknown number of ratings go after the known ones
+            def key(item):
+                nbr = item['nbr_ratings']
+                if nbr is None or nbr != nbr:
+                    return 1, 0
+                return 0, -nbr
+
+            order = sorted(items, key=key)
+        elif self.policy == self.FRESH:
+            def key(item):
+                if item['last_fetch'] is None:
+                    return 0, 0
+                return 1, item['last_fetch']
+
+            order = sorted(items, key=key)
+        elif self.policy == self.ROUND_ROBIN:
+            # Rank of each beer inside its brewery
+            ranks = {}
+            rank = []
+            for item in items:
+                ranks[item['brewery_id']] = ranks.get(item['brewery_id'], -1) + 1
+                rank.append(ranks[item['brewery_id']])
+
+            order = [item for _, _, item in sorted(zip(rank, range(len(items)), items), key=lambda x: x[:2])]
+        else:
+            order = list(items)
+
+        # sorted is stable, therefore the ties stay in the order of the file
+        for idx, item in enumerate(order):
+            if self.policy == self.FILE:
+                item['priority'] = 0
+            else:
+                item['priority'] = len(order) - idx
+
+        return order
+
+    def projection(self, items, rate, concurrency=1, latency=None, duration=None):
+        """
+        Estimate the number of requests and the time needed to crawl the beers.
+
+        :param items: list of dict given by plan, in the order of the crawl. If a dict has a cost, it is used
+                      instead of the cost given by the number of ratings.
+        :param rate: number of requests per second
+        :param concurrency: number of requests in flight at the same time
+        :param latency: usual time in seconds to get a response (None if unknown)
+        :param duration: time window in seconds for the crawl (None if there is no limit)
+        :return: dict with the number of beers, the number of beers with a known cost, the number of requests, the
+                 number of requests per second, the duration in seconds and the number of beers crawled in the
+                 time window
+        """
+
+        costs = [item['cost'] if 'cost' in item else self.cost(item['nbr_ratings']) for item in items]
+        known = [c for c in costs if c is not None]
+
+        # The beers with an unknown number of ratings cost as much as the average beer
+        if len(known) > 0:
+            default_cost = sum(known)/len(known)
+        else:
+            default_cost = 1.0
+
+        costs = [default_cost if c is None else c for c in costs]
+        requests = sum(costs)
+
+        # The crawl cannot go faster than the requests in flight allow
+        if latency is not None and latency > 0:
+            rate = min(rate, concurrency/latency)
+
+        if duration is None:
+            fit = len(items)
+        else:
+            budget = duration*rate
+            fit = 0
+            total = 0
+            for c in costs:
+                total += c
+                if total > budget:
+                    break
+                fit += 1
+
+        return {'beers': len(items),
+                'known': len(known),
+                'requests': int(round(requests)),
+                'rate': rate,
+                'duration': requests/rate,
+                'fit': fit}
+
+    @staticmethod
+    def format(proj):
+        """
+        Transform a projection into a text
+
+        :param proj: dict given by projection
+        :return: string
+        """
+
+        txt = '{:d} beers ({:d} with a known number of ratings), {:d} requests at {:.2f} requests/s, ' \
+              'duration {}'.format(proj['beers'], proj['known'], proj['requests'], proj['rate'],
+                                   datetime.timedelta(seconds=int(proj['duration'])))
+
+        if proj['fit'] < proj['beers']:
+            txt += ', {:d} beers in the time window'.format(proj['fit'])
+
+        return txt
@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##       GZIP file written as committed segments with checkpoints. A step which       ##
+##      crashes starts again from its last checkpoint and the segments are joined     ##
+##      into the final file at the end.                                               ##
+##                                                                                    ##
+########################################################################################
+
+from classes.helpers import write_atomic
+import shutil
+import json
+import gzip
+import os
+
+
+class SegmentedFile:
+    """
+    GZIP file written in {filename}.parts/ as segments. Each segment is a complete GZIP file, renamed
+    to its final name once it is closed. A checkpoint (checkpoint.json) gives the committed segments and the state of
+    the step after the last of them. Concatenated GZIP files are a valid GZIP file: the segments are simply joined at
+    the end, without compressing them again.
+
+    The checkpoint is only used by a run with the same plan (e.g. the same list of beers), otherwise the segments are
+    deleted and the file is written from the beginning.
+    """
+
+    def __init__(self, filename, plan, compressed=False):
+        """
+        Open the segments of a file and load the checkpoint.
+
+        :param filename: name of the final GZIP file
+        :param plan: string identifying the work of the step (e.g. a hash of the list of beers)
+        :param compressed: True if the blocks are written already compressed as GZIP members
+        """
+
+        self.filename = filename
+        self.folder = filename + '.parts/'
+        self.plan = plan
+        self.compressed = compressed
+
+        # Segment being written
+        self.output = None
+
+        self.segments = []
+        # State of the step saved with the last segment
+        self.state = None
+
+        checkpoint = self.folder + 'checkpoint.json'
+        if os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                data = json.load(f)
+
+            if data['plan'] == plan and all(os.path.exists(self.folder + name) for name in data['segments']):
+                self.segments = data['segments']
+                self.state = data['state']
+
+        if self.state is None and os.path.exists(self.folder):
+            # Segments of another run
+            shutil.rmtree(self.folder)
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def write(self, block):
+        """
+        Write a block in the current segment.
+
+        :param block: bytes (a GZIP member if compressed)
+        """
+
+        if self.output is None:
+            name = self.folder + 'segment_{:05d}.gz.tmp'.format(len(self.segments))
+            if self.compressed:
+                self.output = open(name, 'wb')
+            else:
+                self.output = gzip.open(name, 'wb')
+
+        self.output.write(block)
+
+    def checkpoint(self, state):
+        """
+        Commit the current segment and save the state of the step after it.
+
+        :param state: JSON serializable state of the step
+        """
+
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+            name = 'segment_{:05d}.gz'.format(len(self.segments))
+            os.replace(self.folder + name + '.tmp', self.folder + name)
+            self.segments.append(name)
+
+        self.state = state
+
+        content = json.dumps({'plan': self.plan, 'segments': self.segments, 'state': state})
+        write_atomic(self.folder + 'checkpoint.json', content.encode('utf-8'))
+
+    def finish(self, state, trailer=b''):
+        """
+        Commit the last segment, join the segments into the final file and delete them.
+
+        :param state: JSON serializable state of the step at the end
+        :param trailer: GZIP members written at the end of the file (e.g. an index of its blocks)
+        """
+
+        self.checkpoint(state)
+
+        with open(self.filename + '.tmp', 'wb') as output:
+            if len(self.segments) == 0 and len(trailer) == 0:
+                output.write(gzip.compress(b''))
+
+            for name in self.segments:
+                with open(self.folder + name, 'rb') as segment:
+                    shutil.copyfileobj(segment, output, 2**20)
+
+            output.write(trailer)
+
+        os.replace(self.filename + '.tmp', self.filename)
+
+        shutil.rmtree(self.folder)
+
+    def close(self):
+        """
+        Close the current segment without committing it (it is written again by the next run).
+        """
+
+        if self.output is not None:
+            self.output.close()
+            self.output = None
@@ -0,0 +1,474 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+########################################################################################
+##                                                                                    ##
+##      Offline stand-in for RateBeer. It serves the same URLs as the website from    ##
+##     a synthetic or a recorded corpus, with configurable latency and errors, such   ##
+##              that the crawler can be benchmarked without RateBeer.                 ##
+##                                                                                    ##
+########################################################################################
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import datetime
+import random
+import gzip
+import time
+import re
+import os
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+US_STATES = ['Alabama', 'Alaska', 'Arizona', 'California', 'Colorado', 'Oregon']
+
+# Sentences added to the text of the reviews
+FILLER = ['Nice head, off-white &amp; creamy, good retention.', 'Aroma of caramel, toffee and some dark fruits.',
+          'The taste is sweet at first, then a bitter finish.<br />', 'Medium body, soft carbonation.',
+          'Would buy again - a solid beer for the price (33cl bottle).', '&quot;Hoppy&quot; says the label, I agree.']
+
+
+class SyntheticCorpus:
+    """
+    Corpus of pages generated on the fly. All the pages are deterministic for a given seed.
+    """
+
+    def __init__(self, nbr_countries=3, breweries_per_place=5, beers_per_brewery=10, max_ratings=200, nbr_users=500,
+                 chrome=30000, seed=0, growth=0.0, text_length=0):
+        """
+        Initialize the corpus.
+
+        :param nbr_countries: Number of countries (the United States with some states are added)
+        :param breweries_per_place: Number of breweries in each country or state
+        :param beers_per_brewery: Number of beers for each brewery (at most 100)
+        :param max_ratings: Maximum number of ratings for one beer
+        :param nbr_users: Number of users
+        :param chrome: Number of bytes of scripts and navigation added to each page, as on the website
+        :param seed: Seed of the random generator
+        :param growth: New ratings added on top of the existing ones, as a fraction of them. It can be changed
+                       while the server is running to test an incremental crawl.
+        :param text_length: Minimum number of characters of the text of the reviews (the reviews on the website have
+                            a few hundred characters)
+        """
+
+        self.breweries_per_place = breweries_per_place
+        self.beers_per_brewery = min(beers_per_brewery, 100)
+        self.max_ratings = max_ratings
+        self.nbr_users = nbr_users
+        self.seed = seed
+        self.growth = growth
+        self.text_length = text_length
+
+        # Places: (slug, region code, country code, name)
+        self.places = [('country{:d}'.format(k), 0, k, 'Country{:d}'.format(k)) for k in range(1, nbr_countries + 1)]
+        self.places += [(state.lower(), k + 1, 213, state) for k, state in enumerate(US_STATES[:2])]
+
+        self.place_index = {(p[1], p[2]): i for i, p in enumerate(self.places)}
+
+        line = '<script type="text/javascript">var navigation = {"menu": "beers, breweries, places"};</script>\n'
+        self.chrome = line*(chrome//len(line))
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                    Routing                                         ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    routes = [(re.compile('^/breweries/$'), 'places'),
+              (re.compile('^/breweries/[^/]+/(\d+)/(\d+)/$'), 'place'),
+              (re.compile('^/brewers/[^/]+/(\d+)/$'), 'brewery'),
+              (re.compile('^/beer/[^/]+/(\d+)/$'), 'beer'),
+              (re.compile('^/beer/[^/]+/(\d+)/1/(\d+)/$'), 'reviews'),
+              (re.compile('^/user/(\d+)/$'), 'user')]
+
+    def page(self, path):
+        """
+        Get the page for a path
+
+        :param path: path of the URL
+        :return: bytes of the page, None if it does not exist
+        """
+
+        for regex, kind in self.routes:
+            grp = regex.match(path)
+            if grp is not None:
+                body = getattr(self, '_' + kind)(*[int(g) for g in grp.groups()])
+                if body is None:
+                    return None
+                return self._wrap(body).encode('ISO-8859-1')
+
+        return None
+
+    def paths(self):
+        """
+        Generator of all the paths of the corpus.
+        """
+
+        yield '/breweries/'
+
+        for i, (slug, region, country, name) in enumerate(self.places):
+            yield '/breweries/{}/{:d}/{:d}/'.format(slug, region, country)
+
+            for brewery_id in self._breweries(i):
+                yield '/brewers/brewery-{:d}/{:d}/'.format(brewery_id, brewery_id)
+
+                for beer_id in self._beers(brewery_id):
+                    yield '/beer/beer-{:d}/{:d}/'.format(beer_id, beer_id)
+
+                    for idx in range(2, (self._nbr_ratings(beer_id) + 9)//10 + 1):
+                        yield '/beer/beer-{:d}/{:d}/1/{:d}/'.format(beer_id, beer_id, idx)
+
+        for user_id in range(1, self.nbr_users + 1):
+            yield '/user/{:d}/'.format(user_id)
+
+    def save(self, folder):
+        """
+        Write all the pages of the corpus in a folder, such that it can be served by a DirectoryCorpus.
+
+        :param folder: Folder for the pages
+        """
+
+        for path in self.paths():
+            file = os.path.join(folder, path.strip('/'), 'index.html')
+            if not os.path.exists(os.path.dirname(file)):
+                os.makedirs(os.path.dirname(file))
+
+            with open(file, 'wb') as output:
+                output.write(self.page(path))
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                     Pages                                          ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def _wrap(self, body):
+        return '<html><head><title>RateBeer</title>\n' + self.chrome + '</head><body>\n' + body + \
+               '\n' + self.chrome + '</body></html>'
+
+    def _places(self):
+        links = ['<a href="/breweries/{}/{:d}/{:d}/">{}</a>'.format(*p) for p in self.places]
+        # The first city is the end of the list of places
+        links.append('<a href="/breweries/chicago/0/213/">Chicago</a>')
+        return '\n'.join(links)
+
+    def _place(self, region, country):
+        if (region, country) not in self.place_index:
+            return None
+
+        i = self.place_index[(region, country)]
+        return '\n'.join('<A HREF="/brewers/brewery-{:d}/{:d}/"> Brewery {:d}</A><br>'.format(b, b, b)
+                         for b in self._breweries(i))
+
+    def _brewery(self, brewery_id):
+        if not 1 <= brewery_id <= len(self.places)*self.breweries_per_place:
+            return None
+
+        lines = []
+        for beer_id in self._beers(brewery_id):
+            rng = random.Random(self.seed*1000003 + beer_id)
+            style = rng.randrange(1, 20)
+            lines.append('<tr><td><strong><A HREF="/beer/beer-{:d}/{:d}/">Beer {:d}</A></strong> <span>&nbsp;</span>'
+                         '<a href="/beerstyles/style-{:d}/{:d}/">Style {:d}</a></td></tr>'.format(beer_id, beer_id,
+                                                                                                  beer_id, style,
+                                                                                                  style, style))
+        return '<table>\n' + '\n'.join(lines) + '\n</table>'
+
+    def _beer(self, beer_id):
+        nbr = self._nbr_ratings(beer_id)
+        if nbr is None:
+            return None
+
+        rng = random.Random(self.seed*1000003 + beer_id)
+        info = '<div>RATINGS: </abbr><big style="color: #777;"><b><span id="_ratingCount8" itemprop="ratingCount" ' \
+               'itemprop="reviewCount">{:d}</span></b></big></div>\n'.format(nbr)
+        info += '<div><abbr title="Alcohol By Volume">ABV</abbr>: <big style="color: #777;"><strong>{:.1f}%' \
+                '</strong></big></div>\n'.format(rng.uniform(3, 12))
+        if nbr > 0:
+            info += '<div>WEIGHTED AVG: <big style="color: #777;"><strong><span itemprop="ratingValue">{:.2f}' \
+                    '</span></strong></big></div>\n'.format(rng.uniform(2, 4.5))
+        if nbr >= 10:
+            info += '<div>overall</div><div class="ratingValue" itemprop="ratingValue">{:d}</div>\n'.format(
+                rng.randrange(1, 101))
+            info += '<div style="font-size: 25px; font-weight: bold; color: #fff; padding: 20px 0px; ">{:d}<br>' \
+                    '<div class="style-text">style</div></div>\n'.format(rng.randrange(1, 101))
+
+        return info + self._reviews(beer_id, 1)
+
+    def _reviews(self, beer_id, idx):
+        nbr = self._nbr_ratings(beer_id)
+        if nbr is None or idx < 1 or (idx - 1)*10 >= max(nbr, 1):
+            return None
+
+        first = self._first_ratings(beer_id)
+        users = random.Random(self.seed*1000003 + beer_id).sample(range(1, self.nbr_users + 1),
+                                                                 min(first, self.nbr_users))
+
+        # The new ratings are given by other users and come before the first ones
+        others = sorted(set(range(1, self.nbr_users + 1)) - set(users))
+        new = random.Random(self.seed*1000003 + beer_id + 1).sample(others, min(nbr - first, len(others)))
+        users = new + users
+
+        blocks = []
+        for pos in range((idx - 1)*10, min(idx*10, len(users))):
+            # The first ratings keep the same content, the new ones have a negative index
+            r = pos - len(new)
+            rng = random.Random((self.seed*1000003 + beer_id)*10007 + r)
+            aroma = rng.randrange(1, 11)
+            appearance = rng.randrange(1, 6)
+            taste = rng.randrange(1, 11)
+            palate = rng.randrange(1, 6)
+            overall = rng.randrange(1, 21)
+            rating = (aroma + appearance + taste + palate + overall)/10
+
+            # The most recent reviews are first
+            date = datetime.date(2017, 7, 31) - datetime.timedelta(days=3*r + rng.randrange(3))
+            str_date = '{} {:d}, {:d}'.format(MONTHS[date.month - 1], date.day, date.year)
+
+            text = 'Review of beer {:d} by user {:d}. Pours amber &amp; clear, malty and bitter.'.format(beer_id,
+                                                                                                       users[pos])
+            k = 0
+            while len(text) < self.text_length:
+                text += ' ' + FILLER[(users[pos] + k) % len(FILLER)]
+                k += 1
+
+            if rng.random() < 0.05:
+                text = '<small style="color: #666666">UPDATED: {}</i></small> {}'.format(str_date, text)
+
+            blocks.append('<div style="display:inline; padding: 0px 0px; font-size: 24px; font-weight: bold; '
+                          'color: #036;" title="{:.1f} out of 5.0<br /><small>Aroma {:d}/10<br />Appearance {:d}/5'
+                          '<br />Taste {:d}/10<br />Palate {:d}/5<br />Overall {:d}/20<br /></small>">{:.1f}</div>'
+                          '</div>\n<small style="color: #666666; font-size: 12px; font-weight: bold;">'
+                          '<A HREF="/user/{:d}/">user{:d}&nbsp;({:d})</A></I> -Somewhere- {}</small><BR>'
+                          '<div style="padding: 20px 10px 20px 0px; border-bottom: 1px solid #e0e0e0; '
+                          'line-height: 1.5;">{}</div><br>'.format(rating, aroma, appearance, taste, palate, overall,
+                                                                   rating, users[pos], users[pos],
+                                                                   rng.randrange(1, 1000), str_date, text))
+
+        return '\n'.join(blocks)
+
+    def _user(self, user_id):
+        if not 1 <= user_id <= self.nbr_users:
+            return None
+
+        rng = random.Random(self.seed*1000003 + 7*user_id)
+        if rng.random() < 0.5:
+            location = 'Springfield, ' + rng.choice(US_STATES)
+        else:
+            location = 'Town, Country{:d}'.format(rng.randrange(1, 4))
+
+        return '<div>Member since {} {:d} {:d}</div>\n' \
+               '<span class="glyphicon glyphicon-map-marker" aria-hidden="true"></span> {}\n'.format(
+                   rng.choice(MONTHS), rng.randrange(1, 29), rng.randrange(2000, 2017), location)
+
+    ########################################################################################
+    ##                                                                                    ##
+    ##                                   Structure                                        ##
+    ##                                                                                    ##
+    ########################################################################################
+
+    def _breweries(self, place):
+        start = place*self.breweries_per_place + 1
+        return range(start, start + self.breweries_per_place)
+
+    def _beers(self, brewery_id):
+        return range(brewery_id*100, brewery_id*100 + self.beers_per_brewery)
+
+    def _nbr_ratings(self, beer_id):
+        first = self._first_ratings(beer_id)
+        if first is None:
+            return None
+
+        return first + int(self.growth*first)
+
+    def _first_ratings(self, beer_id):
+        brewery_id = beer_id//100
+        if not 1 <= brewery_id <= len(self.places)*self.breweries_per_place or \
+                beer_id % 100 >= self.beers_per_brewery:
+            return None
+
+        # Few beers have many ratings
+        rng = random.Random(self.seed*1000003 + beer_id)
+        rng.random()
+        return int(self.max_ratings*rng.random()**3)
+
+
+class DirectoryCorpus:
+    """
+    Corpus of recorded pages. The page for the path /a/b/ is in the file a/b/index.html.
+    """
+
+    def __init__(self, folder):
+        """
+        Initialize the corpus.
+
+        :param folder: Folder with the pages
+        """
+
+        self.folder = folder
+
+    def page(self, path):
+        """
+        Get the page for a path
+
+        :param path: path of the URL
+        :return: bytes of the page, None if it does not exist
+        """
+
+        file = os.path.join(self.folder, path.strip('/'), 'index.html')
+        if '..' in path or not os.path.exists(file):
+            return None
+
+        return open(file, 'rb').read()
+
+
+class StandinServer:
+    """
+    HTTP server for a corpus with configurable latency and errors
+    """
+
+    def __init__(self, corpus, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, max_rate=None,
+                 empty_rate=0.0, compress=True, seed=0):
+        """
+        Initialize the server.
+
+        :param corpus: SyntheticCorpus or DirectoryCorpus
+        :param host: Host of the server
+        :param port: Port of the server (0 for any free port)
+        :param latency: Average time in seconds to answer a request
+        :param error_rate: Fraction of requests answered with an error 500 or 502
+        :param max_rate: Requests per second above which the server answers with an error 429 and a header
+                         Retry-After (default: no limit)
+        :param empty_rate: Fraction of requests answered with an empty page
+        :param compress: Compress the pages with gzip if the client accepts it
+        :param seed: Seed of the random generator for the latency and the errors
+        """
+
+        self.corpus = corpus
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.empty_rate = empty_rate
+        self.compress = compress
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+        # Token bucket for the throttling, with one second of burst
+        self.tokens = max_rate if max_rate is not None else 0.0
+        self.last = time.monotonic()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """
+        URL of the server, to give to the Crawler and the Parser
+        """
+
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{:d}'.format(host, port)
+
+    def start(self):
+        """
+        Start the server in a background thread.
+
+        :return: the URL of the server
+        """
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self):
+        """
+        Draw the latency and the kind of answer for one request.
+        """
+
+        with self.lock:
+            self.requests += 1
+            latency = self.rng.expovariate(1/self.latency) if self.latency > 0 else 0.0
+            x = self.rng.random()
+
+            throttle = False
+            if self.max_rate is not None:
+                now = time.monotonic()
+                self.tokens = min(self.max_rate, self.tokens + (now - self.last)*self.max_rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                else:
+                    throttle = True
+                    self.throttled += 1
+
+        if throttle:
+            answer = 'throttle'
+        elif x < self.error_rate:
+            answer = 'error'
+        elif x < self.error_rate + self.empty_rate:
+            answer = 'empty'
+        else:
+            answer = 'page'
+
+        return latency, answer
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                latency, answer = server._draw()
+                if latency > 0:
+                    time.sleep(latency)
+
+                # The crawler adds /1/{idx}/ to links ending with a slash
+                path = re.sub('/+', '/', self.path.split('?')[0])
+
+                if answer == 'throttle':
+                    self._send(429, b'Too Many Requests', {'Retry-After': '1'})
+                elif answer == 'error':
+                    self._send(server.rng.choice([500, 502]), b'Server Error')
+                elif answer == 'empty':
+                    self._send(200, b'')
+                else:
+                    body = server.corpus.page(path)
+                    if body is None:
+                        self._send(404, b'Not Found')
+                    else:
+                        self._send(200, body)
+
+            def _send(self, code, body, headers=None):
+                if server.compress and len(body) > 0 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body, 6)
+                    headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+
+                self.send_response(code)
+                self.send_header('Content-Type', 'text/html; charset=ISO-8859-1')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
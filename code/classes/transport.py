@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# coding=utf-8
+#
+# Copyright © 2017 Gael Lederrey <gael.lederrey@epfl.ch>
+#
+# Distributed under terms of the MIT license.
+
+from requests.adapters import HTTPAdapter
+import threading
+import requests
+
+
+class Transport:
+    """
+    HTTP transport with pooled keep-alive connections, timeouts and compressed transfer
+    """
+
+    def __init__(self, pool_size=10, timeout=(10, 60)):
+        """
+        Initialize the transport.
+
+        :param pool_size: Maximum number of connections kept open for each host
+        :param timeout: Tuple with the connect and the read timeouts in seconds
+        """
+
+        self.timeout = timeout
+
+        self.adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size, pool_block=True)
+
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+
+        # Counters
+        self.lock = threading.Lock()
+        self.nbr_requests = 0
+        self.bytes_wire = 0
+        self.bytes_content = 0
+
+    def get(self, url):
+        """
+        Get a page with one of the pooled connections.
+
+        :param url: url for the request
+        :return r: the request
+        """
+
+        r = self.session.get(url, timeout=self.timeout)
+
+        # Number of bytes received for the body, before decompression
+        try:
+            wire = r.raw.tell()
+        except (AttributeError, ValueError):
+            wire = int(r.headers.get('Content-Length', len(r.content)))
+
+        with self.lock:
+            self.nbr_requests += 1
+            self.bytes_wire += wire
+            self.bytes_content += len(r.content)
+
+        return r
+
+    def stats(self):
+        """
+        Counters of the transport
+
+        :return: dict with the number of requests, connections opened and reused, and bytes on the wire
+        """
+
+        pools = self.adapter.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in list(pools.keys()))
+
+        with self.lock:
+            return {'requests': self.nbr_requests,
+                    'connections_opened': connections,
+                    'connections_reused': max(self.nbr_requests - connections, 0),
+                    'bytes_wire': self.bytes_wire,
+                    'bytes_content': self.bytes_content}
+
+    def close(self):
+        """
+        Close all the connections.
+        """
+
+        self.session.close()
@@ -25,7 +25,8 @@ def run():
 
     # Initialize classes
     delta_t = 0.2
-    crawler = Crawler(delta_t, data_folder)
+    concurrency = 4
+    crawler = Crawler(delta_t, data_folder, concurrency=concurrency)
     parser = Parser(data_folder)
 
     print('1. Crawling all the places...')
@@ -41,14 +42,15 @@ def run():
     #parser.parse_brewery_files()
 
     print('5. Crawling all the beers and their reviews...')
-    #crawler.crawl_all_beers_and_reviews()
+    #crawler.crawl_all_beers_and_reviews(policy=Scheduler.VALUE)
 
     print('6. Parsing all the beer files to update the beers.csv file...')
     #parser.parse_beer_files_for_information()
 
     print('7. Parsing all the beer files to get the reviews...')
-    #parser.parse_beer_files_for_reviews()
+    #parser.parse_beer_files_for_reviews(processes=None)
 
+    # users.csv is already written by step 7
     print('8. Getting the users from the ratings...')
     #parser.get_users_from_ratings()
 
@@ -64,6 +66,13 @@ def run():
 
     print('Time to complete the crawling: {}'.format(elapsed))
 
+    stats = crawler.transport.stats()
+    print('Requests: {:d} (connections opened: {:d}, reused: {:d})'.format(stats['requests'],
+                                                                         stats['connections_opened'],
+                                                                         stats['connections_reused']))
+    print('Bytes on the wire: {:d} (uncompressed: {:d})'.format(stats['bytes_wire'], stats['bytes_content']))
+    print('Requests per second at the end: {:.2f}'.format(crawler.current_rate()))
+
 
 if __name__ == "__main__":
     run()